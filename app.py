@@ -1,15 +1,23 @@
 from fastapi import FastAPI, UploadFile, Form, Request, HTTPException, BackgroundTasks, File  # Added File
-from fastapi.responses import HTMLResponse, RedirectResponse
+from fastapi.responses import HTMLResponse, RedirectResponse, FileResponse, StreamingResponse, PlainTextResponse, Response
 from fastapi.templating import Jinja2Templates
+from starlette.concurrency import run_in_threadpool
+from starlette.requests import ClientDisconnect
 from pathlib import Path
+import asyncio
+import hashlib
+import re
 import shutil
+import time
 import os  # Import os for file operations
+import logging
 from folder_manager import (
     create_project_root,
     organize_photos,
     archive_files,
     archive_project_files,  # Ensure archive_project_files is imported
-    setup_folders  # Imported setup_folders
+    setup_folders,  # Imported setup_folders
+    stream_to_file,
 )
 from db_manager import (
     insert_project,
@@ -18,16 +26,42 @@ from db_manager import (
     get_all_projects,
     get_structures_by_project,
     get_structure_by_id,
-    get_files_by_structure,
     get_project_by_id,
     get_projects_with_sites_and_dates,
-    get_files_by_structure_and_date,
+    insert_upload_records,
+    get_structure_db_id,
+    get_files_with_metadata,
+    get_metadata_choices,
+    PHOTO_SORTS,
+    DATABASE_FILE,
+)
+from setup_db import setup_database
+from catalog import FileCatalog
+from jobs import JobQueue
+from job_events import job_event_stream
+from staging import stage_tree
+from blob_store import BlobStore
+from processing_runner import ProcessingRunner
+from profiling import ProfilingMiddleware, ProfileStore
+from ingest import Deduplicator, UPLOAD_FIELDS, upload_folder
+from resumable_uploads import ResumableUploads, UploadError, TUS_VERSION, parse_metadata
+from metadata import MetadataExtractor
+import file_serving
+import metrics
+import logs
+from thumbnails import ThumbnailCache, THUMB_SUFFIXES, WEBP_AVAILABLE, MEDIA_TYPES
+from config import (
+    CATALOG_POLL_SECONDS, TREE_PAGE_SIZE, TREE_MAX_PAGE_SIZE, STAGING_LINK_MODE, THUMB_WIDTHS,
+    TILES_DIR, TILE_CACHE_CONTROL, PROFILE_SLOW_MS, UPLOAD_CHUNK_SIZE, RESUMABLE_UPLOAD_EXPIRE_HOURS,
 )
 from fastapi.staticfiles import StaticFiles
 from typing import List, Dict  # Added Dict to imports 
 import sqlite3
 import subprocess
 
+logs.setup_logging()
+logger = logging.getLogger(__name__)
+
 app = FastAPI()
 
 templates = Jinja2Templates(directory="templates")
@@ -39,9 +73,24 @@ PROCESSED_DIR = Path("data/04_Processed")  # Define Processed directory
 TOOLS_DIR = Path("data/zzz_360_TOOLS")
 POWERSHELL_SCRIPT = TOOLS_DIR / "ProcessPan2vrImages.ps1"
 P2VR_TEMPLATE = TOOLS_DIR / "panosettings.p2vr"
+TILE_SCRIPT = TOOLS_DIR / "BuildTilePyramids.py"
+CUBEMAP_SCRIPT = TOOLS_DIR / "EquirectToCubemap.py"
+CUBEMAP_DIR = PROCESSED_DIR / "3D_Viewers"
+PROCESSED_TILES_DIR = Path(TILES_DIR) / PROCESSED_DIR.name
+
+# Stage folders under data/, in pipeline order
+STEPS = [
+    "01_DataDump",
+    "02_Archive",
+    "03_Processing",
+    "04_Processed",
+    "05_Uploaded",
+    "06_VideosNeedProcessed",
+    "07_Uploaded_3D",
+    "zzz_360_TOOLS"  # Updated to match the actual folder name
+]
 
 app.mount("/static", StaticFiles(directory="static"), name="static")
-app.mount("/data", StaticFiles(directory="data"), name="data")
 
 # Ensure all folders are created on startup
 def setup_all_folders():
@@ -49,6 +98,254 @@ def setup_all_folders():
     PROCESSED_DIR.mkdir(parents=True, exist_ok=True)
 
 setup_all_folders()
+# Create tables and apply pending schema migrations
+setup_database()
+
+# In-memory listing of the stage folders, shared by "/" and the per-step pages
+file_catalog = FileCatalog(Path("data"), STEPS, poll_interval=CATALOG_POLL_SECONDS)
+
+# Files and bytes per stage for /metrics, counted from the catalog instead of the disk
+metrics.registry.register(metrics.Gauge(
+    "stage_files", "Files in each stage folder.", ("stage",),
+    collect=lambda: {(stage,): files for stage, (files, _) in file_catalog.stage_totals().items()},
+))
+metrics.registry.register(metrics.Gauge(
+    "stage_bytes", "Bytes in each stage folder.", ("stage",),
+    collect=lambda: {(stage,): size for stage, (_, size) in file_catalog.stage_totals().items()},
+))
+
+@app.middleware("http")
+async def assign_request_id(request: Request, call_next):
+    """
+    Tag the request's log records with a correlation ID, taken from the
+    X-Request-ID header when the client or proxy sent one, and echo it back.
+    """
+    incoming = request.headers.get("x-request-id", "")
+    token = logs.request_id.set(incoming[:64] if incoming.isprintable() and incoming else logs.new_request_id())
+    try:
+        response = await call_next(request)
+        response.headers["X-Request-ID"] = logs.request_id.get()
+        return response
+    finally:
+        logs.request_id.reset(token)
+
+@app.middleware("http")
+async def record_request_latency(request: Request, call_next):
+    """
+    Time every request into the http_request_duration_seconds histogram, labelled
+    with the route template (e.g. /jobs/{job_id}) so paths do not explode the label set.
+    """
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        # Mounts such as /static set no route, only the root_path they matched
+        route = getattr(request.scope.get("route"), "path", None) or request.scope.get("root_path") or "unmatched"
+        metrics.HTTP_REQUEST_DURATION.observe(
+            time.perf_counter() - started, method=request.method, route=route, status=status,
+        )
+
+# Saved profiles of requests sent with ?profile=1 or X-Profile: 1, or sampled
+profile_store = ProfileStore()
+app.add_middleware(ProfilingMiddleware, store=profile_store)
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    """
+    Counters and histograms in the Prometheus text format.
+    """
+    body = await run_in_threadpool(metrics.registry.render)
+    return PlainTextResponse(body, media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.on_event("startup")
+def start_file_catalog():
+    file_catalog.refresh()
+    file_catalog.start_watcher()
+
+@app.on_event("shutdown")
+def stop_file_catalog():
+    file_catalog.stop_watcher()
+
+# Resized previews of stage images for the photo grids and listings
+thumbnail_cache = ThumbnailCache()
+
+@app.on_event("startup")
+def load_thumbnail_cache():
+    thumbnail_cache.load()
+
+@app.on_event("shutdown")
+def stop_thumbnail_cache():
+    thumbnail_cache.shutdown()
+
+@app.on_event("shutdown")
+def stop_file_serving():
+    file_serving.shutdown()
+
+# Content-addressed store the Archive and Processing files are linked into
+blob_store = BlobStore(Path("data"))
+
+# Recognises uploads whose content is already on the server
+deduplicator = Deduplicator(blob_store)
+
+# Reads capture time, size, camera and projection from each photo's headers once, at ingest
+metadata_extractor = MetadataExtractor()
+
+@app.on_event("shutdown")
+def stop_metadata_extractor():
+    metadata_extractor.shutdown()
+
+# Long-running copy and processing operations run as background jobs
+job_queue = JobQueue()
+
+@app.on_event("startup")
+def start_job_queue():
+    job_queue.start()
+
+@app.on_event("shutdown")
+def stop_job_queue():
+    job_queue.shutdown()
+
+# Runs the pixelation tool for the processing jobs, in a pool of worker processes by default
+processing_runner = ProcessingRunner(TOOLS_DIR)
+
+@app.on_event("shutdown")
+def stop_processing_runner():
+    processing_runner.shutdown()
+
+@job_queue.handler("archive")
+def archive_job(ctx, directory):
+    """
+    Move a project from Data Dump to Archive.
+    """
+    try:
+        with ctx.stage("archive"):
+            archive_project_files(DATA_DUMP, ARCHIVE_DIR, directory, progress=ctx)
+    finally:
+        file_catalog.invalidate(DATA_DUMP / directory, ARCHIVE_DIR / directory)
+    ctx.log(f"Archived '{directory}'")
+    if STAGING_LINK_MODE == "blob":
+        # Archived projects go into the blob store so staging them later only creates links
+        job_queue.enqueue("dedupe", directory=directory)
+
+@job_queue.handler("copy_to_processing")
+def copy_to_processing_job(ctx, directory, exclude=()):
+    """
+    Stage a project from Archive into Processing, leaving out files matching the exclude patterns.
+    """
+    destination = PROCESSING_DIR / directory
+    try:
+        with ctx.stage("stage_files"):
+            report = stage_tree(ARCHIVE_DIR / directory, destination, exclude, progress=ctx)
+        ctx.log(report.summary())
+    finally:
+        file_catalog.invalidate(destination)
+
+@job_queue.handler("process_images")
+def process_images_job(ctx, directory):
+    """
+    Pixelate a Processing directory into Processed.
+    """
+    destination = PROCESSED_DIR / directory
+    try:
+        processing_runner.pixelate(ctx, PROCESSING_DIR / directory, destination)
+    finally:
+        file_catalog.invalidate(destination)
+    # Tile pyramids are the next stage for the new outputs
+    job_queue.enqueue("build_tiles", directory=directory)
+
+@job_queue.handler("process_project")
+def process_project_job(ctx, project_name):
+    """
+    Process a Processing project into Processed.
+    """
+    destination = PROCESSED_DIR / project_name
+    try:
+        processing_runner.pixelate(ctx, PROCESSING_DIR / project_name, destination)
+    finally:
+        file_catalog.invalidate(destination)
+    job_queue.enqueue("build_tiles", directory=project_name)
+
+@job_queue.handler("process_trekk360")
+def process_trekk360_job(ctx, directory):
+    """
+    Copy a project from Archive to Processing and process it into Processed.
+    """
+    destination = PROCESSING_DIR / directory
+    try:
+        with ctx.stage("stage_files"):
+            report = stage_tree(ARCHIVE_DIR / directory, destination, progress=ctx)
+        ctx.log(report.summary())
+    finally:
+        file_catalog.invalidate(destination)
+    processed = PROCESSED_DIR / directory
+    try:
+        processing_runner.pixelate(ctx, destination, processed)
+    finally:
+        file_catalog.invalidate(processed)
+    job_queue.enqueue("build_tiles", directory=directory)
+
+@job_queue.handler("build_tiles")
+def build_tiles_job(ctx, directory):
+    """
+    Build Deep Zoom tile pyramids for a Processed project's panoramas.
+    """
+    with ctx.stage("tiles"):
+        processing_runner.run_tool(ctx, TILE_SCRIPT, PROCESSED_DIR / directory, PROCESSED_TILES_DIR / directory)
+
+@job_queue.handler("cubemap")
+def cubemap_job(ctx, directory):
+    """
+    Convert a Processed project's panoramas into cube faces for the 3D viewers.
+    """
+    destination = CUBEMAP_DIR / directory
+    try:
+        with ctx.stage("cubemap"):
+            processing_runner.run_tool(ctx, CUBEMAP_SCRIPT, PROCESSED_DIR / directory, destination)
+    finally:
+        file_catalog.invalidate(destination)
+
+@job_queue.handler("dedupe")
+def dedupe_job(ctx, directory):
+    """
+    Move an Archive project's files into the blob store, linking duplicates to a single copy.
+    """
+    files_freed, bytes_freed = blob_store.ingest_tree(ARCHIVE_DIR / directory, progress=ctx)
+    ctx.log(f"Deduplicated {files_freed} files, freeing {bytes_freed} bytes")
+
+@job_queue.handler("backfill_metadata")
+def backfill_metadata_job(ctx):
+    """
+    Extract the photo metadata of files uploaded before it was recorded.
+    """
+    files = metadata_extractor.backfill(progress=ctx)
+    ctx.log(f"Extracted the metadata of {files} files")
+
+@job_queue.handler("blob_gc")
+def blob_gc_job(ctx, dry_run=False):
+    """
+    Remove blobs that no stage file refers to any more.
+    """
+    blobs_removed, bytes_removed = blob_store.gc(dry_run)
+    ctx.log(f"{'Would remove' if dry_run else 'Removed'} {blobs_removed} blobs ({bytes_removed} bytes)")
+
+def job_queued_response(request: Request, job_id: int, message: str):
+    """
+    Confirmation page for an operation that was handed to the job queue.
+    """
+    if "application/json" in request.headers.get("accept", ""):
+        return {"status": "queued", "job_id": job_id, "message": message}
+    return templates.TemplateResponse(
+        "confirmation.html",
+        {
+            "request": request,
+            "status": "queued",
+            "message": message,
+            "job_id": job_id,
+        },
+    )
 
 @app.post("/upload/")
 async def upload_files(
@@ -61,31 +358,70 @@ async def upload_files(
     files: List[UploadFile] = File(...),
 ):
     try:
-        # Debugging output for files
-        for file in files:
-            print(f"DEBUG: Uploading file: {file.filename}")
-
-        # Insert project and structure
-        project_id = insert_project(project_number, collection_date, crew_initials)
-        structure_db_id = insert_structure(project_id, project_location, structure_id, collection_date)
-        print(f"DEBUG: Project ID: {project_id}, Structure DB ID: {structure_db_id}")
+        if logger.isEnabledFor(logging.DEBUG):
+            for file in files:
+                logger.debug("Uploading file: %s", file.filename)
 
         # File handling
         parent_folder = Path(f"data/01_DataDump/{project_number}_{collection_date}_{crew_initials}")
-        parent_folder.mkdir(parents=True, exist_ok=True)
         child_folder = parent_folder / f"{project_location}_{structure_id}_{collection_date}"
-        child_folder.mkdir(parents=True, exist_ok=True)
+        await run_in_threadpool(child_folder.mkdir, parents=True, exist_ok=True)
 
+        # Stream each file to disk in a worker thread so the event loop stays free, hashing it on the way
         uploaded_files = []
+        file_stats = []
+        structure_db_id = await run_in_threadpool(
+            get_structure_db_id, project_number, collection_date, crew_initials, project_location, structure_id
+        )
         for file in files:
-            file_path = child_folder / file.filename
-            with open(file_path, "wb") as buffer:
-                shutil.copyfileobj(file.file, buffer)
-            uploaded_files.append(file_path)
-
-            # Insert file record into the database
-            file_id = insert_file(structure_db_id, file.filename, str(file_path))
-            print(f"DEBUG: Inserted file ID: {file_id}")
+            file_path = child_folder / Path(file.filename).name
+            digest = hashlib.sha256()
+            started = time.perf_counter()
+            size = await run_in_threadpool(stream_to_file, file.file, file_path, digest=digest)
+            elapsed = time.perf_counter() - started
+            metrics.record_upload(size, elapsed)
+            # Content the structure already has is dropped, and content held elsewhere is linked to
+            sha256 = digest.hexdigest()
+            status, existing_id = await run_in_threadpool(deduplicator.place, file_path, sha256, size, structure_db_id)
+            if status != "duplicate":
+                uploaded_files.append((file_path, sha256))
+            file_stats.append({
+                "filename": file_path.name,
+                "path": file_path.relative_to("data").as_posix(),
+                "bytes": size,
+                "seconds": round(elapsed, 4),
+                "mb_per_second": round(size / elapsed / 1_000_000, 2) if elapsed > 0 else None,
+                "sha256": sha256,
+                "status": status,
+                "file_id": existing_id,
+            })
+
+        await run_in_threadpool(file_catalog.invalidate, child_folder)
+
+        # Insert project, structure and file rows in one transaction
+        project_id, structure_db_id, file_ids = await run_in_threadpool(
+            insert_upload_records,
+            project_number,
+            collection_date,
+            crew_initials,
+            project_location,
+            structure_id,
+            [(file_path.name, str(file_path), sha256) for file_path, sha256 in uploaded_files],
+        )
+        new_ids = iter(file_ids)
+        for stat in file_stats:
+            if stat["status"] != "duplicate":
+                stat["file_id"] = next(new_ids)
+        metadata_extractor.submit(zip(file_ids, (file_path for file_path, _ in uploaded_files)))
+        logger.debug("Project ID: %s, Structure DB ID: %s, File IDs: %s", project_id, structure_db_id, file_ids)
+
+        if "application/json" in request.headers.get("accept", ""):
+            return {
+                "status": "success",
+                "project_id": project_id,
+                "structure_db_id": structure_db_id,
+                "files": file_stats,
+            }
 
         # Return confirmation
         return templates.TemplateResponse(
@@ -93,19 +429,20 @@ async def upload_files(
             {
                 "request": request,
                 "status": "success",
-                "uploaded_files": [str(file.relative_to("data")) for file in uploaded_files],
+                "uploaded_files": [str(file.relative_to("data")) for file, _ in uploaded_files],
+                "file_stats": file_stats,
                 "project_folder": parent_folder.name,
                 "child_folder": child_folder.name,
             },
         )
     except sqlite3.Error as db_error:
-        print(f"Database error during file upload: {db_error}")
+        logger.error("Database error during file upload: %s", db_error)
         raise HTTPException(status_code=500, detail="Database Error")
     except OSError as os_error:
-        print(f"File system error during file upload: {os_error}")
+        logger.error("File system error during file upload: %s", os_error)
         raise HTTPException(status_code=500, detail="File System Error")
     except Exception as e:
-        print(f"Unexpected error during file upload: {e}")
+        logger.exception("Unexpected error during file upload: %s", e)
         raise HTTPException(status_code=500, detail="Internal Server Error")
     finally:
         # Ensure all file objects are closed
@@ -113,73 +450,404 @@ async def upload_files(
             try:
                 file.file.close()
             except Exception as e:
-                print(f"Error closing file: {file.filename}. Error: {e}")
+                logger.warning("Error closing file: %s. Error: %s", file.filename, e)
 
-    
-@app.get("/", response_class=HTMLResponse)
-async def list_projects(request: Request):
+
+@app.post("/upload/precheck/")
+async def precheck_upload(request: Request):
+    """
+    Tell a client which files of an upload the server already has, by SHA-256, so it can skip them.
+    Takes JSON with the /upload/ fields, "files": [{"sha256", "filename", "size"}] and optionally
+    "link": true to link files held elsewhere into the upload folder instead of having them sent.
+    """
     try:
-        # Initialize hierarchical structure: step -> upper_dir -> lower_dir -> files
-        files_by_step = {}
-        steps = [
-            "01_DataDump",
-            "02_Archive",
-            "03_Processing",
-            "04_Processed",
-            "05_Uploaded",
-            "06_VideosNeedProcessed",
-            "07_Uploaded_3D",
-            "zzz_360_TOOLS"  # Updated to match the actual folder name
+        body = await request.json()
+        fields = {key: str(body[key]).strip() for key in UPLOAD_FIELDS}
+        files = [
+            {"sha256": str(entry["sha256"]), "filename": entry.get("filename"), "size": entry.get("size")}
+            for entry in body["files"]
         ]
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail=f"Expected JSON with {', '.join(UPLOAD_FIELDS)} and files.")
+    if any(not value or "/" in value or "\\" in value or value in (".", "..") for value in fields.values()):
+        raise HTTPException(status_code=400, detail="Invalid upload fields.")
+    results = await run_in_threadpool(deduplicator.precheck, fields, files, bool(body.get("link")))
+    linked = [result for result in results if result["status"] == "linked"]
+    if linked:
+        folder = upload_folder(DATA_DUMP, fields)
+        await run_in_threadpool(file_catalog.invalidate, folder)
+        metadata_extractor.submit([(result["file_id"], folder / Path(result["filename"]).name) for result in linked])
+    return {"files": results}
+
+# Resumable uploads, for files too large to send in one request; abandoned ones expire as new ones are created
+resumable_uploads = ResumableUploads(DATA_DUMP, deduplicator=deduplicator)
+
+@app.on_event("startup")
+def expire_resumable_uploads():
+    resumable_uploads.expire(RESUMABLE_UPLOAD_EXPIRE_HOURS)
+
+async def resumable_upload_finished(upload, file_id):
+    """
+    Show a newly registered resumable upload in the listings and read its photo metadata.
+    """
+    destination = resumable_uploads.destination(upload)
+    await run_in_threadpool(file_catalog.invalidate, destination.parent)
+    # A duplicate's file is gone again, and the row it matched has its metadata already
+    if await run_in_threadpool(destination.exists):
+        metadata_extractor.submit([(file_id, destination)])
 
-        for step in steps:
-            step_path = Path(f"data/{step}")  # Removed replace(' ', '_')
-
-            files_by_step[step] = {}
-
-            if not step_path.exists():
-                print(f"Warning: Step folder '{step_path}' does not exist.")
-                continue  # Skip if the step folder doesn't exist to prevent errors
+def tus_response(status_code=204, **headers):
+    headers = {name.replace("_", "-"): str(value) for name, value in headers.items()}
+    return Response(status_code=status_code, headers={"Tus-Resumable": TUS_VERSION, "Cache-Control": "no-store", **headers})
 
-            for upper_dir in step_path.iterdir():
-                if upper_dir.is_dir():
-                    upper_dir_name = upper_dir.name
-                    files_by_step[step][upper_dir_name] = {}
+def tus_error(error: UploadError):
+    return PlainTextResponse(str(error), status_code=error.status_code, headers={"Tus-Resumable": TUS_VERSION})
 
-                    for lower_dir in upper_dir.iterdir():
-                        if lower_dir.is_dir():
-                            lower_dir_name = lower_dir.name
-                            files = []
+@app.options("/uploads/")
+async def resumable_upload_options():
+    """
+    Advertise the tus protocol version and extensions this server supports.
+    """
+    return tus_response(
+        Tus_Version=TUS_VERSION, Tus_Extension="creation,termination", Tus_Max_Size=resumable_uploads.max_bytes,
+    )
 
-                            for file in lower_dir.glob("**/*"):
-                                if file.is_file():
-                                    relative_path = file.relative_to("data").as_posix()
-                                    files.append({
-                                        "filename": file.name,
-                                        "path": relative_path
-                                    })
+@app.post("/uploads/")
+async def create_resumable_upload(request: Request):
+    """
+    Start a resumable upload. Takes an Upload-Length header and an Upload-Metadata header
+    with the same fields as /upload/ plus the filename; answers with its URL in Location.
+    """
+    try:
+        length = int(request.headers.get("upload-length", ""))
+    except ValueError:
+        return tus_error(UploadError(400, "Upload-Length header is required."))
+    try:
+        metadata = parse_metadata(request.headers.get("upload-metadata"))
+        upload = await run_in_threadpool(resumable_uploads.create, length, metadata)
+        if length == 0:
+            file_id = await run_in_threadpool(resumable_uploads.finish, upload["id"])
+            await resumable_upload_finished(upload, file_id)
+    except UploadError as e:
+        return tus_error(e)
+    return tus_response(201, Location=f"/uploads/{upload['id']}", Upload_Offset=0)
+
+@app.head("/uploads/{upload_id}")
+async def resumable_upload_offset(upload_id: str):
+    """
+    Return how many bytes of an upload have arrived, so a client can continue from there,
+    and the file's ID in Upload-File-Id once it is registered.
+    """
+    try:
+        upload, finished = await run_in_threadpool(resumable_uploads.complete, upload_id)
+        if finished:
+            await resumable_upload_finished(upload, upload["file_id"])
+    except UploadError as e:
+        return tus_response(e.status_code)
+    headers = {"Upload_Offset": upload["received"], "Upload_Length": upload["length"]}
+    if upload["status"] == "complete":
+        headers["Upload_File_Id"] = upload["file_id"]
+    return tus_response(200, **headers)
+
+@app.patch("/uploads/{upload_id}")
+async def append_resumable_upload(request: Request, upload_id: str):
+    """
+    Append the request body to an upload at the Upload-Offset header, which must match
+    the upload's current offset. The request that completes the upload registers the file.
+    """
+    if request.headers.get("content-type") != "application/offset+octet-stream":
+        return tus_error(UploadError(415, "Content-Type must be application/offset+octet-stream."))
+    try:
+        offset = int(request.headers.get("upload-offset", ""))
+    except ValueError:
+        return tus_error(UploadError(400, "Upload-Offset header is required."))
+    try:
+        writer = await run_in_threadpool(resumable_uploads.open, upload_id, offset)
+        started = time.perf_counter()
+        try:
+            # Small network reads are gathered so each hop to a worker thread writes a full chunk
+            buffer = bytearray()
+            async for data in request.stream():
+                buffer += data
+                if len(buffer) >= UPLOAD_CHUNK_SIZE:
+                    await run_in_threadpool(writer.write, bytes(buffer))
+                    buffer.clear()
+            if buffer:
+                await run_in_threadpool(writer.write, bytes(buffer))
+            metrics.record_upload(writer.received - offset, time.perf_counter() - started)
+            headers = {"Upload_Offset": writer.received}
+            if writer.complete:
+                headers["Upload_File_Id"] = await run_in_threadpool(writer.finish)
+                await resumable_upload_finished(writer.upload, headers["Upload_File_Id"])
+        finally:
+            await run_in_threadpool(writer.close)
+    except UploadError as e:
+        return tus_error(e)
+    except ClientDisconnect:
+        # What arrived is saved; the client asks for the offset with HEAD when it comes back
+        return tus_response(400)
+    return tus_response(**headers)
+
+@app.delete("/uploads/{upload_id}")
+async def terminate_resumable_upload(upload_id: str):
+    """
+    Abandon an unfinished upload and delete what was received.
+    """
+    try:
+        await run_in_threadpool(resumable_uploads.terminate, upload_id)
+    except UploadError as e:
+        return tus_error(e)
+    return tus_response()
 
-                            files_by_step[step][upper_dir_name][lower_dir_name] = files
+@app.get("/", response_class=HTMLResponse)
+async def list_projects(request: Request):
+    try:
+        # Only the stages are rendered; the page expands each level through /api/tree/
+        stages = (await run_in_threadpool(file_catalog.list_dir, ""))["items"]
 
-        print("DEBUG: Successfully collected files by step")
+        logger.debug("Successfully collected stages")
         return templates.TemplateResponse("projects.html", {
             "request": request,
-            "files_by_step": files_by_step  # Pass hierarchical files grouped by step, upper and lower directories
+            "stages": stages
         })
     except Exception as e:
-        print(f"Error in list_projects: {e}")
+        logger.error("Error in list_projects: %s", e)
         raise HTTPException(status_code=500, detail="Internal Server Error")
 
+@app.get("/api/tree/")
+@app.get("/api/tree/{path:path}")
+async def tree_level(path: str = "", cursor: str = None, limit: int = TREE_PAGE_SIZE, q: str = None):
+    """
+    Return one page of one level of the stage tree: stages, projects, sites or files.
+    """
+    limit = max(1, min(limit, TREE_MAX_PAGE_SIZE))
+    page = await run_in_threadpool(file_catalog.list_dir, path.strip("/"), cursor, limit, q)
+    if page is None:
+        raise HTTPException(status_code=404, detail="Directory not found.")
+    return page
+
+@app.get("/jobs/", response_class=HTMLResponse)
+async def list_jobs(request: Request):
+    """
+    List recent background jobs with their progress.
+    """
+    jobs = await run_in_threadpool(job_queue.recent)
+    return templates.TemplateResponse("jobs.html", {"request": request, "jobs": jobs})
+
+@app.get("/admin/profiles/", response_class=HTMLResponse)
+async def list_profiles(request: Request, all: bool = False):
+    """
+    List recent request profiles slower than PROFILE_SLOW_MS (all of them with ?all=1) and their top functions.
+    """
+    profiles = await run_in_threadpool(profile_store.recent, 0 if all else PROFILE_SLOW_MS)
+    return templates.TemplateResponse(
+        "admin_profiles.html",
+        {"request": request, "profiles": profiles, "show_all": all, "slow_ms": PROFILE_SLOW_MS},
+    )
+
+@app.get("/admin/profiles/{profile_id}")
+async def profile_detail(profile_id: str):
+    """
+    Return one saved request profile as JSON.
+    """
+    profile = await run_in_threadpool(profile_store.get, profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Profile not found.")
+    return profile
+
+@app.get("/jobs/{job_id}")
+async def job_status(job_id: int):
+    """
+    Return the status and progress of a background job.
+    """
+    status = await run_in_threadpool(job_queue.status, job_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Job not found.")
+    return status
+
+@app.get("/jobs/{job_id}/events")
+async def job_events(request: Request, job_id: int):
+    """
+    Stream a job's progress and output as Server-Sent Events until it finishes.
+    """
+    status = await run_in_threadpool(job_queue.status, job_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Job not found.")
+    return StreamingResponse(
+        job_event_stream(request, job_queue, job_id),
+        media_type="text/event-stream",
+        # Proxies must pass events through as they are written
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+def resolve_data_path(path: str) -> Path:
+    """
+    Map a URL path to a file under data/, refusing anything that escapes it.
+    """
+    data_root = Path("data").resolve()
+    candidate = (data_root / path).resolve()
+    if not candidate.is_relative_to(data_root) or not candidate.is_file():
+        raise HTTPException(status_code=404, detail="File not found.")
+    relative = candidate.relative_to(data_root)
+    # Caches, the blob store and the database are not content
+    if any(part.startswith(".") for part in relative.parts) or relative.name.startswith(DATABASE_FILE.name):
+        raise HTTPException(status_code=404, detail="File not found.")
+    return Path("data") / relative
+
+@app.api_route("/data/{path:path}", methods=["GET", "HEAD"])
+async def serve_data(request: Request, path: str):
+    """
+    Serve a file under data/ with content-hash ETags, per-stage caching and byte ranges.
+    """
+    source = resolve_data_path(path)
+    return await file_serving.file_response(request, source, source.relative_to("data").as_posix())
+
+@app.get("/thumb/{path:path}")
+async def thumbnail(request: Request, path: str, w: int = THUMB_WIDTHS[1]):
+    """
+    Return a resized JPEG or WebP of an image under data/, generating and caching it on first use.
+    """
+    source = resolve_data_path(path)
+    if source.suffix.lower() not in THUMB_SUFFIXES:
+        raise HTTPException(status_code=404, detail="Not an image.")
+    fmt = "webp" if WEBP_AVAILABLE and "image/webp" in request.headers.get("accept", "") else "jpeg"
+    try:
+        thumb = await asyncio.wrap_future(thumbnail_cache.submit(source, w, fmt))
+    except OSError as e:
+        logger.error("Error generating thumbnail for %s: %s", path, e)
+        raise HTTPException(status_code=415, detail="Could not read this image.")
+    return FileResponse(
+        thumb,
+        media_type=MEDIA_TYPES[fmt],
+        headers={"Cache-Control": "public, max-age=86400", "Vary": "Accept"},
+    )
+
+@app.get("/tiles/{path:path}")
+async def tile(request: Request, path: str):
+    """
+    Serve a Deep Zoom descriptor or tile from the tile pyramids.
+    """
+    tiles_root = Path(TILES_DIR).resolve()
+    candidate = (tiles_root / path).resolve()
+    if not candidate.is_relative_to(tiles_root) or not candidate.is_file() or candidate.name.endswith(".tmp"):
+        raise HTTPException(status_code=404, detail="Tile not found.")
+    return await file_serving.file_response(
+        request, candidate, path, cache_control=TILE_CACHE_CONTROL, hash_content=False
+    )
+
+@app.get("/pano/{path:path}", response_class=HTMLResponse)
+async def view_pano(request: Request, path: str):
+    """
+    Show a processed panorama through its tile pyramid, falling back to a thumbnail until it is built.
+    """
+    source = resolve_data_path(path)
+    relative = source.relative_to("data")
+    dzi = Path(TILES_DIR) / relative.with_suffix(".dzi")
+    return templates.TemplateResponse(
+        "pano.html",
+        {
+            "request": request,
+            "path": relative.as_posix(),
+            "dzi_url": f"/tiles/{relative.with_suffix('.dzi').as_posix()}" if dzi.exists() else None,
+        },
+    )
+
+@app.post("/build_tiles/")
+async def build_tiles(request: Request, directory: str = Form(...)):
+    """
+    Build tile pyramids for a Processed project in the background.
+    """
+    if not (PROCESSED_DIR / directory).is_dir():
+        raise HTTPException(status_code=404, detail=f"Directory '{directory}' does not exist in Processed.")
+    job_id = await run_in_threadpool(job_queue.enqueue, "build_tiles", directory=directory)
+    return job_queued_response(request, job_id, f"Building tile pyramids for '{directory}'.")
+
+@app.post("/cubemap/")
+async def convert_to_cubemap(request: Request, directory: str = Form(...)):
+    """
+    Convert a Processed project's panoramas to cube faces in the background.
+    """
+    if not (PROCESSED_DIR / directory).is_dir() or (PROCESSED_DIR / directory) == CUBEMAP_DIR:
+        raise HTTPException(status_code=404, detail=f"Directory '{directory}' does not exist in Processed.")
+    job_id = await run_in_threadpool(job_queue.enqueue, "cubemap", directory=directory)
+    return job_queued_response(request, job_id, f"Converting '{directory}' to cube faces.")
+
+@app.get("/blobs/")
+async def blob_stats():
+    """
+    Return how many blobs the store holds and how many bytes deduplication saves.
+    """
+    return await run_in_threadpool(blob_store.stats)
+
+@app.post("/blobs/dedupe/")
+async def dedupe_project(request: Request, directory: str = Form(...)):
+    """
+    Deduplicate an Archive project into the blob store in the background.
+    """
+    if not (ARCHIVE_DIR / directory).is_dir():
+        raise HTTPException(status_code=404, detail=f"Directory '{directory}' does not exist in Archive.")
+    job_id = await run_in_threadpool(job_queue.enqueue, "dedupe", directory=directory)
+    return job_queued_response(request, job_id, f"Deduplicating directory '{directory}'.")
+
+@app.post("/blobs/gc/")
+async def collect_blobs(request: Request, dry_run: bool = Form(False)):
+    """
+    Remove unreferenced blobs in the background.
+    """
+    job_id = await run_in_threadpool(job_queue.enqueue, "blob_gc", dry_run=dry_run)
+    return job_queued_response(request, job_id, "Collecting unreferenced blobs.")
+
+@app.post("/metadata/backfill/")
+async def backfill_metadata(request: Request):
+    """
+    Extract the photo metadata of earlier uploads in the background.
+    """
+    job_id = await run_in_threadpool(job_queue.enqueue, "backfill_metadata")
+    return job_queued_response(request, job_id, "Extracting photo metadata of earlier uploads.")
+
+def photo_filters(sort, order, after, before, min_mp, camera, projection):
+    """
+    Validate the sort and filter query parameters of the photo listings into
+    a dict for the template, and the matching get_files_with_metadata arguments.
+    """
+    for value in (after, before):
+        if value and not re.fullmatch(r"\d{2}:\d{2}", value):
+            raise HTTPException(status_code=400, detail="Capture times must be given as HH:MM.")
+    if sort not in PHOTO_SORTS:
+        raise HTTPException(status_code=400, detail=f"sort must be one of {', '.join(PHOTO_SORTS)}.")
+    # The form always sends min_mp, empty when no minimum is set
+    try:
+        min_megapixels = float(min_mp) if min_mp.strip() else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="min_mp must be a number.")
+    filters = {
+        "sort": sort, "order": order, "after": after, "before": before,
+        "min_mp": min_mp, "camera": camera, "projection": projection,
+    }
+    query = {
+        "sort": sort,
+        "descending": order == "desc",
+        "captured_after": after or None,
+        "captured_before": before or None,
+        "min_megapixels": min_megapixels,
+        "camera_model": camera or None,
+        "projection": projection or None,
+    }
+    return filters, query
+
 @app.get("/structures/{structure_db_id}/photos/{collection_date}", response_class=HTMLResponse)
-async def list_photos(request: Request, structure_db_id: int, collection_date: str):
-    # Fetch photos for the structure and collection date
-    files = get_files_by_structure_and_date(structure_db_id, collection_date)
+async def list_photos(
+    request: Request, structure_db_id: int, collection_date: str, sort: str = "filename", order: str = "asc",
+    after: str = "", before: str = "", min_mp: str = "", camera: str = "", projection: str = "",
+):
+    # Fetch photos for the structure and collection date, sorted and filtered by their metadata
+    filters, query = photo_filters(sort, order, after, before, min_mp, camera, projection)
+    files = await run_in_threadpool(get_files_with_metadata, structure_db_id, collection_date, **query)
 
-    if not files:
+    if not files and not any(query[key] for key in query if key not in ("sort", "descending")):
         raise HTTPException(status_code=404, detail="No photos found for this date.")
 
-    # Debugging: Print fetched files
-    print(f"DEBUG: Retrieved files for structure_db_id={structure_db_id}, collection_date={collection_date}:", files)
+    logger.debug("Retrieved %d files for structure_db_id=%s, collection_date=%s", len(files), structure_db_id, collection_date)
 
     return templates.TemplateResponse(
         "photos.html",
@@ -188,6 +856,9 @@ async def list_photos(request: Request, structure_db_id: int, collection_date: s
             "files": files,
             "structure_db_id": structure_db_id,
             "collection_date": collection_date,
+            "filters": filters,
+            "choices": await run_in_threadpool(get_metadata_choices, structure_db_id),
+            "sorts": PHOTO_SORTS,
         },
     )
 
@@ -212,8 +883,12 @@ async def create_structure(
     return {"message": "Structure created successfully", "structure_db_id": structure_db_id}
 
 @app.get("/structures/{structure_db_id}/files", response_class=HTMLResponse)
-async def list_files(request: Request, structure_db_id: int):
-    files = get_files_by_structure(structure_db_id)
+async def list_files(
+    request: Request, structure_db_id: int, sort: str = "filename", order: str = "asc",
+    after: str = "", before: str = "", min_mp: str = "", camera: str = "", projection: str = "",
+):
+    filters, query = photo_filters(sort, order, after, before, min_mp, camera, projection)
+    files = await run_in_threadpool(get_files_with_metadata, structure_db_id, **query)
     structure = get_structure_by_id(structure_db_id)  # Fetch structure data
 
     if not structure:
@@ -228,6 +903,10 @@ async def list_files(request: Request, structure_db_id: int):
                 "structure_id": structure["structure_id"],  # Use structure_id field for display
                 "project_id": structure["project_id"],
             },
+            "structure_db_id": structure_db_id,
+            "filters": filters,
+            "choices": await run_in_threadpool(get_metadata_choices, structure_db_id),
+            "sorts": PHOTO_SORTS,
         },
     )
 
@@ -243,6 +922,7 @@ async def upload_form(request: Request):
 @app.post("/archive/")
 async def archive_datadump(request: Request):
     archive_files(DATA_DUMP, ARCHIVE_DIR)
+    await run_in_threadpool(file_catalog.invalidate, DATA_DUMP, ARCHIVE_DIR)
     return templates.TemplateResponse(
         "confirmation.html",
         {
@@ -252,57 +932,36 @@ async def archive_datadump(request: Request):
         },
     )
 
-@app.post("/archive_project/")
-async def archive_project(request: Request, project_folder_name: str = Form(...)):
+async def archive_directory_response(request: Request, directory: str):
     """
-    Archive a specific project by moving it from Data Dump to Archive.
+    Queue an archive job for a Data Dump directory, or explain why it cannot be archived.
     """
-    try:
-        archive_project_files(DATA_DUMP, ARCHIVE_DIR, project_folder_name)
-        message = f"Project '{project_folder_name}' archived successfully."
-        status = "success"
-    except FileNotFoundError as fnf_error:
-        message = str(fnf_error)
-        status = "error"
-    except Exception as e:
-        message = f"An unexpected error occurred: {e}"
-        status = "error"
-
+    source = DATA_DUMP / directory
+    if source.is_dir():
+        job_id = await run_in_threadpool(job_queue.enqueue, "archive", directory=directory)
+        return job_queued_response(request, job_id, f"Archiving directory '{directory}'.")
     return templates.TemplateResponse(
         "confirmation.html",
         {
             "request": request,
-            "status": status,
-            "message": message
+            "status": "error",
+            "message": f"Directory '{source}' does not exist."
         },
     )
 
+@app.post("/archive_project/")
+async def archive_project(request: Request, project_folder_name: str = Form(...)):
+    """
+    Archive a specific project by moving it from Data Dump to Archive in the background.
+    """
+    return await archive_directory_response(request, project_folder_name)
+
 @app.post("/archive_data_dump/")
 async def archive_data_dump(request: Request, directory: str = Form(...)):
     """
     Archive a specified directory from Data Dump to Archive.
     """
-    try:
-        archive_project_files(DATA_DUMP, ARCHIVE_DIR, directory)
-        message = f"Directory '{directory}' archived successfully."
-        return templates.TemplateResponse(
-            "confirmation.html",
-            {
-                "request": request,
-                "status": "success",
-                "message": message
-            },
-        )
-    except Exception as e:
-        print(f"Error archiving directory '{directory}': {e}")
-        return templates.TemplateResponse(
-            "confirmation.html",
-            {
-                "request": request,
-                "status": "error",
-                "message": f"Failed to archive directory '{directory}'. Please try again."
-            },
-        )
+    return await archive_directory_response(request, directory)
 
 def archive_files_single(file_path):
     """
@@ -312,7 +971,7 @@ def archive_files_single(file_path):
     destination = ARCHIVE_DIR / file_path
     destination.parent.mkdir(parents=True, exist_ok=True)
     source.rename(destination)
-    print(f"Archived {source} to {destination}")
+    logger.info("Archived %s to %s", source, destination)
 
 @app.post("/archive_file/")
 async def archive_file(request: Request, file_path: str):
@@ -320,6 +979,7 @@ async def archive_file(request: Request, file_path: str):
     Archive a single file by moving it from Data Dump to Archive.
     """
     archive_files_single(file_path)
+    await run_in_threadpool(file_catalog.invalidate, (DATA_DUMP / file_path).parent, (ARCHIVE_DIR / file_path).parent)
     return {"message": "File archived successfully."}
 
 # New endpoints for each folder/step
@@ -328,10 +988,14 @@ def collect_files(directory: Path) -> Dict[str, Dict[str, list]]:
     """
     Helper function to traverse the given directory and collect files grouped by project and site.
     """
+    # Stage folders are answered from the in-memory catalog
+    if directory.parent == Path("data") and directory.name in STEPS:
+        return file_catalog.files_by_project(directory.name)
+
     files_by_project = {}
     
     if not directory.exists():
-        print(f"Directory {directory} does not exist.")
+        logger.warning("Directory %s does not exist.", directory)
         return files_by_project
     
     for project_dir in directory.iterdir():
@@ -362,17 +1026,17 @@ def collect_files(directory: Path) -> Dict[str, Dict[str, list]]:
                         "path": relative_path
                     })
                 else:
-                    print(f"Skipping unknown item in project level: {item}")
+                    logger.debug("Skipping unknown item in project level: %s", item)
     
             if project_files:
                 # Use an empty string as the key for files without a site
                 files_by_project[project_name][""] = project_files
     
         else:
-            print(f"Skipping non-directory in project level: {project_dir}")
+            logger.debug("Skipping non-directory in project level: %s", project_dir)
     
     # Debugging output
-    print(f"Collected files in {directory}: {files_by_project}")
+    logger.debug("Collected files in %s: %d projects", directory, len(files_by_project))
     return files_by_project
 
 @app.get("/{step}/", response_class=HTMLResponse)
@@ -397,9 +1061,10 @@ async def view_step(request: Request, step: str):
             raise HTTPException(status_code=404, detail="Step not found.")
 
         # Debugging output
-        print(f"Accessing step '{step}' with directory '{directory}'")
+        logger.debug("Accessing step '%s' with directory '%s'", step, directory)
 
-        files_by_project = collect_files(directory)
+        # First page of projects; sites and files are fetched on demand through /api/tree/
+        page = await run_in_threadpool(file_catalog.list_dir, directory.name, None, TREE_PAGE_SIZE)
 
         template_mapping = {
             "data_dump": "data_dump.html",
@@ -414,13 +1079,16 @@ async def view_step(request: Request, step: str):
 
         template_name = template_mapping.get(step.lower(), "confirmation.html")
 
-        print(f"DEBUG: Successfully collected files for step '{step}'")
+        logger.debug("Successfully collected files for step '%s'", step)
         return templates.TemplateResponse(template_name, {
             "request": request,
-            "files_by_project": files_by_project  # Pass hierarchical files grouped by project and site
+            "stage": directory.name,
+            "projects": [item for item in page["items"] if item["type"] == "dir"],
+            "projects_total": page["dirs_total"],
+            "next_cursor": page["next_cursor"],
         })
     except Exception as e:
-        print(f"Error in view_step: {e}")
+        logger.error("Error in view_step: %s", e)
         return templates.TemplateResponse(
             "confirmation.html",
             {
@@ -435,30 +1103,13 @@ async def archive_action(request: Request, directory: str = Form(...)):
     """
     Archive a specific directory from Data Dump to Archive.
     """
-    try:
-        archive_project_files(DATA_DUMP, ARCHIVE_DIR, directory)
-        message = f"Directory '{directory}' archived successfully."
-        status = "success"
-    except FileNotFoundError as fnf_error:
-        message = str(fnf_error)
-        status = "error"
-    except Exception as e:
-        message = f"An unexpected error occurred: {e}"
-        status = "error"
-
-    return templates.TemplateResponse(
-        "confirmation.html",
-        {
-            "request": request,
-            "status": status,
-            "message": message
-        },
-    )
+    return await archive_directory_response(request, directory)
 
 @app.post("/copy_to_processing/")
-async def copy_to_processing(request: Request, directory: str = Form(...)):
+async def copy_to_processing(request: Request, directory: str = Form(...), exclude: str = Form("")):
     """
-    Copy a specific directory from Archive to Processing without removing it from Archive.
+    Copy a specific directory from Archive to Processing in the background without removing it from Archive.
+    exclude is an optional comma-separated list of suffixes or globs (e.g. ".mp4, raw/*") to leave out.
     """
     source = ARCHIVE_DIR / directory
     destination = PROCESSING_DIR / directory
@@ -485,22 +1136,9 @@ async def copy_to_processing(request: Request, directory: str = Form(...)):
             },
         )
     
-    try:
-        shutil.copytree(source, destination)
-        message = f"Directory '{directory}' has been copied to Processing successfully."
-        status = "success"
-    except Exception as e:
-        message = f"Failed to copy directory '{directory}' to Processing. Error: {e}"
-        status = "error"
-    
-    return templates.TemplateResponse(
-        "confirmation.html",
-        {
-            "request": request,
-            "status": status,
-            "message": message
-        },
-    )
+    patterns = [pattern.strip() for pattern in exclude.split(",") if pattern.strip()]
+    job_id = await run_in_threadpool(job_queue.enqueue, "copy_to_processing", directory=directory, exclude=patterns)
+    return job_queued_response(request, job_id, f"Copying directory '{directory}' to Processing.")
 
 @app.post("/process_file/")
 async def process_file(request: Request, file_path: str = Form(...)):
@@ -525,6 +1163,7 @@ async def process_file(request: Request, file_path: str = Form(...)):
     
     try:
         shutil.move(str(source), str(destination))
+        await run_in_threadpool(file_catalog.invalidate, source.parent, destination.parent)
         message = f"File '{file_path}' has been processed and moved to Processed successfully."
         status = "success"
     except Exception as e:
@@ -543,7 +1182,7 @@ async def process_file(request: Request, file_path: str = Form(...)):
 @app.post("/move_to_processing/")
 async def move_to_processing(request: Request, directory: str = Form(...)):
     """
-    Move a specific directory from Archive to Processing and delete all .mp4 files in Processing.
+    Copy a specific directory from Archive to Processing in the background, leaving out all .mp4 files.
     """
     try:
         source = ARCHIVE_DIR / directory
@@ -573,26 +1212,14 @@ async def move_to_processing(request: Request, directory: str = Form(...)):
                 },
             )
 
-        # Copy the directory from Archive to Processing
-        shutil.copytree(source, destination)
-        print(f"Copied '{source}' to '{destination}'")
-
-        # Traverse the Processing directory and delete all .mp4 files
-        for root, dirs, files in os.walk(destination):
-            for file in files:
-                if file.lower().endswith('.mp4'):
-                    file_path = Path(root) / file
-                    try:
-                        file_path.unlink()  # Delete the file
-                        print(f"Deleted video file: {file_path}")
-                    except Exception as e:
-                        print(f"Error deleting file '{file_path}': {e}")
-
-        message = f"Directory '{directory}' has been moved to Processing and all .mp4 files have been deleted."
-        status = "success"
+        # Stage the directory from Archive to Processing; .mp4 files are never read
+        job_id = await run_in_threadpool(job_queue.enqueue, "copy_to_processing", directory=directory, exclude=["*.mp4"])
+        return job_queued_response(
+            request, job_id, f"Moving directory '{directory}' to Processing without its .mp4 files."
+        )
 
     except Exception as e:
-        print(f"Error moving directory '{directory}' to Processing: {e}")
+        logger.error("Error moving directory '%s' to Processing: %s", directory, e)
         message = f"Failed to move directory '{directory}' to Processing. Error: {e}"
         status = "error"
 
@@ -608,7 +1235,7 @@ async def move_to_processing(request: Request, directory: str = Form(...)):
 @app.post("/process_images/")
 async def process_images(request: Request, directory: str = Form(...)):
     """
-    Process images in the specified directory using the PowerShell script.
+    Pixelate images in the specified directory into Processed.
     """
     try:
         # Define source and destination directories
@@ -622,40 +1249,13 @@ async def process_images(request: Request, directory: str = Form(...)):
                 detail=f"Source directory '{source}' does not exist in Processing."
             )
 
-        # Run the PowerShell script
-        process = subprocess.run(
-            [
-                "powershell",
-                "-ExecutionPolicy",
-                "Bypass",
-                "-File",
-                str(TOOLS_DIR / "ProcessPan2vrImages.ps1"),
-                str(source),
-                str(destination),
-            ],
-            capture_output=True,
-            text=True,
-        )
-
-        # Handle errors in the PowerShell script
-        if process.returncode != 0:
-            raise HTTPException(
-                status_code=500,
-                detail=f"PowerShell script failed with error: {process.stderr}"
-            )
-
-        # Return success confirmation
-        return templates.TemplateResponse(
-            "confirmation.html",
-            {
-                "request": request,
-                "status": "success",
-                "message": f"Directory '{directory}' processed successfully.",
-                "output": process.stdout,
-            },
-        )
+        # Run the processing in the background
+        job_id = await run_in_threadpool(job_queue.enqueue, "process_images", directory=directory)
+        return job_queued_response(request, job_id, f"Processing directory '{directory}'.")
+    except HTTPException:
+        raise
     except Exception as e:
-        print(f"Error processing images: {e}")
+        logger.error("Error processing images: %s", e)
         raise HTTPException(
             status_code=500,
             detail=f"An error occurred during image processing: {e}"
@@ -711,7 +1311,7 @@ async def run_powershell(
             },
         )
     except Exception as e:
-        print(f"Error executing PowerShell script: {e}")
+        logger.error("Error executing PowerShell script: %s", e)
         raise HTTPException(status_code=500, detail=f"Error: {e}")
 
 
@@ -728,43 +1328,13 @@ async def process_trekk360(request: Request, directory: str = Form(...)):
                 detail=f"Source directory '{source}' does not exist in Archive.",
             )
 
-        # Copy to Processing folder
-        shutil.copytree(source, destination, dirs_exist_ok=True)
-        print(f"Copied '{source}' to '{destination}'")
-
-        # Execute PowerShell script
-        process = subprocess.run(
-            [
-                "powershell",
-                "-ExecutionPolicy",
-                "Bypass",
-                "-File",
-                str(POWERSHELL_SCRIPT),
-                str(destination),
-                str(P2VR_TEMPLATE),
-            ],
-            capture_output=True,
-            text=True,
-        )
-
-        # Handle PowerShell output
-        if process.returncode != 0:
-            raise HTTPException(
-                status_code=500,
-                detail=f"PowerShell script failed with error: {process.stderr}",
-            )
-
-        return templates.TemplateResponse(
-            "confirmation.html",
-            {
-                "request": request,
-                "status": "success",
-                "message": f"Directory '{directory}' processed successfully.",
-                "output": process.stdout,
-            },
-        )
+        # Copy to Processing folder and process it in the background
+        job_id = await run_in_threadpool(job_queue.enqueue, "process_trekk360", directory=directory)
+        return job_queued_response(request, job_id, f"Processing directory '{directory}'.")
+    except HTTPException:
+        raise
     except Exception as e:
-        print(f"Error processing TREKK360 files: {e}")
+        logger.error("Error processing TREKK360 files: %s", e)
         raise HTTPException(
             status_code=500,
             detail=f"An error occurred during processing: {e}",
@@ -785,66 +1355,34 @@ async def view_processing(request: Request):
             },
         )
     except Exception as e:
-        print(f"Error listing projects in Processing: {e}")
+        logger.error("Error listing projects in Processing: %s", e)
         raise HTTPException(status_code=500, detail="Failed to load processing projects.")
 
 @app.post("/process_project/")
 async def process_project(request: Request, project_name: str = Form(...)):
     """
-    Process a specific project in the Processing folder using the PowerShell script.
+    Process a specific project in the Processing folder.
     """
     try:
         source = PROCESSING_DIR / project_name
         destination = PROCESSED_DIR / project_name
-        script_path = POWERSHELL_SCRIPT.resolve()
-        p2vr_template_path = P2VR_TEMPLATE.resolve()
+        script_path = processing_runner.script_path.resolve()
 
-        print(f"DEBUG: Script Path: {script_path}")
-        print(f"DEBUG: Processing Path: {source}")
-        print(f"DEBUG: Destination Path: {destination}")
-        print(f"DEBUG: P2VR Template Path: {p2vr_template_path}")
+        logger.debug("Script Path: %s, Processing Path: %s, Destination Path: %s", script_path, source, destination)
 
         if not script_path.exists():
             raise HTTPException(
                 status_code=400,
-                detail=f"PowerShell script '{script_path}' does not exist."
+                detail=f"Processing script '{script_path}' does not exist."
             )
 
-        # Run the PowerShell script
-        process = subprocess.run(
-            [
-                "powershell",
-                "-ExecutionPolicy",
-                "Bypass",
-                "-File",
-                str(script_path),
-                str(source),
-                str(destination),
-                str(p2vr_template_path),
-            ],
-            capture_output=True,
-            text=True,
-        )
-
-        # Handle PowerShell script errors
-        if process.returncode != 0:
-            raise HTTPException(
-                status_code=500,
-                detail=f"PowerShell script failed with error: {process.stderr}"
-            )
-
-        # Return confirmation with the output
-        return templates.TemplateResponse(
-            "confirmation.html",
-            {
-                "request": request,
-                "status": "success",
-                "message": f"Project '{project_name}' processed successfully.",
-                "output": process.stdout,
-            },
-        )
+        # Run the processing in the background
+        job_id = await run_in_threadpool(job_queue.enqueue, "process_project", project_name=project_name)
+        return job_queued_response(request, job_id, f"Processing project '{project_name}'.")
+    except HTTPException:
+        raise
     except Exception as e:
-        print(f"Error processing project '{project_name}': {e}")
+        logger.error("Error processing project '%s': %s", project_name, e)
         raise HTTPException(
             status_code=500,
             detail=f"An error occurred while processing project '{project_name}': {e}",
@@ -871,5 +1409,5 @@ async def view_processed(request: Request):
             },
         )
     except Exception as e:
-        print(f"Error listing processed projects: {e}")
+        logger.error("Error listing processed projects: %s", e)
         raise HTTPException(status_code=500, detail="Failed to load processed projects.")
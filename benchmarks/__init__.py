@@ -0,0 +1 @@
+"""Benchmarks for the app's hot paths. Run each module with `python -m benchmarks.<name>`."""
@@ -0,0 +1,91 @@
+"""
+Measure equirectangular-to-cubemap conversion throughput in megapixels per second.
+
+Reports the one-off cost of building a lookup table, the cost of loading it
+from the cache, and the per-image conversion rate for a synthetic panorama at
+each size, both serially and across a process pool.
+
+Usage: python -m benchmarks.bench_cubemap [--sizes 4096x2048 8192x4096] [--images 4] [--workers N]
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+TOOLS_DIR = Path("data/zzz_360_TOOLS")
+sys.path.insert(0, str(TOOLS_DIR))
+
+import numpy as np  # noqa: E402
+from PIL import Image  # noqa: E402
+
+import EquirectToCubemap  # noqa: E402
+
+
+def make_panorama(path, width, height):
+    """Write a synthetic equirectangular JPEG with gradients and noise."""
+    rng = np.random.default_rng(0)
+    gradient = np.linspace(0, 255, width, dtype=np.float32)[None, :, None]
+    pixels = np.clip(gradient + rng.normal(0, 20, (height, width, 3)), 0, 255).astype(np.uint8)
+    Image.fromarray(pixels).save(path, quality=90)
+
+
+def run_size(temp_dir, width, height, images, workers):
+    size = f"{width}x{height}"
+    input_dir = temp_dir / f"in_{size}"
+    input_dir.mkdir()
+    make_panorama(input_dir / "pano_0.jpg", width, height)
+    for index in range(1, images):
+        os.link(input_dir / "pano_0.jpg", input_dir / f"pano_{index}.jpg")
+    lut_cache = temp_dir / "luts"
+    face_size = width // 4
+
+    started = time.perf_counter()
+    EquirectToCubemap.build_lut(width, height, face_size)
+    build_seconds = time.perf_counter() - started
+    EquirectToCubemap.load_lut(width, height, face_size, lut_cache)
+    EquirectToCubemap._luts.clear()
+    started = time.perf_counter()
+    # Touch every page so the timing includes reading the table, not just mapping it
+    np.array(EquirectToCubemap.load_lut(width, height, face_size, lut_cache)["index"]).sum()
+    load_seconds = time.perf_counter() - started
+
+    megapixels = width * height / 1e6 * images
+    result = {"size": size, "images": images, "lut_build_seconds": round(build_seconds, 3),
+              "lut_load_seconds": round(load_seconds, 3)}
+    for label, pool_size in (("serial", 1), ("parallel", workers)):
+        output_dir = temp_dir / f"out_{size}_{label}"
+        started = time.perf_counter()
+        EquirectToCubemap.convert_images(input_dir, output_dir, workers=pool_size, lut_cache=lut_cache)
+        seconds = time.perf_counter() - started
+        result[f"{label}_seconds"] = round(seconds, 3)
+        result[f"{label}_mp_per_second"] = round(megapixels / seconds, 1)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", nargs="+", default=["4096x2048", "8192x4096"])
+    parser.add_argument("--images", type=int, default=4)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--json", help="Also write the results to this file")
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for size in args.sizes:
+            width, height = (int(value) for value in size.split("x"))
+            results.append(run_size(Path(temp_dir), width, height, args.images, args.workers))
+
+    for result in results:
+        print(f"{result['size']:>12}  LUT build {result['lut_build_seconds']:.2f}s, load {result['lut_load_seconds']:.2f}s  "
+              f"serial {result['serial_mp_per_second']:.1f} MP/s  "
+              f"parallel ({args.workers}) {result['parallel_mp_per_second']:.1f} MP/s")
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
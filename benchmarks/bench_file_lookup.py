@@ -0,0 +1,109 @@
+"""
+Compare the old `path LIKE '%date%'` photo lookup (with and without the
+structure index) against the indexed collection_date lookup on a synthetic
+Files table.
+
+Usage: python -m benchmarks.bench_file_lookup [--rows 1000000] [--lookups 200]
+"""
+import argparse
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+from setup_db import setup_database
+
+# The schema before migrations 1 and 2 had no index on Files at all
+BASELINE_QUERY = "SELECT filename, path FROM Files NOT INDEXED WHERE structure_id = ? AND path LIKE ?"
+LIKE_QUERY = "SELECT filename, path FROM Files WHERE structure_id = ? AND path LIKE ?"
+INDEXED_QUERY = "SELECT filename, path FROM Files WHERE structure_id = ? AND collection_date = ?"
+
+
+def populate(conn, rows, files_per_structure):
+    """Fill Projects, Structures and Files with `rows` synthetic file records."""
+    structures = max(1, rows // files_per_structure)
+    dates = [f"202401{day:02d}" for day in range(1, 29)]
+    cursor = conn.cursor()
+    cursor.execute("BEGIN")
+    structure_keys = []
+    for index in range(structures):
+        date = dates[index % len(dates)]
+        project_number = f"P{index // 10:05d}"
+        cursor.execute(
+            "INSERT INTO Projects (project_number, date, crew_initials) VALUES (?, ?, 'AB') "
+            "ON CONFLICT DO NOTHING",
+            (project_number, date),
+        )
+        project_id = cursor.execute(
+            "SELECT id FROM Projects WHERE project_number = ? AND date = ? AND crew_initials = 'AB'",
+            (project_number, date),
+        ).fetchone()[0]
+        cursor.execute(
+            "INSERT INTO Structures (project_id, project_location, structure_id, collection_date) "
+            "VALUES (?, 'SITE', ?, ?)",
+            (project_id, f"S{index:06d}", date),
+        )
+        structure_keys.append((cursor.lastrowid, project_number, f"S{index:06d}", date))
+
+    def file_rows():
+        for structure_db_id, project_number, structure_id, date in structure_keys:
+            folder = f"02_Archive/{project_number}_{date}_AB/SITE_{structure_id}_{date}"
+            for n in range(files_per_structure):
+                filename = f"IMG_{n:05d}.jpg"
+                yield structure_db_id, filename, f"{folder}/{filename}", date
+
+    cursor.executemany(
+        "INSERT INTO Files (structure_id, filename, path, collection_date) VALUES (?, ?, ?, ?)",
+        file_rows(),
+    )
+    cursor.execute("COMMIT")
+    cursor.execute("ANALYZE")
+    return structure_keys
+
+
+def time_lookups(conn, query, params_list):
+    """Return per-lookup durations in milliseconds."""
+    durations = []
+    for params in params_list:
+        started = time.perf_counter()
+        conn.execute(query, params).fetchall()
+        durations.append((time.perf_counter() - started) * 1000)
+    return durations
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--files-per-structure", type=int, default=500)
+    parser.add_argument("--lookups", type=int, default=200)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        database_file = Path(temp_dir) / "bench.db"
+        setup_database(database_file)
+        conn = sqlite3.connect(database_file)
+
+        started = time.perf_counter()
+        structure_keys = populate(conn, args.rows, args.files_per_structure)
+        print(f"Populated {args.rows} file rows in {time.perf_counter() - started:.1f}s")
+
+        sample = random.Random(0).choices(structure_keys, k=args.lookups)
+        like_params = [(s[0], f"%{s[3]}%") for s in sample]
+        for label, query, params_list in (
+            ("path LIKE '%date%', unindexed table", BASELINE_QUERY, like_params[:max(1, args.lookups // 20)]),
+            ("path LIKE '%date%'", LIKE_QUERY, like_params),
+            ("collection_date index", INDEXED_QUERY, [(s[0], s[3]) for s in sample]),
+        ):
+            plan = conn.execute(f"EXPLAIN QUERY PLAN {query}", params_list[0]).fetchall()
+            durations = time_lookups(conn, query, params_list)
+            print(f"{label}:")
+            print(f"  plan: {plan[0][-1]}")
+            print(f"  median {statistics.median(durations):.3f} ms, "
+                  f"p95 {sorted(durations)[int(len(durations) * 0.95) - 1]:.3f} ms")
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Compare wall time and peak RSS of pixelate() and pixelate_fast() on synthetic
+8K and 16K equirectangular JPEGs.
+
+Each measurement runs in a fresh interpreter so its peak RSS is its own.
+Peak RSS comes from the resource module, so this runs on Linux and macOS only.
+
+Usage: python -m benchmarks.bench_pixelate [--sizes 8192x4096 16384x8192] [--repeat 3]
+"""
+import argparse
+import json
+import multiprocessing
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+TOOLS_DIR = Path("data/zzz_360_TOOLS")
+
+# Runs in the child interpreter: argv is tools_dir, function name, image, output
+MEASURE_SCRIPT = """
+import json, resource, sys, time
+from pathlib import Path
+sys.path.insert(0, sys.argv[1])
+import PixelateImages
+fn = getattr(PixelateImages, sys.argv[2])
+started = time.perf_counter()
+_, _, error = fn(Path(sys.argv[3]), Path(sys.argv[4]))
+wall = time.perf_counter() - started
+peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+if sys.platform == "darwin":
+    peak //= 1024  # bytes on macOS, KiB on Linux
+print(json.dumps({"wall_seconds": wall, "peak_rss_mb": peak / 1024, "error": error}))
+"""
+
+
+def make_panorama(path, width, height):
+    """Write a synthetic equirectangular JPEG with smooth gradients and some detail."""
+    from PIL import Image, ImageChops
+
+    Image.MAX_IMAGE_PIXELS = None
+
+    tile = Image.effect_noise((1024, 512), 40)
+    detail = Image.new("L", (width, height))
+    for x in range(0, width, tile.width):
+        for y in range(0, height, tile.height):
+            detail.paste(tile, (x, y))
+    horizontal = Image.linear_gradient("L").rotate(90).resize((width, height))
+    vertical = Image.linear_gradient("L").resize((width, height))
+    red = ImageChops.add(horizontal, detail, scale=2)
+    Image.merge("RGB", (red, vertical, detail)).save(path, quality=90)
+
+
+def measure(function, image_path, output_path):
+    result = subprocess.run(
+        [sys.executable, "-c", MEASURE_SCRIPT, str(TOOLS_DIR), function, str(image_path), str(output_path)],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", nargs="+", default=["8192x4096", "16384x8192"])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--json", help="Also write the results to this file")
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for size in args.sizes:
+            width, height = (int(value) for value in size.split("x"))
+            image_path = Path(temp_dir) / f"pano_{size}.jpg"
+            # Generate in a separate process: children forked from a parent that
+            # held the panorama would report its peak RSS as their own
+            generator = multiprocessing.Process(target=make_panorama, args=(image_path, width, height))
+            generator.start()
+            generator.join()
+            for function in ("pixelate", "pixelate_fast"):
+                runs = [
+                    measure(function, image_path, Path(temp_dir) / f"out_{function}.jpg")
+                    for _ in range(args.repeat)
+                ]
+                best = min(runs, key=lambda run: run["wall_seconds"])
+                result = {
+                    "size": size,
+                    "function": function,
+                    "wall_seconds": round(best["wall_seconds"], 3),
+                    "peak_rss_mb": round(max(run["peak_rss_mb"] for run in runs), 1),
+                    "error": best["error"],
+                }
+                results.append(result)
+                print(f"{size:>12} {function:<14} {result['wall_seconds']:8.3f}s  "
+                      f"peak RSS {result['peak_rss_mb']:8.1f} MB")
+
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
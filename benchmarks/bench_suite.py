@@ -0,0 +1,251 @@
+"""
+Time the app's hot paths on a synthetic workspace and write the results to JSON.
+
+Covers the home page (list_projects), collect_files, a cold catalog scan,
+get_projects_with_sites_and_dates, /upload/, /move_to_processing/ (through to
+the end of its job) and PixelateImages.process_images. Every benchmark runs
+--warmup untimed rounds, then --repeat timed ones; the JSON records each
+duration plus summary statistics, the commit and the dataset, so runs on
+different commits can be compared with --compare.
+
+Usage: python -m benchmarks.bench_suite [--projects 20] [--structures 10] [--images 50]
+           [--repeat 5] [--json results.json] [--compare baseline.json] [--only upload ...]
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import redirect_stdout
+from datetime import datetime, timezone
+from pathlib import Path
+
+from benchmarks.synthetic import REPO_DIR, generate, inside
+
+BENCHMARKS = (
+    "list_projects", "catalog_scan", "collect_files", "collect_files_invalidated",
+    "get_projects_with_sites_and_dates", "upload", "move_to_processing", "process_images",
+)
+
+
+def summarize(durations, **extra):
+    ordered = sorted(durations)
+    result = {
+        "runs": len(durations),
+        "min": ordered[0],
+        "median": statistics.median(ordered),
+        "mean": statistics.fmean(ordered),
+        "max": ordered[-1],
+        "stdev": statistics.stdev(ordered) if len(ordered) > 1 else 0.0,
+        "durations": [round(duration, 6) for duration in durations],
+    }
+    result.update(extra)
+    return {key: round(value, 6) if isinstance(value, float) else value for key, value in result.items()}
+
+
+def timed(fn, repeat, warmup, setup=None):
+    """Run fn warmup + repeat times, calling setup() untimed before each; return the timed durations."""
+    durations = []
+    for round_number in range(warmup + repeat):
+        if setup is not None:
+            setup(round_number)
+        started = time.perf_counter()
+        fn(round_number)
+        elapsed = time.perf_counter() - started
+        if round_number >= warmup:
+            durations.append(elapsed)
+    return durations
+
+
+def wait_for_job(job_queue, job_id, timeout=600):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        status = job_queue.status(job_id)
+        if status["status"] in ("succeeded", "failed"):
+            if status["status"] == "failed":
+                raise RuntimeError(f"Job {job_id} failed: {status['message']}")
+            return status
+        time.sleep(0.005)
+    raise TimeoutError(f"Job {job_id} did not finish in {timeout}s")
+
+
+def run_benchmarks(args, dataset, selected, log):
+    # Imported inside the workspace: the app creates its folders and database relative to the working directory
+    import app as app_module
+    from catalog import FileCatalog
+    from db_manager import get_projects_with_sites_and_dates
+    from fastapi.testclient import TestClient
+
+    sys.path.insert(0, str(REPO_DIR / "data" / "zzz_360_TOOLS"))
+    import PixelateImages
+
+    stage_dir = Path("data") / dataset["stage"]
+    project = dataset["projects"][0]
+    project_files = [path for path in (stage_dir / project).rglob("*") if path.is_file()]
+    project_bytes = sum(path.stat().st_size for path in project_files)
+    upload_payload = project_files[0].read_bytes()
+    results = {}
+
+    def bench(name, fn, setup=None, **extra):
+        if name not in selected:
+            return
+        durations = timed(fn, args.repeat, args.warmup, setup)
+        results[name] = summarize(durations, **extra)
+        log(f"{name:<36} median {results[name]['median'] * 1000:10.2f} ms  "
+            f"min {results[name]['min'] * 1000:10.2f} ms")
+
+    with TestClient(app_module.app) as client:
+        bench("list_projects", lambda _: client.get("/").raise_for_status())
+        bench(
+            "catalog_scan",
+            lambda _: FileCatalog(Path("data"), app_module.STEPS, poll_interval=0).refresh(),
+            files=dataset["files"],
+        )
+        bench("collect_files", lambda _: app_module.collect_files(stage_dir))
+
+        def collect_invalidated(_):
+            app_module.file_catalog.invalidate(stage_dir)
+            app_module.collect_files(stage_dir)
+
+        bench("collect_files_invalidated", collect_invalidated)
+        bench("get_projects_with_sites_and_dates", lambda _: get_projects_with_sites_and_dates(),
+              structures=dataset["structures"])
+
+        def upload(round_number):
+            files = [("files", (f"IMG_{n:05d}.jpg", upload_payload, "image/jpeg")) for n in range(args.upload_files)]
+            form = {
+                "project_number": f"U{round_number:04d}", "collection_date": "20240101", "crew_initials": "BM",
+                "project_location": "BENCH", "structure_id": "S001",
+            }
+            client.post("/upload/", data=form, files=files).raise_for_status()
+
+        upload_bytes = len(upload_payload) * args.upload_files
+        bench("upload", upload, files=args.upload_files, bytes=upload_bytes)
+        if "upload" in results:
+            results["upload"]["mb_per_second"] = round(upload_bytes / results["upload"]["median"] / 1e6, 2)
+
+        processing_copy = Path("data/03_Processing") / project
+
+        def move(_):
+            response = client.post(
+                "/move_to_processing/", data={"directory": project}, headers={"accept": "application/json"}
+            )
+            response.raise_for_status()
+            wait_for_job(app_module.job_queue, response.json()["job_id"])
+
+        bench("move_to_processing", move, setup=lambda _: shutil.rmtree(processing_copy, ignore_errors=True),
+              files=len(project_files), bytes=project_bytes)
+
+        output_dir = Path(tempfile.mkdtemp(prefix="pixelated_", dir="."))
+        bench(
+            "process_images",
+            lambda _: PixelateImages.process_images(stage_dir / project, output_dir, workers=args.workers, force=True),
+            files=len(project_files), bytes=project_bytes, workers=args.workers,
+        )
+        if "process_images" in results:
+            results["process_images"]["images_per_second"] = round(
+                len(project_files) / results["process_images"]["median"], 2
+            )
+    return results
+
+
+def git_commit():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=REPO_DIR, capture_output=True, text=True, check=True)
+        dirty = subprocess.run(["git", "status", "--porcelain"], cwd=REPO_DIR, capture_output=True, text=True)
+        return commit.stdout.strip(), bool(dirty.stdout.strip())
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+
+
+def compare(results, baseline_path, log):
+    """Print the change in median time of each benchmark against an earlier run's JSON."""
+    baseline = json.loads(Path(baseline_path).read_text())
+    log(f"Compared with {baseline_path} ({(baseline.get('commit') or 'unknown')[:12]}):")
+    for name, result in results.items():
+        before = baseline["results"].get(name)
+        if before is None:
+            log(f"  {name:<36} new")
+            continue
+        change = (result["median"] - before["median"]) / before["median"] * 100 if before["median"] else 0.0
+        log(f"  {name:<36} {before['median'] * 1000:10.2f} ms -> {result['median'] * 1000:10.2f} ms  "
+            f"{change:+7.1f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--projects", type=int, default=20)
+    parser.add_argument("--structures", type=int, default=10)
+    parser.add_argument("--images", type=int, default=50)
+    parser.add_argument("--image-size", default="1024x512")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--upload-files", type=int, default=10)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="Processes for process_images")
+    parser.add_argument("--only", nargs="+", choices=BENCHMARKS, help="Run just these benchmarks")
+    parser.add_argument("--workspace", help="Build the workspace here and keep it (default: a temporary folder)")
+    parser.add_argument("--json", help="Write the results to this file")
+    parser.add_argument("--compare", help="Results JSON of an earlier run to compare medians with")
+    parser.add_argument("--verbose", action="store_true", help="Show the app's own output")
+    args = parser.parse_args()
+
+    real_stdout = sys.stdout
+
+    def log(line):
+        print(line, file=real_stdout, flush=True)
+
+    width, height = (int(value) for value in args.image_size.split("x"))
+    temp_dir = None
+    if args.workspace:
+        workspace = Path(args.workspace).resolve()
+        if workspace.exists() and any(workspace.iterdir()):
+            parser.error(f"Workspace {workspace} is not empty")
+        workspace.mkdir(parents=True, exist_ok=True)
+    else:
+        temp_dir = tempfile.TemporaryDirectory(prefix="bench_suite_")
+        workspace = Path(temp_dir.name)
+
+    # Resolved before changing directory, so relative paths mean what the user typed
+    json_path = Path(args.json).resolve() if args.json else None
+    compare_path = Path(args.compare).resolve() if args.compare else None
+
+    try:
+        with inside(workspace), open(os.devnull, "w") as devnull, \
+                redirect_stdout(real_stdout if args.verbose else devnull):
+            dataset = generate(workspace, args.projects, args.structures, args.images,
+                               image_size=(width, height), seed=args.seed)
+            log(f"Generated {dataset['files']} files in {dataset['structures']} structures "
+                f"in {dataset['seconds']}s")
+            results = run_benchmarks(args, dataset, set(args.only or BENCHMARKS), log)
+    finally:
+        if temp_dir is not None:
+            temp_dir.cleanup()
+
+    commit, dirty = git_commit()
+    report = {
+        "commit": commit,
+        "dirty": dirty,
+        "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "params": {key: value for key, value in vars(args).items() if key not in ("json", "compare", "verbose")},
+        "dataset": {key: value for key, value in dataset.items() if key != "projects"},
+        "results": results,
+    }
+    if json_path:
+        json_path.write_text(json.dumps(report, indent=2))
+        log(f"Wrote {json_path}")
+    if compare_path:
+        compare(results, compare_path, log)
+
+
+if __name__ == "__main__":
+    main()
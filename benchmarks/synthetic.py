@@ -0,0 +1,155 @@
+"""
+Build a synthetic workspace for the benchmarks: a data/ tree of N projects x
+M structures x K images in the real layout, with matching data.db rows.
+
+    data/<stage>/{project}_{date}_{crew}/{location}_{structure}_{date}/IMG_00001.jpg
+
+The templates, static files and zzz_360_TOOLS are linked in from the
+repository, so the app can be imported with the workspace as its working
+directory. Output is the same for the same arguments and seed.
+
+Usage: python -m benchmarks.synthetic <workspace> [--projects 20] [--structures 10] [--images 50]
+"""
+import argparse
+import io
+import os
+import random
+import sys
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+LOCATIONS = ("BRIDGE", "CULVERT", "DAM", "PIER", "TUNNEL", "WALL")
+CREWS = ("AB", "CD", "EF", "GH")
+# Distinct images encoded up front; files reuse their bytes so generation is disk-bound
+IMAGE_VARIANTS = 8
+
+
+def encode_images(width, height, seed):
+    """JPEG bytes for IMAGE_VARIANTS synthetic panoramas: gradients plus noise, like a real scene compresses."""
+    from PIL import Image, ImageChops
+
+    rng = random.Random(seed)
+    images = []
+    for _ in range(IMAGE_VARIANTS):
+        noise = Image.effect_noise((width, height), rng.randint(20, 60))
+        horizontal = Image.linear_gradient("L").rotate(rng.choice((90, 270))).resize((width, height))
+        vertical = Image.linear_gradient("L").resize((width, height))
+        red = ImageChops.add(horizontal, noise, scale=2)
+        buffer = io.BytesIO()
+        Image.merge("RGB", (red, vertical, noise)).save(buffer, format="JPEG", quality=85)
+        images.append(buffer.getvalue())
+    return images
+
+
+def project_layout(projects, structures, images, seed=0):
+    """
+    Yield (project_number, date, crew, location, structure_id, filenames) per
+    structure, with dates and names spread like real collections.
+    """
+    rng = random.Random(seed)
+    for p in range(projects):
+        project_number = f"{24000 + p:05d}"
+        date = f"2024{rng.randint(1, 12):02d}{rng.randint(1, 28):02d}"
+        crew = rng.choice(CREWS)
+        for s in range(structures):
+            location = rng.choice(LOCATIONS)
+            structure_id = f"S{s + 1:03d}"
+            filenames = [f"IMG_{n + 1:05d}.jpg" for n in range(images)]
+            yield project_number, date, crew, location, structure_id, filenames
+
+
+def link_repo_files(workspace: Path):
+    """Link what the app needs from the repository into a workspace."""
+    (workspace / "data").mkdir(parents=True, exist_ok=True)
+    for name in ("templates", "static"):
+        if not (workspace / name).exists():
+            os.symlink(REPO_DIR / name, workspace / name)
+    tools = workspace / "data" / "zzz_360_TOOLS"
+    if not tools.exists():
+        os.symlink(REPO_DIR / "data" / "zzz_360_TOOLS", tools)
+
+
+@contextmanager
+def inside(workspace: Path):
+    """Run the block with the workspace as working directory and the repository importable."""
+    previous = os.getcwd()
+    if str(REPO_DIR) not in sys.path:
+        sys.path.insert(0, str(REPO_DIR))
+    os.chdir(workspace)
+    try:
+        yield
+    finally:
+        os.chdir(previous)
+
+
+def generate(workspace: Path, projects=20, structures=10, images=50, stage="02_Archive",
+             image_size=(1024, 512), seed=0):
+    """
+    Populate workspace/data/<stage> and workspace/data/data.db. Must run
+    inside(workspace). Returns a dict describing what was generated.
+    """
+    from db_manager import insert_upload_records
+    from setup_db import setup_database
+
+    link_repo_files(workspace)
+    setup_database()
+    variants = encode_images(*image_size, seed)
+    stage_dir = Path("data") / stage
+
+    started = time.perf_counter()
+    files = 0
+    total_bytes = 0
+    project_folders = set()
+    for index, (project_number, date, crew, location, structure_id, filenames) in enumerate(
+        project_layout(projects, structures, images, seed)
+    ):
+        project_folder = f"{project_number}_{date}_{crew}"
+        folder = stage_dir / project_folder / f"{location}_{structure_id}_{date}"
+        folder.mkdir(parents=True, exist_ok=True)
+        project_folders.add(project_folder)
+        rows = []
+        for n, filename in enumerate(filenames):
+            data = variants[(index + n) % len(variants)]
+            (folder / filename).write_bytes(data)
+            rows.append((filename, str(folder / filename)))
+            total_bytes += len(data)
+        insert_upload_records(project_number, date, crew, location, structure_id, rows)
+        files += len(rows)
+
+    return {
+        "stage": stage,
+        "projects": sorted(project_folders),
+        "structures": projects * structures,
+        "files": files,
+        "bytes": total_bytes,
+        "image_size": f"{image_size[0]}x{image_size[1]}",
+        "seconds": round(time.perf_counter() - started, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("workspace")
+    parser.add_argument("--projects", type=int, default=20)
+    parser.add_argument("--structures", type=int, default=10)
+    parser.add_argument("--images", type=int, default=50)
+    parser.add_argument("--stage", default="02_Archive")
+    parser.add_argument("--image-size", default="1024x512")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    workspace = Path(args.workspace).resolve()
+    workspace.mkdir(parents=True, exist_ok=True)
+    width, height = (int(value) for value in args.image_size.split("x"))
+    with inside(workspace):
+        summary = generate(workspace, args.projects, args.structures, args.images, args.stage,
+                           (width, height), args.seed)
+    print(f"Generated {summary['files']} files ({summary['bytes']} bytes) in "
+          f"{summary['structures']} structures under {workspace / 'data' / args.stage} "
+          f"in {summary['seconds']}s")
+
+
+if __name__ == "__main__":
+    main()
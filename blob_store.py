@@ -0,0 +1,197 @@
+import logging
+import os
+from collections import Counter
+from pathlib import Path
+
+from config import BLOB_STORE_DIR
+from db_manager import (
+    get_blob_ref,
+    get_blob_refs,
+    set_blob_ref,
+    delete_blob_refs,
+    get_unreferenced_blobs,
+    delete_blob,
+    get_blob_totals,
+)
+from hash_index import file_sha256
+
+logger = logging.getLogger(__name__)
+
+
+def replace_with_link(target, path):
+    """Atomically make path a hardlink to target."""
+    temp_path = path.with_name(f".{path.name}.{os.getpid()}.link")
+    try:
+        os.unlink(temp_path)
+    except FileNotFoundError:
+        pass
+    os.link(target, temp_path)
+    os.replace(temp_path, path)
+
+
+class BlobStore:
+    """
+    Content-addressed store for the files in the stage folders.
+
+    Every distinct file content is kept once, as data/.blobs/<ab>/<sha256>, and
+    the files in the stage folders are hardlinks to it. The BlobRefs table maps
+    each stage path to its blob and Blobs.refcount counts those paths, so a blob
+    can be removed by gc() once nothing refers to it.
+
+    Because stage files share an inode with their blob, tools must write new
+    files rather than edit a stage file in place; the processing scripts only
+    ever write to 04_Processed, which is not deduplicated.
+    """
+
+    def __init__(self, base_dir: Path, blob_dir=BLOB_STORE_DIR):
+        self.base_dir = Path(base_dir)
+        self.blob_dir = Path(blob_dir)
+
+    def blob_path(self, sha256):
+        return self.blob_dir / sha256[:2] / sha256
+
+    def ref_path(self, path: Path):
+        """Key of a stage file in BlobRefs: its path relative to base_dir, with forward slashes."""
+        return Path(path).relative_to(self.base_dir).as_posix()
+
+    def _known_blob(self, path, st):
+        """Return the sha256 of path if it is still the blob recorded for it, without reading it."""
+        ref = get_blob_ref(self.ref_path(path))
+        if ref is None or ref["size"] != st.st_size or ref["mtime_ns"] != st.st_mtime_ns:
+            return None
+        try:
+            blob_stat = self.blob_path(ref["sha256"]).stat()
+        except FileNotFoundError:
+            return None
+        if (blob_stat.st_dev, blob_stat.st_ino) != (st.st_dev, st.st_ino):
+            return None
+        return ref["sha256"]
+
+    def ingest_file(self, path: Path):
+        """
+        Move a stage file's content into the store and replace the file with a
+        link to it. Files already linked to their recorded blob are recognised
+        from a stat and are not read again. Returns (sha256, deduplicated),
+        where deduplicated is True if an identical blob already existed.
+        """
+        path = Path(path)
+        st = path.stat()
+        sha256 = self._known_blob(path, st)
+        if sha256 is not None:
+            return sha256, False
+
+        sha256 = file_sha256(path)
+        blob = self.blob_path(sha256)
+        blob.parent.mkdir(parents=True, exist_ok=True)
+        deduplicated = False
+        try:
+            os.link(path, blob)
+        except FileExistsError:
+            if not os.path.samefile(blob, path):
+                replace_with_link(blob, path)
+                deduplicated = True
+        st = path.stat()
+        set_blob_ref(self.ref_path(path), sha256, st.st_size, st.st_mtime_ns)
+        return sha256, deduplicated
+
+    def ingest_tree(self, directory: Path, progress=None):
+        """
+        Ingest every file under a stage directory. If given, progress is driven
+        like in staging.stage_tree. Returns (files, bytes) freed by deduplication.
+        """
+        plan = []
+        for root, dirs, files in os.walk(directory):
+            dirs[:] = [name for name in dirs if not name.startswith(".")]
+            plan.extend(Path(root) / name for name in files if not name.startswith("."))
+        if progress is not None:
+            progress.set_totals(files=len(plan), bytes=sum(path.stat().st_size for path in plan))
+
+        files_freed = 0
+        bytes_freed = 0
+        for path in plan:
+            size = path.stat().st_size
+            _, deduplicated = self.ingest_file(path)
+            if deduplicated:
+                files_freed += 1
+                bytes_freed += size
+            if progress is not None:
+                progress.advance(files=1, bytes=size)
+        logger.info("Deduplicated %d files (%d bytes) under '%s'", files_freed, bytes_freed, directory)
+        return files_freed, bytes_freed
+
+    def link_file(self, src: Path, dst: Path):
+        """
+        Make dst another name for src's blob, ingesting src first if needed.
+        For a file already in the store this only creates a link and a row.
+        """
+        sha256, _ = self.ingest_file(src)
+        dst.parent.mkdir(parents=True, exist_ok=True)
+        replace_with_link(self.blob_path(sha256), dst)
+        st = dst.stat()
+        set_blob_ref(self.ref_path(dst), sha256, st.st_size, st.st_mtime_ns)
+
+    def link_blob(self, sha256, dst: Path):
+        """Make dst another name for the blob with this hash; returns False if the store has no such blob."""
+        blob = self.blob_path(sha256)
+        if not blob.exists():
+            return False
+        dst.parent.mkdir(parents=True, exist_ok=True)
+        replace_with_link(blob, dst)
+        st = dst.stat()
+        set_blob_ref(self.ref_path(dst), sha256, st.st_size, st.st_mtime_ns)
+        return True
+
+    def gc(self, dry_run=False):
+        """
+        Drop references whose stage file is gone or no longer linked to its
+        blob, then delete blobs nothing refers to. A blob file with other
+        hardlinks outside the store's knowledge is kept. Returns (blobs, bytes)
+        removed, or that would be removed with dry_run.
+        """
+        stale = []
+        for ref in get_blob_refs():
+            try:
+                st = (self.base_dir / ref["path"]).stat()
+                blob_stat = self.blob_path(ref["sha256"]).stat()
+            except FileNotFoundError:
+                stale.append(ref)
+                continue
+            if (st.st_dev, st.st_ino) != (blob_stat.st_dev, blob_stat.st_ino):
+                stale.append(ref)
+        if stale and not dry_run:
+            delete_blob_refs([ref["path"] for ref in stale])
+        logger.info("Blob GC: %d stale references", len(stale))
+
+        # A dry run keeps the stale references, so blobs only they refer to are counted as if they were dropped
+        dropped = Counter(ref["sha256"] for ref in stale) if dry_run else None
+        blobs_removed = 0
+        bytes_removed = 0
+        for blob in get_unreferenced_blobs(dropped):
+            blob_file = self.blob_path(blob["sha256"])
+            try:
+                if blob_file.stat().st_nlink > 1:
+                    continue
+                if not dry_run:
+                    blob_file.unlink()
+                    try:
+                        blob_file.parent.rmdir()  # Only succeeds once the fan-out folder is empty
+                    except OSError:
+                        pass
+            except FileNotFoundError:
+                pass
+            if not dry_run:
+                delete_blob(blob["sha256"])
+            blobs_removed += 1
+            bytes_removed += blob["size"]
+        logger.info("Blob GC: %s %d blobs (%d bytes)", "would remove" if dry_run else "removed", blobs_removed, bytes_removed)
+        return blobs_removed, bytes_removed
+
+    def stats(self):
+        blobs, stored_bytes, referenced_bytes = get_blob_totals()
+        return {
+            "blobs": blobs,
+            "stored_bytes": stored_bytes,
+            "referenced_bytes": referenced_bytes,
+            "saved_bytes": referenced_bytes - stored_bytes,
+        }
+
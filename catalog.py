@@ -0,0 +1,397 @@
+import logging
+import os
+import threading
+from bisect import bisect_right
+from collections import namedtuple
+
+logger = logging.getLogger(__name__)
+
+# What the listing templates need for each file: file.filename and file.path (relative to data/)
+FileEntry = namedtuple("FileEntry", ["filename", "path"])
+
+
+class DirNode:
+    """
+    A directory in the catalog: its mtime when last listed, file names, their
+    total size and child directories, with their names sorted for paging.
+    """
+
+    __slots__ = ("rel_path", "mtime_ns", "files", "size", "dirs", "dir_names")
+
+    def __init__(self, rel_path):
+        self.rel_path = rel_path  # POSIX path relative to the catalog's base directory
+        self.mtime_ns = None
+        self.files = ()
+        self.size = 0
+        self.dirs = {}
+        self.dir_names = ()
+
+
+class FileCatalog:
+    """
+    In-memory tree of the stage folders, scanned once and then kept current.
+
+    A directory is only re-listed when its mtime changes (an entry was added,
+    removed or renamed in it). refresh() re-checks every known directory and is
+    run periodically by a background poller; invalidate() re-checks just the
+    paths an app route has changed. Listing views are cached per stage until
+    that stage changes.
+    """
+
+    def __init__(self, base_dir, stages, poll_interval=30):
+        self.base_dir = str(base_dir)
+        self.stages = list(stages)
+        self.poll_interval = poll_interval
+        self._roots = {stage: DirNode(stage) for stage in self.stages}
+        self._generation = {stage: 0 for stage in self.stages}
+        self._views = {}
+        self._scanned = False
+        self._lock = threading.RLock()
+        # One refresh() reads the disk at a time; it takes _lock only to apply what changed
+        self._refresh_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._watcher = None
+
+    # --- Scanning ---
+    def _read_dir(self, rel_path):
+        """A directory's (file names, their total size, directory names), sorted; None if it no longer exists."""
+        files = []
+        size = 0
+        dirs = []
+        try:
+            with os.scandir(os.path.join(self.base_dir, rel_path)) as entries:
+                for entry in entries:
+                    if entry.name.startswith("."):
+                        continue  # In-flight uploads and tool bookkeeping files
+                    if entry.is_dir():
+                        dirs.append(entry.name)
+                    elif entry.is_file():
+                        files.append(entry.name)
+                        try:
+                            size += entry.stat().st_size
+                        except FileNotFoundError:
+                            pass
+        except (FileNotFoundError, NotADirectoryError):
+            return None
+        return tuple(sorted(files)), size, sorted(dirs)
+
+    def _apply(self, node, listing, mtime_ns):
+        """Set node's entries from a _read_dir listing, keeping known child nodes. Returns the new children."""
+        files, size, dir_names = listing
+        new_children = []
+        dirs = {}
+        for name in dir_names:
+            child = node.dirs.get(name)
+            if child is None:
+                child = DirNode(f"{node.rel_path}/{name}")
+                new_children.append(child)
+            dirs[name] = child
+        node.files = files
+        node.size = size
+        node.dirs = dirs
+        node.dir_names = tuple(dir_names)
+        node.mtime_ns = mtime_ns
+        return new_children
+
+    def _list(self, node, mtime_ns):
+        """Re-list node's entries, keeping known child nodes. Returns False if it no longer exists."""
+        listing = self._read_dir(node.rel_path)
+        if listing is None:
+            return False
+        self._apply(node, listing, mtime_ns)
+        return True
+
+    def _scan(self, node, only_new=False):
+        """
+        Bring node and its subtree up to date.
+
+        Returns True if anything changed, False if nothing did, and None if the
+        directory no longer exists. With only_new, children that have been listed
+        before are not re-checked.
+        """
+        try:
+            mtime_ns = os.stat(os.path.join(self.base_dir, node.rel_path)).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+        changed = False
+        if mtime_ns != node.mtime_ns:
+            if not self._list(node, mtime_ns):
+                return None
+            changed = True
+
+        for name, child in list(node.dirs.items()):
+            if only_new and child.mtime_ns is not None:
+                continue
+            result = self._scan(child)
+            if result is None:
+                del node.dirs[name]
+                node.dir_names = tuple(node.dirs)
+                changed = True
+            elif result:
+                changed = True
+        return changed
+
+    def _scan_stage(self, stage, node):
+        result = self._scan(node)
+        if result is None:
+            # Stage folder is missing; show it as empty until it reappears
+            self._roots[stage] = DirNode(stage)
+            result = True
+        if result:
+            self._generation[stage] += 1
+
+    def refresh(self):
+        """
+        Re-check every stage and re-list the directories whose mtime changed.
+
+        After the first scan the disk is read without holding the lock, so
+        listings keep being served from the previous state meanwhile; the lock
+        is only taken to collect the directories to check and to apply what
+        changed. Directories that appeared are checked in a further round.
+        """
+        with self._refresh_lock:
+            with self._lock:
+                if not self._scanned:
+                    for stage in self.stages:
+                        self._scan_stage(stage, self._roots[stage])
+                    self._scanned = True
+                    return
+                pending = []
+                for stage in self.stages:
+                    nodes = [(None, None, self._roots[stage])]
+                    while nodes:
+                        parent, name, node = nodes.pop()
+                        pending.append((stage, parent, name, node, node.mtime_ns))
+                        nodes.extend((node, child_name, child) for child_name, child in node.dirs.items())
+
+            while pending:
+                changes = []
+                for stage, parent, name, node, known_mtime_ns in pending:
+                    try:
+                        mtime_ns = os.stat(os.path.join(self.base_dir, node.rel_path)).st_mtime_ns
+                    except FileNotFoundError:
+                        changes.append((stage, parent, name, node, known_mtime_ns, None, None))
+                        continue
+                    if mtime_ns != known_mtime_ns:
+                        listing = self._read_dir(node.rel_path)
+                        changes.append((stage, parent, name, node, known_mtime_ns, mtime_ns, listing))
+
+                pending = []
+                changed_stages = set()
+                with self._lock:
+                    for stage, parent, name, node, known_mtime_ns, mtime_ns, listing in changes:
+                        if node.mtime_ns != known_mtime_ns:
+                            continue  # invalidate() re-listed it meanwhile
+                        changed_stages.add(stage)
+                        if listing is None:
+                            if parent is None:
+                                if self._roots[stage] is node:
+                                    # Stage folder is missing; show it as empty until it reappears
+                                    self._roots[stage] = DirNode(stage)
+                            elif parent.dirs.get(name) is node:
+                                del parent.dirs[name]
+                                parent.dir_names = tuple(parent.dirs)
+                            continue
+                        for child in self._apply(node, listing, mtime_ns):
+                            pending.append((stage, node, child.rel_path.rsplit("/", 1)[1], child, None))
+                    for stage in changed_stages:
+                        self._generation[stage] += 1
+
+    def _ensure_scanned(self):
+        if not self._scanned:
+            self.refresh()
+
+    def invalidate(self, *paths):
+        """
+        Re-list the given paths (absolute or relative to the working directory).
+
+        Called by routes that move, copy or write files so the result shows up
+        without waiting for the next poll. Only the path, its parent and any
+        newly created directories are listed again.
+        """
+        base = os.path.abspath(self.base_dir)
+        with self._lock:
+            if not self._scanned:
+                return  # The first listing will do a full scan anyway
+            for path in paths:
+                rel_path = os.path.relpath(os.path.abspath(path), base).replace(os.sep, "/")
+                parts = rel_path.split("/")
+                stage = parts[0]
+                if stage not in self._roots:
+                    continue
+
+                # Walk to the deepest catalogued directory on the path
+                parent = None
+                node = self._roots[stage]
+                for part in parts[1:]:
+                    if part not in node.dirs:
+                        break
+                    parent, node = node, node.dirs[part]
+
+                if parent is None and node.rel_path == rel_path:
+                    # A whole stage
+                    self._scan_stage(stage, node)
+                    continue
+                if node.rel_path == rel_path:
+                    # A known directory: re-check its subtree, and its parent in case it moved away
+                    node.mtime_ns = None
+                    node = parent
+                # Otherwise the path is new: list its closest known ancestor to pick it up
+                node.mtime_ns = None
+                self._scan(node, only_new=True)
+                self._generation[stage] += 1
+
+    # --- Background polling ---
+    def start_watcher(self):
+        """Start a daemon thread that calls refresh() every poll_interval seconds."""
+        if self._watcher is not None or self.poll_interval <= 0:
+            return
+        self._stop.clear()
+        self._watcher = threading.Thread(target=self._poll, name="file-catalog-watcher", daemon=True)
+        self._watcher.start()
+
+    def stop_watcher(self):
+        self._stop.set()
+        if self._watcher is not None:
+            self._watcher.join(timeout=5)
+            self._watcher = None
+
+    def _poll(self):
+        while not self._stop.is_set():
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.exception("Error refreshing file catalog: %s", e)
+            self._stop.wait(self.poll_interval)
+
+    # --- Views ---
+    def _files_under(self, node, recursive):
+        entries = [FileEntry(name, f"{node.rel_path}/{name}") for name in node.files]
+        if recursive:
+            for child in node.dirs.values():
+                entries.extend(self._files_under(child, recursive))
+        return entries
+
+    def _cached_view(self, kind, stage, build):
+        with self._lock:
+            self._ensure_scanned()
+            generation = self._generation[stage]
+            cached = self._views.get((kind, stage))
+            if cached is not None and cached[0] == generation:
+                return cached[1]
+            view = build(self._roots[stage])
+            self._views[(kind, stage)] = (generation, view)
+            return view
+
+    def files_by_project(self, stage):
+        """{project: {site: [FileEntry, ...]}} for one stage; files directly in a project use the "" site."""
+        def build(root):
+            projects = {}
+            for project_name, project in root.dirs.items():
+                sites = {
+                    site_name: self._files_under(site, recursive=False)
+                    for site_name, site in project.dirs.items()
+                }
+                if project.files:
+                    sites[""] = self._files_under(project, recursive=False)
+                projects[project_name] = sites
+            return projects
+
+        return self._cached_view("by_project", stage, build)
+
+    def stage_totals(self):
+        """
+        {stage: (files, bytes)} from the in-memory tree; only stages that changed
+        are counted again. Sizes are as of each directory's last listing.
+        """
+        def build(root):
+            files = 0
+            size = 0
+            nodes = [root]
+            while nodes:
+                node = nodes.pop()
+                files += len(node.files)
+                size += node.size
+                nodes.extend(node.dirs.values())
+            return files, size
+
+        return {stage: self._cached_view("totals", stage, build) for stage in self.stages}
+
+    def _find(self, rel_path):
+        parts = rel_path.split("/")
+        node = self._roots.get(parts[0])
+        for part in parts[1:]:
+            if node is None:
+                return None
+            node = node.dirs.get(part)
+        return node
+
+    def list_dir(self, rel_path="", cursor=None, limit=100, query=None):
+        """
+        One page of a directory's children: sub-directories first, then files.
+
+        rel_path "" lists the stages. Pages are keyed on the last name returned
+        (cursor "d:<name>" or "f:<name>"), so without a query a page costs the
+        same however many entries the directory holds. query keeps only names
+        containing it (case-insensitive), which scans every name. Returns None
+        if the directory is not catalogued.
+        """
+        with self._lock:
+            self._ensure_scanned()
+            if not rel_path:
+                children = self._roots
+                dir_names = self.stages  # Pipeline order, listed in full
+                file_names = ()
+                cursor = None
+            else:
+                node = self._find(rel_path)
+                if node is None:
+                    return None
+                children = node.dirs
+                dir_names = node.dir_names
+                file_names = node.files
+
+            if query:
+                query = query.lower()
+                dir_names = [name for name in dir_names if query in name.lower()]
+                file_names = [name for name in file_names if query in name.lower()]
+
+            kind, _, after = (cursor or "").partition(":")
+            dir_start = 0
+            file_start = 0
+            if kind == "d":
+                dir_start = bisect_right(dir_names, after)
+            elif kind == "f":
+                dir_start = len(dir_names)
+                file_start = bisect_right(file_names, after)
+
+            items = []
+            for name in dir_names[dir_start:dir_start + limit]:
+                child = children[name]
+                items.append({
+                    "type": "dir",
+                    "name": name,
+                    "path": child.rel_path,
+                    "dirs": len(child.dirs),
+                    "files": len(child.files),
+                })
+            dir_end = dir_start + len(items)
+            file_end = file_start
+            if len(items) < limit:
+                for name in file_names[file_start:file_start + limit - len(items)]:
+                    items.append({"type": "file", "name": name, "path": f"{rel_path}/{name}"})
+                file_end = file_start + len(items) - (dir_end - dir_start)
+
+            next_cursor = None
+            if rel_path and (dir_end < len(dir_names) or file_end < len(file_names)):
+                last = items[-1]
+                next_cursor = f"{last['type'][0]}:{last['name']}"
+
+            return {
+                "path": rel_path,
+                "dirs_total": len(dir_names),
+                "files_total": len(file_names),
+                "items": items,
+                "next_cursor": next_cursor,
+            }
@@ -0,0 +1,102 @@
+import os
+
+# Size of each chunk read from an uploaded file and written to disk
+UPLOAD_CHUNK_SIZE = int(os.environ.get("UPLOAD_CHUNK_SIZE", 1024 * 1024))
+
+# SQLite connection settings applied to every pooled connection
+DB_SYNCHRONOUS = os.environ.get("DB_SYNCHRONOUS", "NORMAL")
+DB_CACHE_SIZE_KB = int(os.environ.get("DB_CACHE_SIZE_KB", 64 * 1024))
+DB_BUSY_TIMEOUT_MS = int(os.environ.get("DB_BUSY_TIMEOUT_MS", 5000))
+
+# Seconds between background re-checks of the stage folders by the file catalog (0 disables polling)
+CATALOG_POLL_SECONDS = float(os.environ.get("CATALOG_POLL_SECONDS", 30))
+
+# Entries per page returned by the /api/tree/ listing endpoints
+TREE_PAGE_SIZE = int(os.environ.get("TREE_PAGE_SIZE", 200))
+TREE_MAX_PAGE_SIZE = 1000
+
+# Background jobs: how many run at once, and how often their progress is written to the database
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", 2))
+JOB_PROGRESS_FLUSH_SECONDS = float(os.environ.get("JOB_PROGRESS_FLUSH_SECONDS", 1.0))
+
+# Staging from Archive to Processing: "clone" uses reflinks or copy_file_range where the filesystem
+# allows, "hardlink" also shares the archived files' inodes (only safe if nothing edits them in place),
+# "blob" links both copies to one file in the content-addressed store (see blob_store.py),
+# and "copy" always copies bytes
+STAGING_LINK_MODE = os.environ.get("STAGING_LINK_MODE", "clone")
+STAGING_COPY_WORKERS = int(os.environ.get("STAGING_COPY_WORKERS", 4))
+STAGING_CHUNK_SIZE = int(os.environ.get("STAGING_CHUNK_SIZE", 8 * 1024 * 1024))
+
+# Content-addressed store the stage folders' files are hardlinked into; must be on the same filesystem as data/
+BLOB_STORE_DIR = os.environ.get("BLOB_STORE_DIR", "data/.blobs")
+
+# Thumbnails served by /thumb/: where they are cached, the cache's size cap, the widths that may be
+# requested (others round up to the next one), JPEG/WebP quality and how many are generated at once
+THUMB_CACHE_DIR = os.environ.get("THUMB_CACHE_DIR", "data/.thumbs")
+THUMB_CACHE_MAX_MB = int(os.environ.get("THUMB_CACHE_MAX_MB", 512))
+THUMB_WIDTHS = (160, 320, 640, 1280)
+THUMB_QUALITY = int(os.environ.get("THUMB_QUALITY", 80))
+THUMB_WORKERS = int(os.environ.get("THUMB_WORKERS", 2))
+
+# Cache-Control sent for files served from data/, by stage folder; other paths get DATA_CACHE_CONTROL_DEFAULT
+DATA_CACHE_CONTROL = {
+    "02_Archive": "public, max-age=604800",
+    "04_Processed": "public, max-age=3600",
+    "05_Uploaded": "public, max-age=3600",
+    "06_VideosNeedProcessed": "public, max-age=86400",
+    "07_Uploaded_3D": "public, max-age=3600",
+}
+DATA_CACHE_CONTROL_DEFAULT = "no-cache"
+# Files up to this size are hashed for their ETag while the request waits; larger ones are hashed in the background
+DATA_ETAG_INLINE_MAX_MB = int(os.environ.get("DATA_ETAG_INLINE_MAX_MB", 64))
+DATA_CHUNK_SIZE = int(os.environ.get("DATA_CHUNK_SIZE", 1024 * 1024))
+
+# Deep Zoom tile pyramids built from 04_Processed, mirroring its folders, and how long browsers may cache tiles
+TILES_DIR = os.environ.get("TILES_DIR", "data/.tiles")
+TILE_CACHE_CONTROL = "public, max-age=86400"
+
+# Pixelation in the processing jobs: "python" runs PixelateImages in a pool of PROCESSING_WORKERS
+# processes kept by the app, "powershell" runs ProcessPan2vrImages.ps1 for every job as before (Windows only)
+PROCESSING_BACKEND = os.environ.get("PROCESSING_BACKEND", "python")
+PROCESSING_WORKERS = int(os.environ.get("PROCESSING_WORKERS", os.cpu_count() or 1))
+# "1" pixelates with PixelateImages.pixelate_fast: draft-mode decode and a strip-wise upscale, using less memory
+# on large panoramas, but JPEG output is not byte-identical to the default
+PIXELATE_FAST = os.environ.get("PIXELATE_FAST", "0") == "1"
+
+# Live job progress at /jobs/<id>/events: how often a job is sampled (at most one progress event per interval,
+# however many files it handles), how often an idle stream sends a keep-alive, and how many earlier output
+# lines a new listener is sent
+JOB_EVENT_INTERVAL_SECONDS = float(os.environ.get("JOB_EVENT_INTERVAL_SECONDS", 0.5))
+JOB_EVENT_KEEPALIVE_SECONDS = float(os.environ.get("JOB_EVENT_KEEPALIVE_SECONDS", 15))
+JOB_EVENT_BACKLOG_LINES = int(os.environ.get("JOB_EVENT_BACKLOG_LINES", 200))
+
+# Per-request profiling (see profiling.py): a request with ?profile=1 or an "X-Profile: 1" header is profiled,
+# plus a random PROFILE_SAMPLE_RATE fraction of all requests. With PROFILE_TOKEN set, the flag must carry the
+# token instead of 1. PROFILE_MODE "sample" samples the request's threads every PROFILE_INTERVAL_MS; "cprofile"
+# traces every call on the event loop thread. The newest PROFILE_KEEP profiles are kept in PROFILE_DIR, and the
+# /admin/profiles/ page lists those slower than PROFILE_SLOW_MS by default
+PROFILE_SAMPLE_RATE = float(os.environ.get("PROFILE_SAMPLE_RATE", 0.0))
+PROFILE_TOKEN = os.environ.get("PROFILE_TOKEN", "")
+PROFILE_MODE = os.environ.get("PROFILE_MODE", "sample")
+PROFILE_INTERVAL_MS = float(os.environ.get("PROFILE_INTERVAL_MS", 5))
+PROFILE_MAX_SECONDS = float(os.environ.get("PROFILE_MAX_SECONDS", 60))
+PROFILE_DIR = os.environ.get("PROFILE_DIR", "data/.profiles")
+PROFILE_KEEP = int(os.environ.get("PROFILE_KEEP", 200))
+PROFILE_SLOW_MS = float(os.environ.get("PROFILE_SLOW_MS", 200))
+
+# Logging (see logs.py). LOG_LEVEL=DEBUG turns on the per-file and per-query debug lines, which are off by default;
+# LOG_FORMAT "json" writes one JSON object per line instead of text. LOG_DEBUG_RATE caps the DEBUG lines per second
+# from any single logging call, 0 for no cap
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO")
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "text")
+LOG_DEBUG_RATE = int(os.environ.get("LOG_DEBUG_RATE", 20))
+
+# Resumable uploads (see resumable_uploads.py): the largest file accepted, how many bytes a PATCH may receive
+# between saves of its offset, and how long an unfinished upload is kept before its partial file is removed
+RESUMABLE_UPLOAD_MAX_BYTES = int(os.environ.get("RESUMABLE_UPLOAD_MAX_BYTES", 64 * 1024 ** 3))
+RESUMABLE_UPLOAD_CHECKPOINT_BYTES = int(os.environ.get("RESUMABLE_UPLOAD_CHECKPOINT_BYTES", 64 * 1024 * 1024))
+RESUMABLE_UPLOAD_EXPIRE_HOURS = float(os.environ.get("RESUMABLE_UPLOAD_EXPIRE_HOURS", 7 * 24))
+
+# Photo metadata catalog (see metadata.py): threads reading EXIF/XMP headers, and files per backfill batch
+METADATA_WORKERS = int(os.environ.get("METADATA_WORKERS", 4))
+METADATA_BATCH_SIZE = int(os.environ.get("METADATA_BATCH_SIZE", 200))
@@ -0,0 +1,165 @@
+import argparse
+import math
+import os
+import shutil
+import sys
+import time
+import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from PIL import Image
+
+from PixelateImages import find_images, print_summary
+
+DZI_NAMESPACE = "http://schemas.microsoft.com/deepzoom/2008"
+# Processed panoramas are far past Pillow's default decompression-bomb limit
+Image.MAX_IMAGE_PIXELS = None
+
+def pyramid_paths(output_file):
+    """Return (dzi_path, tiles_dir) for an output path mirroring the source image."""
+    dzi_path = output_file.with_suffix(".dzi")
+    return dzi_path, dzi_path.with_name(dzi_path.stem + "_files")
+
+def read_dzi(dzi_path):
+    """Return (tile_size, overlap, format) recorded in a .dzi, or None if it is missing or unreadable."""
+    try:
+        image = ET.parse(dzi_path).getroot()
+        return int(image.get("TileSize")), int(image.get("Overlap")), image.get("Format")
+    except (OSError, ET.ParseError, TypeError, ValueError):
+        return None
+
+def write_dzi(dzi_path, width, height, tile_size, tile_format):
+    image = ET.Element("Image", {
+        "xmlns": DZI_NAMESPACE, "TileSize": str(tile_size), "Overlap": "0", "Format": tile_format,
+    })
+    ET.SubElement(image, "Size", {"Width": str(width), "Height": str(height)})
+    temp_path = dzi_path.with_name(dzi_path.name + ".tmp")
+    ET.ElementTree(image).write(temp_path, encoding="utf-8", xml_declaration=True)
+    os.replace(temp_path, dzi_path)
+
+def is_up_to_date(image_path, dzi_path, tile_size, tile_format):
+    """True if the pyramid was built from the current source with the same tile settings."""
+    if read_dzi(dzi_path) != (tile_size, 0, tile_format):
+        return False
+    return dzi_path.stat().st_mtime_ns >= image_path.stat().st_mtime_ns
+
+def build_pyramid(image_path, output_file, tile_size=256, tile_format="jpg", quality=85):
+    """
+    Write a Deep Zoom pyramid for one image: <name>.dzi plus <name>_files/<level>/<col>_<row>.<format>.
+
+    Level N is the full image and each level below halves it, down to 1x1.
+    Tiles go to a temporary folder that replaces the old one only when complete,
+    and the .dzi is written last, so a viewer never sees a half-built pyramid.
+    Returns (image_path, seconds, error or None) like PixelateImages.pixelate().
+    """
+    started = time.perf_counter()
+    dzi_path, tiles_dir = pyramid_paths(output_file)
+    temp_dir = tiles_dir.with_name(tiles_dir.name + ".tmp")
+    try:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+        save_options = {"quality": quality} if tile_format in ("jpg", "webp") else {}
+        with Image.open(image_path) as img:
+            level_img = img.convert("RGB") if tile_format == "jpg" and img.mode != "RGB" else img.copy()
+        width, height = level_img.size
+        max_level = math.ceil(math.log2(max(width, height, 1)))
+
+        for level in range(max_level, -1, -1):
+            level_dir = temp_dir / str(level)
+            level_dir.mkdir(parents=True)
+            level_width, level_height = level_img.size
+            for col in range(math.ceil(level_width / tile_size)):
+                for row in range(math.ceil(level_height / tile_size)):
+                    box = (
+                        col * tile_size, row * tile_size,
+                        min((col + 1) * tile_size, level_width), min((row + 1) * tile_size, level_height),
+                    )
+                    level_img.crop(box).save(level_dir / f"{col}_{row}.{tile_format}", **save_options)
+            if level > 0:
+                # Halve with rounding up, matching the level sizes Deep Zoom viewers expect
+                level_img = level_img.reduce(2)
+
+        if tiles_dir.exists():
+            shutil.rmtree(tiles_dir)
+        os.replace(temp_dir, tiles_dir)
+        write_dzi(dzi_path, width, height, tile_size, tile_format)
+        print(f"Built pyramid: {image_path} -> {dzi_path} ({max_level + 1} levels)")
+        return image_path, time.perf_counter() - started, None
+    except Exception as e:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+        print(f"ERROR: Failed to build pyramid for {image_path}: {e}")
+        return image_path, time.perf_counter() - started, str(e)
+
+def _build_task(task):
+    """Process pool entry point: task is (image_path, output_file, tile_size, tile_format, quality)."""
+    return build_pyramid(*task)
+
+def remove_orphans(output_path, sources):
+    """Delete pyramids whose source image no longer exists."""
+    expected = {pyramid_paths(output_file)[0] for output_file in sources}
+    for dzi_path in output_path.rglob("*.dzi"):
+        if dzi_path not in expected:
+            print(f"DEBUG: Removing pyramid of deleted source: {dzi_path}")
+            shutil.rmtree(pyramid_paths(dzi_path)[1], ignore_errors=True)
+            dzi_path.unlink(missing_ok=True)
+
+def build_pyramids(input_dir, output_dir, tile_size=256, tile_format="jpg", quality=85, workers=1, force=False):
+    """
+    Build Deep Zoom pyramids for every image under input_dir into output_dir,
+    mirroring its folder structure. Images whose pyramid is newer than the
+    source and uses the same tile settings are skipped unless force is set.
+    Returns a list of (image_path, seconds, error or None) per built image.
+    """
+    input_path = Path(input_dir)
+    output_path = Path(output_dir)
+
+    if not input_path.exists():
+        print(f"Input directory does not exist: {input_path}")
+        sys.exit(1)
+
+    print(f"DEBUG: Scanning directory {input_dir} for image files...")
+    images = find_images(input_path, output_path)
+    tasks = [
+        (image_file, output_file, tile_size, tile_format, quality)
+        for image_file, output_file in images
+        if force or not is_up_to_date(image_file, pyramid_paths(output_file)[0], tile_size, tile_format)
+    ]
+    print(f"DEBUG: {len(tasks)} pyramids to build, {len(images) - len(tasks)} up to date")
+    if output_path.exists():
+        remove_orphans(output_path, [output_file for _, output_file in images])
+
+    started = time.perf_counter()
+    results = []
+    if workers <= 1 or len(tasks) <= 1:
+        for task in tasks:
+            results.append(_build_task(task))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(_build_task, task) for task in tasks]
+            for future in as_completed(futures):
+                results.append(future.result())
+    print_summary(results, time.perf_counter() - started, workers)
+    return results
+
+if __name__ == "__main__":
+    print("DEBUG: Starting tile pyramid script...")
+    parser = argparse.ArgumentParser(usage="BuildTilePyramids.py <input_directory> <output_directory> [options]")
+    parser.add_argument("input_directory")
+    parser.add_argument("output_directory")
+    parser.add_argument("--tile-size", type=int, default=256)
+    parser.add_argument("--format", choices=["jpg", "png", "webp"], default="jpg")
+    parser.add_argument("--quality", type=int, default=85)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="Processes to use; 1 runs serially (default: one per CPU)")
+    parser.add_argument("--force", action="store_true", help="Rebuild every pyramid")
+    if len(sys.argv) < 3:
+        parser.print_usage()
+        sys.exit(1)
+    args = parser.parse_args()
+
+    results = build_pyramids(
+        args.input_directory, args.output_directory, args.tile_size, args.format, args.quality,
+        args.workers, args.force,
+    )
+    if any(error for _, _, error in results):
+        sys.exit(1)
+    print("DEBUG: Tile pyramids completed.")
@@ -0,0 +1,224 @@
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+from PixelateImages import find_images, print_summary
+
+# Face suffixes in output order: front, right, back, left, up, down
+FACES = ("f", "r", "b", "l", "u", "d")
+# Processed panoramas are far past Pillow's default decompression-bomb limit
+Image.MAX_IMAGE_PIXELS = None
+
+# Lookup tables already loaded by this process, keyed by (width, height, face_size)
+_luts = {}
+
+def face_directions(face, a, b):
+    """
+    3D view directions (x right, y up, z forward) for face coordinates a
+    (left to right) and b (top to bottom), both in -1..1.
+    """
+    one = np.ones_like(a)
+    return {
+        "f": (a, -b, one),
+        "r": (one, -b, -a),
+        "b": (-a, -b, -one),
+        "l": (-one, -b, a),
+        "u": (a, one, b),
+        "d": (a, -one, -b),
+    }[face]
+
+# One lookup table entry per face pixel: the flat index of the top-left source
+# pixel of its 2x2 bilinear neighbourhood in the padded source (see pad_source),
+# and the weights of the right and lower neighbours in 1/256 steps, packed as x << 8 | y
+LUT_DTYPE = np.dtype([("index", "<u4"), ("weights", "<u2")])
+
+def build_lut(width, height, face_size):
+    """
+    Precompute where every cube face pixel samples a width x height
+    equirectangular image. Returns a LUT_DTYPE array of shape (6, face_size, face_size).
+    """
+    coords = (np.arange(face_size, dtype=np.float64) + 0.5) / face_size * 2 - 1
+    a, b = np.meshgrid(coords, coords)
+    lut = np.empty((len(FACES), face_size, face_size), dtype=LUT_DTYPE)
+    for index, face in enumerate(FACES):
+        x, y, z = face_directions(face, a, b)
+        lon = np.arctan2(x, z)
+        lat = np.arctan2(y, np.hypot(x, z))
+        # Pixel-centre coordinates in the source image
+        u = (lon / (2 * np.pi) + 0.5) * width - 0.5
+        v = np.clip((0.5 - lat / np.pi) * height - 0.5, 0, height - 1)
+        u0 = np.floor(u)
+        v0 = np.floor(v)
+        weight_x = np.rint((u - u0) * 256).astype(np.uint16)
+        weight_y = np.rint((v - v0) * 256).astype(np.uint16)
+        # A weight of 256 means "all neighbour": step to that pixel with a weight of 0
+        u0 += weight_x == 256
+        v0 += weight_y == 256
+        weight_x[weight_x == 256] = 0
+        weight_y[weight_y == 256] = 0
+        lut["index"][index] = np.minimum(v0, height - 1) * (width + 1) + np.mod(u0, width)
+        lut["weights"][index] = (weight_x << 8) | weight_y
+    return lut
+
+def pad_source(pixels):
+    """
+    Copy RGB pixels into a flat array of 32-bit RGBX values, (height + 1) x (width + 1),
+    with the first column repeated after the last (the 360 degree seam) and the
+    last row repeated below, so every neighbour of a LUT index is at a fixed offset.
+    """
+    height, width = pixels.shape[:2]
+    padded = np.zeros((height + 1, width + 1, 4), dtype=np.uint8)
+    padded[:height, :width, :3] = pixels
+    padded[:height, width] = padded[:height, 0]
+    padded[height] = padded[height - 1]
+    return padded.reshape(-1).view(np.uint32)
+
+def load_lut(width, height, face_size, cache_dir):
+    """
+    Return the lookup table for a source resolution and face size, building
+    and saving it to cache_dir the first time. Cached tables are memory-mapped,
+    so worker processes share one copy through the page cache.
+    """
+    key = (width, height, face_size)
+    if key in _luts:
+        return _luts[key]
+    lut_path = Path(cache_dir) / f"cubemap_{width}x{height}_{face_size}.npy"
+    if not lut_path.exists():
+        print(f"DEBUG: Building lookup table {lut_path.name}")
+        lut = build_lut(width, height, face_size)
+        lut_path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = lut_path.with_name(f".{lut_path.name}.{os.getpid()}.tmp")
+        with open(temp_path, "wb") as f:
+            np.save(f, lut)
+        os.replace(temp_path, lut_path)
+        del lut
+    _luts[key] = np.load(lut_path, mmap_mode="r")
+    return _luts[key]
+
+def sample_face(padded, width, lut_face):
+    """Bilinearly sample one face from a pad_source() array with its lookup table, in integer arithmetic."""
+    index = lut_face["index"].astype(np.intp)
+    weights = lut_face["weights"]
+    weight_x = (weights >> 8)[..., None]
+    weight_y = (weights & 0xFF)[..., None]
+    row = width + 1
+
+    def gather(offset):
+        return padded[index + offset].view(np.uint8).reshape(index.shape + (4,))[..., :3]
+
+    # Each step stays within 16 bits: 255 * 256 plus rounding
+    top = (gather(0) * (256 - weight_x) + gather(1) * weight_x + 128) >> 8
+    bottom = (gather(row) * (256 - weight_x) + gather(row + 1) * weight_x + 128) >> 8
+    return ((top * (256 - weight_y) + bottom * weight_y + 128) >> 8).astype(np.uint8)
+
+def face_paths(output_file):
+    """Output paths of the six faces for an output path mirroring the source image."""
+    return [output_file.with_name(f"{output_file.stem}_{face}.jpg") for face in FACES]
+
+def is_up_to_date(image_path, output_file):
+    source_mtime = image_path.stat().st_mtime_ns
+    try:
+        return all(path.stat().st_mtime_ns >= source_mtime for path in face_paths(output_file))
+    except FileNotFoundError:
+        return False
+
+def convert(image_path, output_file, face_size=None, quality=90, lut_cache="data/.cubemap_luts"):
+    """
+    Write the six cube faces of an equirectangular panorama as <name>_<face>.jpg.
+    face_size defaults to a quarter of the panorama's width.
+    Returns (image_path, seconds, error or None) like PixelateImages.pixelate().
+    """
+    started = time.perf_counter()
+    try:
+        with Image.open(image_path) as img:
+            width, height = img.size
+            padded = pad_source(np.asarray(img.convert("RGB")))
+        size = face_size or width // 4
+        lut = load_lut(width, height, size, lut_cache)
+        output_file.parent.mkdir(parents=True, exist_ok=True)
+        for index, path in enumerate(face_paths(output_file)):
+            face = Image.fromarray(sample_face(padded, width, lut[index]))
+            temp_path = path.with_name(f".{path.name}.tmp")
+            face.save(temp_path, format="JPEG", quality=quality)
+            os.replace(temp_path, path)
+        print(f"Converted: {image_path} -> {output_file.parent} ({size}px faces)")
+        return image_path, time.perf_counter() - started, None
+    except Exception as e:
+        print(f"ERROR: Failed to convert {image_path}: {e}")
+        return image_path, time.perf_counter() - started, str(e)
+
+def _convert_task(task):
+    """Process pool entry point: task is (image_path, output_file, face_size, quality, lut_cache)."""
+    return convert(*task)
+
+def convert_images(input_dir, output_dir, face_size=None, quality=90, workers=1,
+                   lut_cache="data/.cubemap_luts", force=False):
+    """
+    Convert every panorama under input_dir into cube faces under output_dir,
+    mirroring its folder structure. Panoramas whose faces are newer than the
+    source are skipped unless force is set. Lookup tables are built in this
+    process before the pool starts, so workers only ever load them.
+    Returns a list of (image_path, seconds, error or None) per converted image.
+    """
+    input_path = Path(input_dir)
+    output_path = Path(output_dir)
+
+    if not input_path.exists():
+        print(f"Input directory does not exist: {input_path}")
+        sys.exit(1)
+
+    print(f"DEBUG: Scanning directory {input_dir} for image files...")
+    tasks = [
+        (image_file, output_file, face_size, quality, lut_cache)
+        for image_file, output_file in find_images(input_path, output_path)
+        if force or not is_up_to_date(image_file, output_file)
+    ]
+
+    started = time.perf_counter()
+    for image_file, _, _, _, _ in tasks:
+        with Image.open(image_file) as img:
+            width, height = img.size
+        load_lut(width, height, face_size or width // 4, lut_cache)
+
+    results = []
+    if workers <= 1 or len(tasks) <= 1:
+        for task in tasks:
+            results.append(_convert_task(task))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(_convert_task, task) for task in tasks]
+            for future in as_completed(futures):
+                results.append(future.result())
+    print_summary(results, time.perf_counter() - started, workers)
+    return results
+
+if __name__ == "__main__":
+    print("DEBUG: Starting cubemap conversion script...")
+    parser = argparse.ArgumentParser(usage="EquirectToCubemap.py <input_directory> <output_directory> [options]")
+    parser.add_argument("input_directory")
+    parser.add_argument("output_directory")
+    parser.add_argument("--face-size", type=int, help="Face width in pixels (default: panorama width / 4)")
+    parser.add_argument("--quality", type=int, default=90)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="Processes to use; 1 runs serially (default: one per CPU)")
+    parser.add_argument("--lut-cache", default="data/.cubemap_luts",
+                        help="Folder the per-resolution lookup tables are cached in")
+    parser.add_argument("--force", action="store_true", help="Convert every panorama again")
+    if len(sys.argv) < 3:
+        parser.print_usage()
+        sys.exit(1)
+    args = parser.parse_args()
+
+    results = convert_images(
+        args.input_directory, args.output_directory, args.face_size, args.quality, args.workers,
+        args.lut_cache, args.force,
+    )
+    if any(error for _, _, error in results):
+        sys.exit(1)
+    print("DEBUG: Cubemap conversion completed.")
@@ -1,9 +1,23 @@
+import argparse
+import hashlib
+import json
+import os
 import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
 from PIL import Image
 
+IMAGE_SUFFIXES = {".png", ".jpg", ".jpeg"}
+# Upper bound on the size of one upscaled strip in the fast path
+STRIP_BYTES = 16 * 1024 * 1024
+# Written to each output directory; records what every output was made from
+MANIFEST_NAME = ".pixelate_manifest.json"
+MANIFEST_VERSION = 1
+
 def pixelate(image_path, output_path, pixel_size=10):
-    """Apply a pixelation effect to an image."""
+    """Apply a pixelation effect to an image. Returns (image_path, seconds, error or None)."""
+    started = time.perf_counter()
     try:
         with Image.open(image_path) as img:
             # Resize the image to a smaller size
@@ -17,35 +31,270 @@ def pixelate(image_path, output_path, pixel_size=10):
             output_path.parent.mkdir(parents=True, exist_ok=True)  # Ensure directory exists
             pixelated_img.save(output_path)
             print(f"Processed: {image_path} -> {output_path}")
+        return image_path, time.perf_counter() - started, None
     except Exception as e:
         print(f"ERROR: Failed to process {image_path}: {e}")
+        return image_path, time.perf_counter() - started, str(e)
+
+def pixelate_fast(image_path, output_path, pixel_size=10):
+    """
+    Lower-memory pixelation for very large panoramas. Returns like pixelate().
+
+    JPEGs are decoded in draft mode straight at 1/2, 1/4 or 1/8 scale, so the
+    full-resolution source is never held in memory. The upscale is done in
+    horizontal strips pasted into the output, each one sampling the same source
+    rows a full-size NEAREST resize would, so only one strip exists at a time.
+
+    Peak memory is not bounded, though: Pillow can only encode a whole image,
+    so the full-size output (width * height * bands bytes) is still held once
+    before it is saved. What this saves is the full-size decoded source and
+    the full-size intermediate copies pixelate() holds alongside the output.
+    Block edges match pixelate(); block colours from a draft decode are a DCT
+    average rather than the single pixel NEAREST picks, so JPEG output is not
+    byte-identical to the default path.
+    """
+    started = time.perf_counter()
+    try:
+        with Image.open(image_path) as img:
+            width, height = img.size
+            small_size = (max(1, width // pixel_size), max(1, height // pixel_size))
+            if img.format == "JPEG":
+                img.draft(img.mode, small_size)
+            small_img = img.resize(small_size, Image.NEAREST)
+
+        pixelated_img = Image.new(small_img.mode, (width, height))
+        bands = len(small_img.getbands())
+        strip_rows = max(1, STRIP_BYTES // (width * bands))
+        scale_y = small_size[1] / height
+        for top in range(0, height, strip_rows):
+            bottom = min(height, top + strip_rows)
+            strip = small_img.resize(
+                (width, bottom - top),
+                Image.NEAREST,
+                box=(0, top * scale_y, small_size[0], bottom * scale_y),
+            )
+            pixelated_img.paste(strip, (0, top))
+            del strip
+
+        output_path.parent.mkdir(parents=True, exist_ok=True)  # Ensure directory exists
+        pixelated_img.save(output_path)
+        print(f"Processed: {image_path} -> {output_path}")
+        return image_path, time.perf_counter() - started, None
+    except Exception as e:
+        print(f"ERROR: Failed to process {image_path}: {e}")
+        return image_path, time.perf_counter() - started, str(e)
+
+def _pixelate_task(task):
+    """
+    Process pool entry point: task is (image_path, output_path, pixel_size, fast, needs_hash).
+    Returns (result, sha256): the source is hashed in the worker when needs_hash is set, just
+    before it is decoded, so the decode reads it from the page cache instead of the disk.
+    """
+    image_path, output_path, pixel_size, fast, needs_hash = task
+    try:
+        sha256 = file_hash(image_path) if needs_hash else None
+    except OSError as e:
+        return (image_path, 0.0, str(e)), None
+    return (pixelate_fast if fast else pixelate)(image_path, output_path, pixel_size), sha256
+
+def find_images(input_path, output_path):
+    """Return (image_file, output_file) pairs for every image under input_path, largest first."""
+    images = []
+    for image_file in input_path.rglob("*"):
+        if image_file.suffix.lower() in IMAGE_SUFFIXES:
+            relative_path = image_file.relative_to(input_path)  # Preserve directory structure
+            images.append((image_file, output_path / relative_path, image_file.stat().st_size))
+        else:
+            print(f"DEBUG: Skipping non-image file: {image_file}")
+    # Start the biggest panoramas first so one large file does not finish last on its own
+    images.sort(key=lambda item: item[2], reverse=True)
+    return [(image_file, output_file) for image_file, output_file, _ in images]
+
+def print_summary(results, wall_seconds, workers):
+    """Print totals, the slowest images and any failures for a run."""
+    failures = [(path, error) for path, _, error in results if error]
+    durations = sorted((seconds, path) for path, seconds, _ in results)
+    print(f"SUMMARY: {len(results)} images, {len(failures)} failed, "
+          f"{wall_seconds:.2f}s wall time with {workers} worker(s)")
+    if durations:
+        total = sum(seconds for seconds, _ in durations)
+        print(f"SUMMARY: per image min {durations[0][0]:.2f}s, "
+              f"mean {total / len(durations):.2f}s, max {durations[-1][0]:.2f}s")
+        for seconds, path in reversed(durations[-5:]):
+            print(f"SUMMARY: slowest {seconds:.2f}s {path}")
+    for path, error in failures:
+        print(f"SUMMARY: failed {path}: {error}")
 
-def process_images(input_dir, output_dir, pixel_size=10):
-    """Process all images in the input directory and its subdirectories."""
+def file_hash(path, chunk_size=1024 * 1024):
+    """SHA-256 of a file's contents as a hex string."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def load_manifest(output_path):
+    """Return the {relative path: entry} manifest of an output directory, or {} if missing or unreadable."""
+    try:
+        with open(output_path / MANIFEST_NAME) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if manifest.get("version") != MANIFEST_VERSION:
+        return {}
+    return manifest.get("images", {})
+
+def save_manifest(output_path, images):
+    """Atomically write the manifest so an interrupted run never leaves a half-written file."""
+    output_path.mkdir(parents=True, exist_ok=True)
+    temp_path = output_path / (MANIFEST_NAME + ".tmp")
+    with open(temp_path, "w") as f:
+        json.dump({"version": MANIFEST_VERSION, "images": images}, f, indent=1, sort_keys=True)
+    os.replace(temp_path, output_path / MANIFEST_NAME)
+
+def plan_images(input_path, output_path, params, manifest, force=False):
+    """
+    Compare the images under input_path with the manifest.
+
+    Returns (pending, unchanged, removed): pending is a list of
+    (image_file, output_file, key, entry) to process, unchanged is {key: entry}
+    for images whose output is already up to date, and removed is the manifest
+    keys whose source no longer exists. Only images whose size or mtime changed
+    are hashed, so a re-run over unchanged inputs costs one stat per file.
+    """
+    pending = []
+    unchanged = {}
+    seen = set()
+    for image_file, output_file in find_images(input_path, output_path):
+        key = image_file.relative_to(input_path).as_posix()
+        seen.add(key)
+        stat = image_file.stat()
+        entry = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "params": params}
+        previous = manifest.get(key)
+        if not force and previous and previous.get("params") == params and output_file.exists():
+            if previous["size"] == entry["size"] and previous["mtime_ns"] == entry["mtime_ns"]:
+                unchanged[key] = previous
+                continue
+            # Touched but maybe not modified (e.g. re-copied); the hash decides
+            entry["sha256"] = file_hash(image_file)
+            if previous.get("sha256") == entry["sha256"]:
+                unchanged[key] = entry
+                continue
+        pending.append((image_file, output_file, key, entry))
+    removed = [key for key in manifest if key not in seen]
+    return pending, unchanged, removed
+
+def _run_pool(executor, tasks, chunksize, collect):
+    """Pixelate tasks on a process pool, passing each result to collect() as it arrives."""
+    if chunksize > 1:
+        for result in executor.map(_pixelate_task, tasks, chunksize=chunksize):
+            collect(result)
+    else:
+        futures = [executor.submit(_pixelate_task, task) for task in tasks]
+        for future in as_completed(futures):
+            collect(future.result())
+
+def process_images(input_dir, output_dir, pixel_size=10, workers=1, chunksize=1, fast=False, force=False,
+                   executor=None, on_result=None, timings=None):
+    """
+    Process all new or changed images in the input directory and its subdirectories.
+
+    A manifest in the output directory records the size, mtime, content hash and
+    parameters each output was made from; images that match it are skipped, and
+    outputs whose source image is gone are deleted. force reprocesses everything.
+
+    With workers > 1 the images are spread over a process pool; each image is
+    still written by pixelate(), so the output is byte-identical to a serial run.
+    An existing pool can be passed as executor instead, so a caller processing
+    many folders starts its workers once. fast uses pixelate_fast() instead,
+    trading exact output for lower memory.
+
+    on_result(result) is called as each image finishes, and a timings dict is
+    filled with the seconds spent on the "plan", "pixelate" and "manifest" stages.
+    Returns a list of (image_path, seconds, error or None) per processed image.
+    """
     input_path = Path(input_dir)
     output_path = Path(output_dir)
+    timings = {} if timings is None else timings
 
     if not input_path.exists():
         print(f"Input directory does not exist: {input_path}")
         sys.exit(1)
 
+    stage_started = time.perf_counter()
     print(f"DEBUG: Scanning directory {input_dir} for image files...")
-    for image_file in input_path.rglob("*"):
-        if image_file.suffix.lower() in {".png", ".jpg", ".jpeg"}:
-            relative_path = image_file.relative_to(input_path)  # Preserve directory structure
-            output_file = output_path / relative_path
-            print(f"DEBUG: Processing image: {image_file}")
-            pixelate(image_file, output_file, pixel_size)
+    params = {"pixel_size": pixel_size, "fast": fast}
+    manifest = load_manifest(output_path)
+    pending, images, removed = plan_images(input_path, output_path, params, manifest, force)
+    print(f"DEBUG: {len(pending)} new or changed, {len(images)} unchanged, {len(removed)} removed")
+
+    for key in removed:
+        stale_output = output_path / key
+        print(f"DEBUG: Removing output of deleted source: {stale_output}")
+        stale_output.unlink(missing_ok=True)
+
+    tasks = [
+        (image_file, output_file, pixel_size, fast, "sha256" not in entry)
+        for image_file, output_file, _, entry in pending
+    ]
+    entries = {image_file: (key, entry) for image_file, _, key, entry in pending}
+
+    results = []
+
+    def collect(task_result):
+        result, sha256 = task_result
+        if sha256 is not None:
+            entries[result[0]][1]["sha256"] = sha256
+        results.append(result)
+        if on_result is not None:
+            on_result(result)
+
+    started = time.perf_counter()
+    timings["plan"] = started - stage_started
+    try:
+        if executor is not None:
+            _run_pool(executor, tasks, chunksize, collect)
+        elif workers <= 1 or len(tasks) <= 1:
+            for task in tasks:
+                print(f"DEBUG: Processing image: {task[0]}")
+                collect(_pixelate_task(task))
         else:
-            print(f"DEBUG: Skipping non-image file: {image_file}")
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                _run_pool(pool, tasks, chunksize, collect)
+    finally:
+        timings["pixelate"] = time.perf_counter() - started
+        stage_started = time.perf_counter()
+        # Record whatever finished, so an interrupted run resumes where it stopped
+        for image_file, _, error in results:
+            if error is None:
+                key, entry = entries[image_file]
+                images[key] = entry
+        save_manifest(output_path, images)
+        timings["manifest"] = time.perf_counter() - stage_started
+    print_summary(results, timings["pixelate"], workers)
+    return results
 
 if __name__ == "__main__":
     print("DEBUG: Starting pixelation script...")
+    parser = argparse.ArgumentParser(usage="PixelateImages.py <input_directory> <output_directory> [options]")
+    parser.add_argument("input_directory")
+    parser.add_argument("output_directory")
+    parser.add_argument("--pixel-size", type=int, default=10)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="Processes to use; 1 runs serially (default: one per CPU)")
+    parser.add_argument("--chunksize", type=int, default=1,
+                        help="Images handed to a worker at a time")
+    parser.add_argument("--fast", action="store_true",
+                        help="Draft-mode decode and strip-wise upscale for large panoramas")
+    parser.add_argument("--force", action="store_true",
+                        help="Reprocess every image, ignoring the output directory's manifest")
     if len(sys.argv) < 3:
-        print("Usage: PixelateImages.py <input_directory> <output_directory>")
+        parser.print_usage()
         sys.exit(1)
+    args = parser.parse_args()
 
-    input_directory = sys.argv[1]
-    output_directory = sys.argv[2]
-    process_images(input_directory, output_directory)
+    process_images(
+        args.input_directory, args.output_directory, args.pixel_size, args.workers, args.chunksize, args.fast,
+        args.force,
+    )
     print("DEBUG: Pixelation completed.")
@@ -1,6 +1,7 @@
 param (
     [string]$ProcessingPath,
-    [string]$OutputPath
+    [string]$OutputPath,
+    [switch]$Fast
 )
 
 Write-Host "Processing images in directory: $ProcessingPath"
@@ -23,7 +24,11 @@ if (-Not (Test-Path $pythonScriptPath)) {
 }
 
 Write-Host "Calling Python script for pixelation..."
-$process = python $pythonScriptPath $ProcessingPath $OutputPath
+$pixelateArgs = @($pythonScriptPath, $ProcessingPath, $OutputPath)
+if ($Fast) {
+    $pixelateArgs += "--fast"
+}
+$process = python @pixelateArgs
 if ($LASTEXITCODE -ne 0) {
     Write-Host "Python script failed."
     exit 1
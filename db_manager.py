@@ -1,72 +1,131 @@
+import logging
 import sqlite3
+import threading
+import time
+from contextlib import contextmanager
 from pathlib import Path
 
+from config import DB_SYNCHRONOUS, DB_CACHE_SIZE_KB, DB_BUSY_TIMEOUT_MS
+from metrics import DB_QUERY_DURATION, DB_QUERY_ERRORS, query_operation
+
+logger = logging.getLogger(__name__)
+
 DATABASE_FILE = Path("data/data.db")
 
+# Each thread keeps one long-lived connection plus its transaction depth
+_local = threading.local()
+
 
 def connect_db():
     """Connect to the SQLite database."""
-    conn = sqlite3.connect(DATABASE_FILE)
+    conn = sqlite3.connect(DATABASE_FILE, timeout=DB_BUSY_TIMEOUT_MS / 1000)
     conn.row_factory = sqlite3.Row  # Enable dictionary-like row access
+    conn.isolation_level = None  # Autocommit; transaction() issues BEGIN/COMMIT explicitly
+    # WAL lets readers proceed while a writer is active
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute(f"PRAGMA synchronous = {DB_SYNCHRONOUS}")
+    conn.execute(f"PRAGMA cache_size = -{DB_CACHE_SIZE_KB}")
+    conn.execute(f"PRAGMA busy_timeout = {DB_BUSY_TIMEOUT_MS}")
+    conn.execute("PRAGMA temp_store = MEMORY")
     return conn
 
 
+def get_connection():
+    """Return the calling thread's connection, opening it on first use."""
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = connect_db()
+        _local.conn = conn
+        _local.depth = 0
+    return conn
+
+
+def close_connection():
+    """Close the calling thread's connection, if one is open."""
+    conn = getattr(_local, "conn", None)
+    if conn is not None:
+        conn.close()
+        _local.conn = None
+        _local.depth = 0
+
+
+@contextmanager
+def transaction():
+    """
+    Unit of work on the calling thread's connection.
+
+    Yields a cursor. Statements run through execute_query or the insert helpers
+    inside the block join the same transaction, which is committed once when the
+    outermost block exits and rolled back if it raises.
+    """
+    conn = get_connection()
+    outermost = _local.depth == 0
+    if outermost:
+        conn.execute("BEGIN IMMEDIATE")
+    _local.depth += 1
+    try:
+        yield conn.cursor()
+    except BaseException:
+        _local.depth -= 1
+        if outermost:
+            conn.execute("ROLLBACK")
+        raise
+    _local.depth -= 1
+    if outermost:
+        try:
+            conn.execute("COMMIT")
+        except BaseException:
+            # E.g. "database is locked": leave the pooled connection outside any transaction
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+
+
 def execute_query(query: str, params: tuple = (), fetch_one: bool = False, fetch_all: bool = False, return_lastrowid: bool = False):
     """Generic function to execute a database query."""
-    conn = None
-    lastrowid = None
+    started = time.perf_counter()
     try:
-        conn = connect_db()
-        cursor = conn.cursor()
+        cursor = get_connection().cursor()
         cursor.execute(query, params)
-        
-        if return_lastrowid:
-            lastrowid = cursor.lastrowid
-        
+        lastrowid = cursor.lastrowid
+
         result = None
         if fetch_one:
             result = cursor.fetchone()
         if fetch_all:
             result = cursor.fetchall()
-        
-        conn.commit()
+
         if return_lastrowid:
             return result, lastrowid
         return result
     except Exception as e:
-        print(f"Error executing query: {query} with params: {params}. Error: {e}")
+        DB_QUERY_ERRORS.inc(operation=query_operation(query))
+        logger.error("Error executing query: %s with params: %s. Error: %s", query, params, e)
         raise
     finally:
-        if conn:
-            conn.close()
+        DB_QUERY_DURATION.observe(time.perf_counter() - started, operation=query_operation(query))
 
 
 # --- CRUD for Projects ---
-def insert_project(project_number, date, crew_initials, status="active"):
-    query = """
+def _get_or_create_project(cursor, project_number, date, crew_initials, status="active"):
+    """Return the ID of a matching project, inserting it first if needed."""
+    # The no-op update makes RETURNING yield the existing row's ID on conflict
+    cursor.execute(
+        """
         INSERT INTO Projects (project_number, date, crew_initials, status)
         VALUES (?, ?, ?, ?)
-    """
-    params = (project_number, date, crew_initials, status)
-    conn = connect_db()
-    cursor = conn.cursor()
-    
-    # Check if the project exists
-    cursor.execute(
-        "SELECT id FROM Projects WHERE project_number = ? AND date = ? AND crew_initials = ?",
-        (project_number, date, crew_initials)
+        ON CONFLICT (project_number, date, crew_initials)
+        DO UPDATE SET project_number = excluded.project_number
+        RETURNING id
+        """,
+        (project_number, date, crew_initials, status)
     )
-    existing = cursor.fetchone()
-    if existing:
-        conn.close()
-        return existing["id"]
-    
-    # Insert new project
-    cursor.execute(query, params)
-    conn.commit()
-    project_id = cursor.lastrowid
-    conn.close()
-    return project_id
+    return cursor.fetchone()["id"]
+
+
+def insert_project(project_number, date, crew_initials, status="active"):
+    with transaction() as cursor:
+        return _get_or_create_project(cursor, project_number, date, crew_initials, status)
 
 
 def update_project_status(project_id, status):
@@ -138,44 +197,33 @@ def delete_project(project_id):
 
 
 # --- CRUD for Structures ---
+def _get_or_create_structure(cursor, project_id, project_location, structure_id, collection_date):
+    """Return the ID of a matching structure, inserting it first if needed."""
+    cursor.execute(
+        """
+        INSERT INTO Structures (project_id, project_location, structure_id, collection_date)
+        VALUES (?, ?, ?, ?)
+        ON CONFLICT (project_id, project_location, structure_id, collection_date)
+        DO UPDATE SET project_id = excluded.project_id
+        RETURNING id
+        """,
+        (project_id, project_location, structure_id, collection_date),
+    )
+    structure_db_id = cursor.fetchone()["id"]
+    logger.debug("Upserted structure with ID: %s", structure_db_id)
+    return structure_db_id
+
+
 def insert_structure(project_id, project_location, structure_id, collection_date):
     """Insert or fetch a structure for a given project."""
     try:
-        conn = connect_db()
-        cursor = conn.cursor()
-
-        # Check if the structure already exists
-        cursor.execute(
-            """
-            SELECT id FROM Structures
-            WHERE project_id = ? AND project_location = ? AND structure_id = ? AND collection_date = ?
-            """,
-            (project_id, project_location, structure_id, collection_date),
-        )
-        result = cursor.fetchone()
-
-        # If the structure exists, return its ID
-        if result:
-            print(f"DEBUG: Structure already exists with ID: {result['id']}")
-            return result["id"]
-
-        # Otherwise, insert the new structure
-        cursor.execute(
-            """
-            INSERT INTO Structures (project_id, project_location, structure_id, collection_date)
-            VALUES (?, ?, ?, ?)
-            """,
-            (project_id, project_location, structure_id, collection_date),
-        )
-        conn.commit()
-        structure_db_id = cursor.lastrowid
-        print(f"DEBUG: Inserted new structure with ID: {structure_db_id}")
-        return structure_db_id
+        with transaction() as cursor:
+            return _get_or_create_structure(
+                cursor, project_id, project_location, structure_id, collection_date
+            )
     except Exception as e:
-        print(f"ERROR inserting structure: {e}")
+        logger.error("Error inserting structure: %s", e)
         raise
-    finally:
-        conn.close()
 
 
 
@@ -205,23 +253,76 @@ def get_files_by_structure_and_date(structure_db_id, collection_date):
     query = """
         SELECT filename, path
         FROM Files
-        WHERE structure_id = ? AND path LIKE ?
+        WHERE structure_id = ? AND collection_date = ?
     """
-    params = (structure_db_id, f"%{collection_date}%")
+    params = (structure_db_id, collection_date)
     return execute_query(query, params, fetch_all=True)
 
 
+def get_structure_db_id(project_number, collection_date, crew_initials, project_location, structure_id):
+    """Return the ID of the structure an upload with these fields goes to, or None if it has none yet."""
+    query = """
+        SELECT Structures.id
+        FROM Structures JOIN Projects ON Projects.id = Structures.project_id
+        WHERE Projects.project_number = ? AND Projects.date = ? AND Projects.crew_initials = ?
+          AND Structures.project_location = ? AND Structures.structure_id = ? AND Structures.collection_date = ?
+    """
+    params = (project_number, collection_date, crew_initials, project_location, structure_id, collection_date)
+    row = execute_query(query, params, fetch_one=True)
+    return row["id"] if row is not None else None
+
+
 # --- CRUD for Files ---
-def insert_file(structure_id, filename, full_path):
+def _insert_file_row(cursor, structure_id, filename, full_path, collection_date=None, content_hash=None):
+    """Insert a file record, or return the existing one for the same path."""
+    relative_path = Path(full_path).relative_to("data").as_posix()
+    params = (structure_id, filename, relative_path, collection_date, structure_id, content_hash)
+    logger.debug("Inserting file with params: %s", params)
+    # Without an explicit date the file inherits its structure's collection date
+    cursor.execute(
+        """
+        INSERT INTO Files (structure_id, filename, path, collection_date, content_hash)
+        VALUES (?, ?, ?, COALESCE(?, (SELECT collection_date FROM Structures WHERE id = ?)), ?)
+        ON CONFLICT (structure_id, path) DO UPDATE SET
+            filename = excluded.filename,
+            content_hash = COALESCE(excluded.content_hash, content_hash)
+        RETURNING id
+        """,
+        params,
+    )
+    return cursor.fetchone()["id"]
+
+
+def insert_file(structure_id, filename, full_path, collection_date=None, content_hash=None):
     try:
-        relative_path = Path(full_path).relative_to("data").as_posix()
-        query = "INSERT INTO Files (structure_id, filename, path) VALUES (?, ?, ?)"
-        params = (structure_id, filename, relative_path)
-        print(f"DEBUG: Inserting file with params: {params}")
-        result, file_id = execute_query(query, params, return_lastrowid=True)
-        return file_id
+        with transaction() as cursor:
+            return _insert_file_row(cursor, structure_id, filename, full_path, collection_date, content_hash)
     except Exception as e:
-        print(f"ERROR inserting file record: {e}")
+        logger.error("Error inserting file record: %s", e)
+        raise
+
+
+def insert_upload_records(project_number, collection_date, crew_initials, project_location, structure_id, files):
+    """
+    Insert the project, structure and file rows for one upload in a single transaction.
+
+    `files` is a list of (filename, full_path) or (filename, full_path, content_hash)
+    tuples. Returns (project_id, structure_db_id, file_ids); nothing is written if
+    any insert fails.
+    """
+    try:
+        with transaction() as cursor:
+            project_id = _get_or_create_project(cursor, project_number, collection_date, crew_initials)
+            structure_db_id = _get_or_create_structure(
+                cursor, project_id, project_location, structure_id, collection_date
+            )
+            file_ids = [
+                _insert_file_row(cursor, structure_db_id, filename, full_path, collection_date, *content_hash)
+                for filename, full_path, *content_hash in files
+            ]
+        return project_id, structure_db_id, file_ids
+    except Exception as e:
+        logger.error("Error inserting upload records: %s", e)
         raise
 
 
@@ -234,9 +335,324 @@ def get_files_by_structure(structure_id):
 
 
 def delete_file(file_id):
-    """Delete a file by its ID."""
-    query = "DELETE FROM Files WHERE id = ?"
-    params = (file_id,)
-    execute_query(query, params)
+    """Delete a file by its ID, with its metadata."""
+    with transaction() as cursor:
+        cursor.execute("DELETE FROM FileMetadata WHERE file_id = ?", (file_id,))
+        cursor.execute("DELETE FROM Files WHERE id = ?", (file_id,))
+
+
+def get_files_by_content_hash(content_hash, structure_db_id=None):
+    """Retrieve the files with this content hash, in one structure if given."""
+    if structure_db_id is None:
+        query = "SELECT * FROM Files WHERE content_hash = ? ORDER BY id"
+        return execute_query(query, (content_hash,), fetch_all=True)
+    query = "SELECT * FROM Files WHERE content_hash = ? AND structure_id = ? ORDER BY id"
+    return execute_query(query, (content_hash, structure_db_id), fetch_all=True)
+
+
+def get_unhashed_files(structure_db_id):
+    """Retrieve a structure's files that have no content hash recorded yet."""
+    query = "SELECT * FROM Files WHERE structure_id = ? AND content_hash IS NULL"
+    return execute_query(query, (structure_db_id,), fetch_all=True)
+
+
+def set_content_hashes(hashes):
+    """Record content hashes for files; `hashes` is a list of (file_id, content_hash) tuples."""
+    with transaction() as cursor:
+        cursor.executemany("UPDATE Files SET content_hash = ? WHERE id = ?", [(h, file_id) for file_id, h in hashes])
+
+
+# --- CRUD for FileMetadata ---
+FILE_METADATA_COLUMNS = (
+    "captured_at", "width", "height", "megapixels", "camera_make", "camera_model",
+    "projection", "orientation", "format", "error",
+)
+# Sort orders offered by the photo listings, mapped to ORDER BY terms; files without metadata sort last
+PHOTO_SORTS = {
+    "filename": "Files.filename",
+    "captured_at": "m.captured_at IS NULL, m.captured_at",
+    "megapixels": "m.megapixels IS NULL, m.megapixels",
+    "camera_model": "m.camera_model IS NULL, m.camera_model",
+}
+
+
+def save_file_metadata(rows):
+    """Insert or replace the metadata of files; rows are dicts with file_id and FILE_METADATA_COLUMNS."""
+    columns = ", ".join(FILE_METADATA_COLUMNS)
+    placeholders = ", ".join("?" for _ in FILE_METADATA_COLUMNS)
+    updates = ", ".join(f"{name} = excluded.{name}" for name in FILE_METADATA_COLUMNS)
+    query = f"""
+        INSERT INTO FileMetadata (file_id, {columns}) VALUES (?, {placeholders})
+        ON CONFLICT (file_id) DO UPDATE SET {updates}, extracted_at = datetime('now')
+    """
+    with transaction() as cursor:
+        cursor.executemany(
+            query, [(row["file_id"], *(row.get(name) for name in FILE_METADATA_COLUMNS)) for row in rows]
+        )
+
+
+def get_files_without_metadata(limit, after_id=0):
+    """Retrieve up to limit files with an ID above after_id that have no metadata row yet, by ID."""
+    query = """
+        SELECT Files.id, Files.path
+        FROM Files LEFT JOIN FileMetadata m ON m.file_id = Files.id
+        WHERE m.file_id IS NULL AND Files.id > ?
+        ORDER BY Files.id
+        LIMIT ?
+    """
+    return execute_query(query, (after_id, limit), fetch_all=True)
+
+
+def count_files_without_metadata():
+    query = """
+        SELECT COUNT(*) AS files
+        FROM Files LEFT JOIN FileMetadata m ON m.file_id = Files.id
+        WHERE m.file_id IS NULL
+    """
+    return execute_query(query, fetch_one=True)["files"]
+
+
+def get_files_with_metadata(structure_db_id, collection_date=None, sort="filename", descending=False,
+                            captured_after=None, captured_before=None, min_megapixels=None,
+                            camera_model=None, projection=None):
+    """
+    Retrieve a structure's files (on one date if given) with their metadata,
+    filtered and sorted in SQL. captured_after and captured_before are times
+    of day as HH:MM; sort is one of PHOTO_SORTS.
+    """
+    conditions = ["Files.structure_id = ?"]
+    params = [structure_db_id]
+    if collection_date is not None:
+        conditions.append("Files.collection_date = ?")
+        params.append(collection_date)
+    if captured_after:
+        conditions.append("substr(m.captured_at, 12) >= ?")
+        params.append(captured_after)
+    if captured_before:
+        conditions.append("substr(m.captured_at, 12) < ?")
+        params.append(captured_before)
+    if min_megapixels is not None:
+        conditions.append("m.megapixels >= ?")
+        params.append(min_megapixels)
+    if camera_model:
+        conditions.append("m.camera_model = ?")
+        params.append(camera_model)
+    if projection:
+        conditions.append("m.projection = ?")
+        params.append(projection)
+    order = PHOTO_SORTS.get(sort, PHOTO_SORTS["filename"])
+    if descending:
+        order = ", ".join(f"{term} DESC" if not term.endswith("IS NULL") else term for term in order.split(", "))
+    query = f"""
+        SELECT Files.id, Files.filename, Files.path, Files.collection_date,
+               m.captured_at, m.width, m.height, m.megapixels, m.camera_make, m.camera_model,
+               m.projection, m.orientation
+        FROM Files LEFT JOIN FileMetadata m ON m.file_id = Files.id
+        WHERE {" AND ".join(conditions)}
+        ORDER BY {order}, Files.filename
+    """
+    return execute_query(query, tuple(params), fetch_all=True)
+
+
+def get_metadata_choices(structure_db_id):
+    """Camera models and projections seen among a structure's files, for the filter menus."""
+    query = """
+        SELECT DISTINCT m.camera_model, m.projection
+        FROM Files JOIN FileMetadata m ON m.file_id = Files.id
+        WHERE Files.structure_id = ?
+    """
+    rows = execute_query(query, (structure_db_id,), fetch_all=True)
+    return {
+        "camera_models": sorted({row["camera_model"] for row in rows if row["camera_model"]}),
+        "projections": sorted({row["projection"] for row in rows if row["projection"]}),
+    }
+
+
+# --- CRUD for Jobs ---
+JOB_FIELDS = {
+    "status", "files_total", "files_done", "bytes_total", "bytes_done",
+    "message", "output", "timings", "started_at", "finished_at",
+}
+
+
+def insert_job(kind, params):
+    """Queue a job; params is a JSON string. Returns the job ID."""
+    query = "INSERT INTO Jobs (kind, params) VALUES (?, ?)"
+    result, job_id = execute_query(query, (kind, params), return_lastrowid=True)
+    return job_id
+
+
+def update_job(job_id, **fields):
+    """Update the given Jobs columns for one job."""
+    unknown = set(fields) - JOB_FIELDS
+    if unknown:
+        raise ValueError(f"Unknown job fields: {sorted(unknown)}")
+    assignments = ", ".join(f"{name} = ?" for name in fields)
+    query = f"UPDATE Jobs SET {assignments} WHERE id = ?"
+    execute_query(query, (*fields.values(), job_id))
+
+
+def get_job(job_id):
+    """Fetch a job by its ID."""
+    query = "SELECT * FROM Jobs WHERE id = ?"
+    return execute_query(query, (job_id,), fetch_one=True)
+
+
+def get_jobs_by_status(*statuses):
+    """Retrieve jobs in any of the given statuses, oldest first."""
+    placeholders = ", ".join("?" for _ in statuses)
+    query = f"SELECT * FROM Jobs WHERE status IN ({placeholders}) ORDER BY id"
+    return execute_query(query, statuses, fetch_all=True)
+
+
+def get_recent_jobs(limit=50):
+    """Retrieve the most recent jobs, newest first."""
+    query = "SELECT * FROM Jobs ORDER BY id DESC LIMIT ?"
+    return execute_query(query, (limit,), fetch_all=True)
+
+
+# --- CRUD for Blobs ---
+def get_blob_ref(path):
+    """Fetch the blob reference recorded for a path under data/."""
+    query = "SELECT * FROM BlobRefs WHERE path = ?"
+    return execute_query(query, (path,), fetch_one=True)
+
+
+def get_blob_refs():
+    """Retrieve every blob reference."""
+    query = "SELECT * FROM BlobRefs ORDER BY path"
+    return execute_query(query, fetch_all=True)
+
+
+def _drop_blob_ref(cursor, path):
+    cursor.execute("DELETE FROM BlobRefs WHERE path = ? RETURNING sha256", (path,))
+    row = cursor.fetchone()
+    if row is not None:
+        cursor.execute("UPDATE Blobs SET refcount = refcount - 1 WHERE sha256 = ?", (row["sha256"],))
+
+
+def set_blob_ref(path, sha256, size, mtime_ns):
+    """Point path at a blob, creating the blob row and keeping both refcounts right."""
+    with transaction() as cursor:
+        cursor.execute("SELECT sha256 FROM BlobRefs WHERE path = ?", (path,))
+        previous = cursor.fetchone()
+        if previous is not None and previous["sha256"] == sha256:
+            cursor.execute(
+                "UPDATE BlobRefs SET size = ?, mtime_ns = ? WHERE path = ?", (size, mtime_ns, path)
+            )
+            return
+        if previous is not None:
+            _drop_blob_ref(cursor, path)
+        cursor.execute(
+            "INSERT INTO Blobs (sha256, size) VALUES (?, ?) ON CONFLICT(sha256) DO NOTHING", (sha256, size)
+        )
+        cursor.execute(
+            "INSERT INTO BlobRefs (path, sha256, size, mtime_ns) VALUES (?, ?, ?, ?)",
+            (path, sha256, size, mtime_ns),
+        )
+        cursor.execute("UPDATE Blobs SET refcount = refcount + 1 WHERE sha256 = ?", (sha256,))
+
+
+def delete_blob_refs(paths):
+    """Drop the references for the given paths."""
+    with transaction() as cursor:
+        for path in paths:
+            _drop_blob_ref(cursor, path)
+
+
+def get_unreferenced_blobs(dropped=None):
+    """
+    Retrieve blobs no path refers to any more. dropped, a {sha256: count}
+    of references about to be dropped, counts those blobs as if they were.
+    """
+    query = "SELECT * FROM Blobs WHERE refcount <= 0"
+    blobs = list(execute_query(query, fetch_all=True))
+    for sha256, count in (dropped or {}).items():
+        query = "SELECT * FROM Blobs WHERE sha256 = ? AND refcount > 0 AND refcount <= ?"
+        blob = execute_query(query, (sha256, count), fetch_one=True)
+        if blob is not None:
+            blobs.append(blob)
+    return blobs
+
+
+def delete_blob(sha256):
+    """Remove a blob row, but only if nothing refers to it."""
+    query = "DELETE FROM Blobs WHERE sha256 = ? AND refcount <= 0"
+    execute_query(query, (sha256,))
+
+
+def get_blob_totals():
+    """Return (blobs, stored bytes, referenced bytes) for the store."""
+    query = """
+        SELECT COUNT(*) AS blobs,
+               COALESCE(SUM(size), 0) AS stored_bytes,
+               COALESCE(SUM(size * refcount), 0) AS referenced_bytes
+        FROM Blobs
+    """
+    row = execute_query(query, fetch_one=True)
+    return row["blobs"], row["stored_bytes"], row["referenced_bytes"]
+
+
+# --- CRUD for FileHashes ---
+def get_file_hash(path):
+    """Fetch the cached content hash for a path."""
+    query = "SELECT * FROM FileHashes WHERE path = ?"
+    return execute_query(query, (path,), fetch_one=True)
+
+
+def set_file_hash(path, size, mtime_ns, sha256):
+    """Record the content hash of a path as of the given size and mtime."""
+    query = """
+        INSERT INTO FileHashes (path, size, mtime_ns, sha256) VALUES (?, ?, ?, ?)
+        ON CONFLICT(path) DO UPDATE SET size = excluded.size, mtime_ns = excluded.mtime_ns, sha256 = excluded.sha256
+    """
+    execute_query(query, (path, size, mtime_ns, sha256))
+
+def get_hashed_paths(sha256):
+    """Retrieve the paths the FileHashes cache has seen with this content hash."""
+    query = "SELECT * FROM FileHashes WHERE sha256 = ?"
+    return execute_query(query, (sha256,), fetch_all=True)
+
+
+# --- CRUD for Uploads ---
+UPLOAD_UPDATE_COLUMNS = {"received", "status", "file_id"}
+
+
+def insert_upload(upload_id, project_number, collection_date, crew_initials, project_location, structure_id,
+                  filename, length, temp_path):
+    """Record a new resumable upload."""
+    query = """
+        INSERT INTO Uploads (id, project_number, collection_date, crew_initials, project_location, structure_id,
+                             filename, length, temp_path)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """
+    execute_query(query, (upload_id, project_number, collection_date, crew_initials, project_location,
+                          structure_id, filename, length, temp_path))
+
+
+def get_upload(upload_id):
+    """Fetch a resumable upload by its ID."""
+    query = "SELECT * FROM Uploads WHERE id = ?"
+    return execute_query(query, (upload_id,), fetch_one=True)
+
+
+def update_upload(upload_id, **fields):
+    """Update the given Uploads columns for one upload, and its updated_at."""
+    unknown = set(fields) - UPLOAD_UPDATE_COLUMNS
+    if unknown:
+        raise ValueError(f"Unknown upload fields: {sorted(unknown)}")
+    assignments = "".join(f"{name} = ?, " for name in fields)
+    query = f"UPDATE Uploads SET {assignments}updated_at = datetime('now') WHERE id = ?"
+    execute_query(query, (*fields.values(), upload_id))
+
+
+def delete_upload(upload_id):
+    """Delete a resumable upload record."""
+    query = "DELETE FROM Uploads WHERE id = ?"
+    execute_query(query, (upload_id,))
 
 
+def get_stale_uploads(max_age_hours):
+    """Retrieve uploads untouched for more than max_age_hours."""
+    query = "SELECT * FROM Uploads WHERE updated_at < datetime('now', ?)"
+    return execute_query(query, (f"-{max_age_hours} hours",), fetch_all=True)
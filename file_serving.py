@@ -0,0 +1,170 @@
+import logging
+import mimetypes
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import formatdate, parsedate_to_datetime
+from pathlib import Path
+
+from fastapi import Request
+from fastapi.responses import Response, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+
+from config import DATA_CACHE_CONTROL, DATA_CACHE_CONTROL_DEFAULT, DATA_ETAG_INLINE_MAX_MB, DATA_CHUNK_SIZE
+from db_manager import get_file_hash
+from hash_index import content_hash
+
+logger = logging.getLogger(__name__)
+
+# Large files are hashed one at a time in the background; their ETag is weak until then
+_hash_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="etag")
+_hashing = set()
+_hashing_lock = threading.Lock()
+
+
+def cache_control_for(relative_path: str):
+    """Cache-Control for a path relative to data/, chosen by its stage folder."""
+    stage = relative_path.split("/", 1)[0]
+    return DATA_CACHE_CONTROL.get(stage, DATA_CACHE_CONTROL_DEFAULT)
+
+
+def _hash_in_background(path: Path):
+    key = path.as_posix()
+    with _hashing_lock:
+        if key in _hashing:
+            return
+        _hashing.add(key)
+
+    def run():
+        try:
+            content_hash(path)
+        except OSError as e:
+            logger.warning("Error hashing %s for its ETag: %s", path, e)
+        finally:
+            with _hashing_lock:
+                _hashing.discard(key)
+
+    _hash_executor.submit(run)
+
+
+def etag_for(path: Path, st):
+    """
+    Strong ETag from the file's content hash when the hash index has it (or the
+    file is small enough to hash now), otherwise a weak size/mtime ETag while
+    the hash is computed in the background.
+    """
+    row = get_file_hash(path.as_posix())
+    if row is not None and row["size"] == st.st_size and row["mtime_ns"] == st.st_mtime_ns:
+        return f'"{row["sha256"]}"'
+    if st.st_size <= DATA_ETAG_INLINE_MAX_MB * 1024 * 1024:
+        return f'"{content_hash(path)}"'
+    _hash_in_background(path)
+    return f'W/"{st.st_size:x}-{st.st_mtime_ns:x}"'
+
+
+def _etag_matches(header, etag):
+    """Weak comparison, as If-None-Match requires."""
+    if header.strip() == "*":
+        return True
+    bare = etag.removeprefix("W/")
+    return any(candidate.strip().removeprefix("W/") == bare for candidate in header.split(","))
+
+
+def _not_modified(request: Request, etag, st):
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        return _etag_matches(if_none_match, etag)
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return int(st.st_mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def parse_range(header, size):
+    """
+    Parse a single "bytes=start-end" range into inclusive (start, end).
+    Returns None to serve the whole file: no header, several ranges, or a
+    header that is not a valid range, which RFC 9110 says to ignore. Raises
+    ValueError only for a valid range the file cannot satisfy.
+    """
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    start_text, _, end_text = header[len("bytes="):].strip().partition("-")
+    if not (start_text or end_text) or not all(text.isdigit() for text in (start_text, end_text) if text):
+        return None
+    if start_text:
+        start = int(start_text)
+        end = int(end_text) if end_text else size - 1
+        if end_text and start > end:
+            return None
+    else:
+        # "bytes=-500" is the last 500 bytes
+        length = int(end_text)
+        if length == 0:
+            raise ValueError(f"Unsatisfiable range: {header}")
+        start, end = max(0, size - length), size - 1
+    if start >= size:
+        raise ValueError(f"Unsatisfiable range: {header}")
+    return start, min(end, size - 1)
+
+
+def iter_file(path: Path, start, end, chunk_size=DATA_CHUNK_SIZE):
+    """Yield bytes start..end (inclusive) of a file in chunks."""
+    with open(path, "rb") as f:
+        f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = f.read(min(chunk_size, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+async def file_response(request: Request, path: Path, relative_path: str, cache_control=None, hash_content=True):
+    """
+    Serve a file with ETag, Last-Modified and a per-stage Cache-Control,
+    answering conditional requests with 304 and single byte ranges with 206.
+    hash_content=False uses a size/mtime ETag instead, for generated files
+    that are only ever replaced whole.
+    """
+    st = await run_in_threadpool(path.stat)
+    if hash_content:
+        etag = await run_in_threadpool(etag_for, path, st)
+    else:
+        etag = f'"{st.st_size:x}-{st.st_mtime_ns:x}"'
+    headers = {
+        "ETag": etag,
+        "Last-Modified": formatdate(st.st_mtime, usegmt=True),
+        "Cache-Control": cache_control or cache_control_for(relative_path),
+        "Accept-Ranges": "bytes",
+    }
+    if _not_modified(request, etag, st):
+        return Response(status_code=304, headers=headers)
+
+    media_type = mimetypes.guess_type(path.name)[0] or "application/octet-stream"
+    byte_range = None
+    if_range = request.headers.get("if-range")
+    # A stale If-Range (or a weak ETag, which cannot validate ranges) means send the whole file
+    if if_range is None or (if_range == etag and not etag.startswith("W/")):
+        try:
+            byte_range = parse_range(request.headers.get("range"), st.st_size)
+        except ValueError:
+            headers["Content-Range"] = f"bytes */{st.st_size}"
+            return Response(status_code=416, headers=headers)
+
+    start, end = byte_range or (0, st.st_size - 1)
+    headers["Content-Length"] = str(max(0, end - start + 1))
+    status_code = 200
+    if byte_range is not None:
+        status_code = 206
+        headers["Content-Range"] = f"bytes {start}-{end}/{st.st_size}"
+    if request.method == "HEAD" or st.st_size == 0:
+        return Response(status_code=status_code, headers=headers, media_type=media_type)
+    return StreamingResponse(iter_file(path, start, end), status_code=status_code, headers=headers, media_type=media_type)
+
+
+def shutdown():
+    _hash_executor.shutdown(wait=False, cancel_futures=True)
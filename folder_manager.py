@@ -1,6 +1,13 @@
+import logging
 import os
 from pathlib import Path
 import shutil  # Imported shutil for copying if needed
+import tempfile
+
+from config import UPLOAD_CHUNK_SIZE
+from metrics import record_transfer
+
+logger = logging.getLogger(__name__)
 
 # Define folder paths
 # BASE_DIR is updated to a relative path suitable for Windows
@@ -29,9 +36,9 @@ def setup_folders():
     for folder in folders:
         try:
             folder.mkdir(parents=True, exist_ok=True)
-            print(f"Ensured folder exists: {folder}")
+            logger.debug("Ensured folder exists: %s", folder)
         except Exception as e:
-            print(f"Error creating folder {folder}: {e}")
+            logger.error("Error creating folder %s: %s", folder, e)
 
 # Project and structure creation functions
 def create_project_root(data_dump, project_number, collection_date, crew_initials):
@@ -63,6 +70,7 @@ def organize_photos(data_dump, root_folder, photos, project_location, structure_
     for photo in photos:
         new_path = structure_folder / photo.name
         photo.rename(new_path)
+        record_transfer("organize", new_path, 1, new_path.stat().st_size)
         yield str(new_path.relative_to(data_dump))
 
 # Archiving functions
@@ -75,24 +83,91 @@ def archive_files(data_dump, archive_dir):
         if file.is_file():
             destination = archive_dir / file.name
             file.rename(destination)
-            print(f"Archived {file} to {destination}")
+            record_transfer("archive", destination, 1, destination.stat().st_size)
+            logger.debug("Archived %s to %s", file, destination)
+
+def _same_file(dst: Path, src_stat):
+    """Whether dst already holds the file with src_stat: the same inode, or the same size and mtime."""
+    try:
+        dst_stat = dst.stat()
+    except FileNotFoundError:
+        return False
+    if (dst_stat.st_dev, dst_stat.st_ino) == (src_stat.st_dev, src_stat.st_ino):
+        return True
+    return dst_stat.st_size == src_stat.st_size and int(dst_stat.st_mtime) == int(src_stat.st_mtime)
+
+
+def _merge_tree(source: Path, destination: Path, copy_function):
+    """
+    Move source's files into an existing destination tree, leaving files an
+    earlier move already completed, then remove source. Returns the number of
+    files skipped.
+    """
+    skipped = 0
+    for root, _, files in os.walk(source):
+        for name in files:
+            src = Path(root) / name
+            dst = destination / src.relative_to(source)
+            if _same_file(dst, src.stat()):
+                src.unlink()
+                skipped += 1
+                continue
+            dst.parent.mkdir(parents=True, exist_ok=True)
+            shutil.move(str(src), str(dst), copy_function=copy_function)
+    shutil.rmtree(source)
+    return skipped
+
 
-def archive_project_files(data_dump: Path, archive_dir: Path, project_folder_name: str):
+def archive_project_files(data_dump: Path, archive_dir: Path, project_folder_name: str, progress=None):
     """
     Move a project directory from Data Dump to Archive.
+
+    If given, progress is driven like in staging.stage_tree: a rename counts
+    the whole project at once, and a move across filesystems counts each
+    file as it is copied.
+
+    Safe to re-run after an interruption, as the archive job is on restart:
+    a project already in Archive with nothing left in Data Dump is done, and
+    one in both places, from a move across filesystems that broke off, is
+    merged, keeping the files that were already copied.
     """
     source = data_dump / project_folder_name
     destination = archive_dir / project_folder_name
+    if not source.exists() and destination.is_dir():
+        logger.info("'%s' is already archived", destination)
+        return
     if source.exists() and source.is_dir():
+        sizes = [Path(root, name).stat().st_size for root, _, files in os.walk(source) for name in files]
+        copied = 0
+        copied_bytes = 0
+        if progress is not None:
+            progress.set_totals(files=len(sizes), bytes=sum(sizes))
+
+        def copy_function(src, dst):
+            nonlocal copied, copied_bytes
+            shutil.copy2(src, dst)
+            size = os.path.getsize(dst)
+            copied += 1
+            copied_bytes += size
+            if progress is not None:
+                progress.advance(files=1, bytes=size)
         try:
-            shutil.move(str(source), str(destination))  # Use shutil.move to handle directories
-            print(f"Archived '{source}' to '{destination}'")
+            if destination.exists():
+                skipped = _merge_tree(source, destination, copy_function)
+                logger.info("Resumed archiving '%s': %d files were already in place", source, skipped)
+            else:
+                shutil.move(str(source), str(destination), copy_function=copy_function)  # Use shutil.move to handle directories
+            if progress is not None and copied < len(sizes):
+                # Files renamed or already in place were not counted as they went
+                progress.advance(files=len(sizes) - copied, bytes=sum(sizes) - copied_bytes)
+            record_transfer("archive", destination, len(sizes), sum(sizes))
+            logger.info("Archived '%s' to '%s'", source, destination)
         except Exception as e:
-            print(f"Error archiving directory '{source}': {e}")
+            logger.error("Error archiving directory '%s': %s", source, e)
             raise e
     else:
         error_msg = f"Directory '{source}' does not exist."
-        print(error_msg)
+        logger.error(error_msg)
         raise FileNotFoundError(error_msg)
 
 # File movement function
@@ -103,8 +178,43 @@ def move_file(source_path: Path, destination_path: Path):
     try:
         destination_path.parent.mkdir(parents=True, exist_ok=True)
         source_path.rename(destination_path)
-        print(f"Moved {source_path} to {destination_path}")
+        record_transfer("move", destination_path, 1, destination_path.stat().st_size)
+        logger.debug("Moved %s to %s", source_path, destination_path)
     except Exception as e:
-        print(f"Error moving file from {source_path} to {destination_path}: {e}")
+        logger.error("Error moving file from %s to %s: %s", source_path, destination_path, e)
+
+# Streaming write function
+def stream_to_file(source, destination_path: Path, chunk_size: int = UPLOAD_CHUNK_SIZE, digest=None):
+    """
+    Stream a file-like object to destination_path in chunks.
 
+    Data is written to a temporary file in the destination folder and renamed
+    into place once complete, so a partial upload never appears under its final
+    name. If given, digest (a hashlib object) is updated with every chunk on the
+    way. Returns the number of bytes written.
+    """
+    destination_path.parent.mkdir(parents=True, exist_ok=True)
+    fd, temp_name = tempfile.mkstemp(
+        dir=destination_path.parent, prefix=f".{destination_path.name}.", suffix=".part"
+    )
+    bytes_written = 0
+    try:
+        with os.fdopen(fd, "wb") as buffer:
+            while True:
+                chunk = source.read(chunk_size)
+                if not chunk:
+                    break
+                buffer.write(chunk)
+                if digest is not None:
+                    digest.update(chunk)
+                bytes_written += len(chunk)
+        os.replace(temp_name, destination_path)
+        record_transfer("write", destination_path, 1, bytes_written)
+    except BaseException:
+        try:
+            os.unlink(temp_name)
+        except OSError:
+            pass
+        raise
+    return bytes_written
 
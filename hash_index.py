@@ -0,0 +1,30 @@
+import hashlib
+from pathlib import Path
+
+from config import UPLOAD_CHUNK_SIZE
+from db_manager import get_file_hash, set_file_hash
+
+
+def file_sha256(path, chunk_size=UPLOAD_CHUNK_SIZE):
+    """SHA-256 of a file's contents as a hex string."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def content_hash(path: Path):
+    """
+    SHA-256 of a file, read from the FileHashes table while the file's size and
+    mtime still match, so each version of a file is only hashed once.
+    """
+    path = Path(path)
+    st = path.stat()
+    key = path.as_posix()
+    row = get_file_hash(key)
+    if row is not None and row["size"] == st.st_size and row["mtime_ns"] == st.st_mtime_ns:
+        return row["sha256"]
+    sha256 = file_sha256(path)
+    set_file_hash(key, st.st_size, st.st_mtime_ns, sha256)
+    return sha256
@@ -0,0 +1,167 @@
+import logging
+import os
+from pathlib import Path
+
+from blob_store import BlobStore
+from config import STAGING_LINK_MODE
+from db_manager import (
+    get_structure_db_id,
+    get_files_by_content_hash,
+    get_unhashed_files,
+    set_content_hashes,
+    get_hashed_paths,
+    set_file_hash,
+    insert_upload_records,
+)
+from folder_manager import BASE_DIR, DATA_DUMP, ARCHIVE, PROCESSING, UPLOADED
+from hash_index import content_hash
+
+logger = logging.getLogger(__name__)
+
+# Stages an uploaded file moves through; Files.path keeps the 01_DataDump path it was uploaded to
+UPLOAD_STAGES = (DATA_DUMP, ARCHIVE, PROCESSING, UPLOADED)
+# Fields naming where an upload goes, as sent to /upload/
+UPLOAD_FIELDS = ("project_number", "collection_date", "crew_initials", "project_location", "structure_id")
+# Stages whose files are never edited in place, so an upload may share their bytes through the blob store
+LINKABLE_STAGES = (DATA_DUMP, ARCHIVE)
+
+
+def upload_folder(base_dir, fields):
+    """{project}_{date}_{crew}/{location}_{structure}_{date} under base_dir, for a dict with UPLOAD_FIELDS."""
+    date = fields["collection_date"]
+    return (
+        Path(base_dir)
+        / f"{fields['project_number']}_{date}_{fields['crew_initials']}"
+        / f"{fields['project_location']}_{fields['structure_id']}_{date}"
+    )
+
+
+def locate_file(relative_path):
+    """Where a Files row's file is now: its recorded path, or the same place in a later stage. None if gone."""
+    recorded = BASE_DIR / relative_path
+    if recorded.exists():
+        return recorded
+    rest = Path(relative_path).parts[1:]
+    for stage in UPLOAD_STAGES:
+        candidate = stage.joinpath(*rest)
+        if candidate.exists():
+            return candidate
+    return None
+
+
+def _in_linkable_stage(path):
+    path = os.path.abspath(path)
+    return any(Path(path).is_relative_to(os.path.abspath(stage)) for stage in LINKABLE_STAGES)
+
+
+def hash_structure_files(structure_db_id):
+    """Fill in content_hash for a structure's files that were uploaded before hashes were recorded."""
+    hashes = []
+    for row in get_unhashed_files(structure_db_id):
+        path = locate_file(row["path"])
+        if path is not None:
+            hashes.append((row["id"], content_hash(path)))
+    if hashes:
+        set_content_hashes(hashes)
+        logger.info("Hashed %d earlier files of structure %s", len(hashes), structure_db_id)
+
+
+class Deduplicator:
+    """
+    Recognises uploads whose content the server already has, by SHA-256.
+
+    A file the structure already has is dropped rather than stored twice.
+    With STAGING_LINK_MODE "blob", a file held in Data Dump or Archive is
+    linked to that copy through the blob store, so its bytes are kept on disk
+    only once; files in the later stages may be edited in place and are never
+    linked to. Otherwise the bytes are stored again.
+    """
+
+    def __init__(self, blob_store=None, link_mode=STAGING_LINK_MODE):
+        self.blob_store = blob_store or BlobStore(BASE_DIR)
+        self.link_mode = link_mode
+
+    def existing_in_structure(self, sha256, structure_db_id):
+        """The structure's Files row with this content, or None."""
+        if structure_db_id is None:
+            return None
+        hash_structure_files(structure_db_id)
+        rows = get_files_by_content_hash(sha256, structure_db_id)
+        return rows[0] if rows else None
+
+    def link(self, sha256, size, destination: Path):
+        """
+        Make destination a link to a copy of this content held elsewhere.
+        Candidates are re-hashed by the blob store before linking, so a copy
+        edited since it was indexed is never used. Returns whether it linked,
+        which is never unless link_mode is "blob".
+        """
+        if self.link_mode != "blob":
+            return False
+        if self.blob_store.link_blob(sha256, destination):
+            return True
+        candidates = [locate_file(row["path"]) for row in get_files_by_content_hash(sha256)]
+        candidates.extend(Path(row["path"]) for row in get_hashed_paths(sha256))
+        candidates = [source for source in candidates if source is not None and _in_linkable_stage(source)]
+        for source in candidates:
+            try:
+                if source.stat().st_size != size or (
+                    destination.exists() and source.samefile(destination)
+                ):
+                    continue
+                found, _ = self.blob_store.ingest_file(source)
+            except (OSError, ValueError):  # Gone, or outside data/
+                continue
+            if found == sha256:
+                return self.blob_store.link_blob(sha256, destination)
+        return False
+
+    def place(self, path: Path, sha256, size, structure_db_id):
+        """
+        Deal with a file just written to path. Returns (status, file_id):
+        "duplicate" with the existing row's ID if the structure already has the
+        content (path is removed unless it is that row's own file), "linked" if
+        path now shares another copy's bytes, or "stored" if the content is new.
+        """
+        existing = self.existing_in_structure(sha256, structure_db_id)
+        if existing is not None:
+            if BASE_DIR / existing["path"] != path:
+                path.unlink()
+            return "duplicate", existing["id"]
+        try:
+            linked = self.link(sha256, size, path)
+        except OSError as e:
+            logger.warning("Could not link %s to an earlier copy: %s", path, e)
+            linked = False
+        # Cached so serving and thumbnailing the new file do not hash it again
+        st = path.stat()
+        set_file_hash(path.as_posix(), st.st_size, st.st_mtime_ns, sha256)
+        return ("linked" if linked else "stored"), None
+
+    def precheck(self, fields, files, link=False):
+        """
+        Which of the files an upload would send the server already has.
+
+        files are dicts with sha256 and, to be linked, filename and size. Each
+        result is the file with a status: "present" in the structure already,
+        "linked" into the upload folder from a copy elsewhere (with link=True),
+        or "missing" if it has to be sent.
+        """
+        structure_db_id = get_structure_db_id(*(fields[key] for key in UPLOAD_FIELDS))
+        folder = upload_folder(DATA_DUMP, fields)
+        results = []
+        for entry in files:
+            sha256 = entry["sha256"].lower()
+            result = {"sha256": sha256, "filename": entry.get("filename"), "status": "missing", "file_id": None}
+            existing = self.existing_in_structure(sha256, structure_db_id)
+            if existing is not None:
+                result.update(status="present", file_id=existing["id"])
+            elif link and entry.get("filename") and entry.get("size") is not None:
+                destination = folder / Path(entry["filename"]).name
+                if not destination.exists() and self.link(sha256, entry["size"], destination):
+                    _, structure_db_id, (file_id,) = insert_upload_records(
+                        *(fields[key] for key in UPLOAD_FIELDS), [(destination.name, str(destination), sha256)]
+                    )
+                    result.update(status="linked", file_id=file_id)
+            results.append(result)
+        return results
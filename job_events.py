@@ -0,0 +1,118 @@
+import asyncio
+import json
+import time
+
+from starlette.concurrency import run_in_threadpool
+
+from config import JOB_EVENT_INTERVAL_SECONDS, JOB_EVENT_KEEPALIVE_SECONDS, JOB_EVENT_BACKLOG_LINES
+
+FINISHED = ("succeeded", "failed")
+COUNTERS = ("files_total", "files_done", "bytes_total", "bytes_done")
+
+
+def format_event(name, data):
+    """One Server-Sent Event with a JSON payload."""
+    return f"event: {name}\ndata: {json.dumps(data)}\n\n"
+
+
+class RateMeter:
+    """Exponentially smoothed files and bytes per second from successive progress samples."""
+
+    def __init__(self, smoothing=0.3):
+        self.smoothing = smoothing
+        self.files_per_second = 0.0
+        self.bytes_per_second = 0.0
+        self._last = None
+
+    def update(self, files_done, bytes_done, now):
+        if self._last is not None:
+            last_files, last_bytes, last_time = self._last
+            elapsed = now - last_time
+            if elapsed > 0 and files_done >= last_files:
+                self.files_per_second += self.smoothing * ((files_done - last_files) / elapsed - self.files_per_second)
+                self.bytes_per_second += self.smoothing * ((bytes_done - last_bytes) / elapsed - self.bytes_per_second)
+        self._last = (files_done, bytes_done, now)
+
+    def eta(self, progress):
+        """Seconds left, from bytes if the job counts them and from files otherwise; None while unknown."""
+        if progress["bytes_total"] and self.bytes_per_second > 0:
+            return max(0.0, (progress["bytes_total"] - progress["bytes_done"]) / self.bytes_per_second)
+        if progress["files_total"] and self.files_per_second > 0:
+            return max(0.0, (progress["files_total"] - progress["files_done"]) / self.files_per_second)
+        return None
+
+
+async def job_event_stream(request, job_queue, job_id):
+    """
+    Yield Server-Sent Events for a job until it finishes or the client goes away:
+
+    - "progress": counts, status, smoothed files/s and bytes/s, and an ETA
+    - "log": output lines not sent yet; the first one has "backlog": true and
+      carries up to JOB_EVENT_BACKLOG_LINES earlier lines
+    - "done": the final status, message and stage timings
+
+    A running job is sampled from memory every JOB_EVENT_INTERVAL_SECONDS and
+    progress is only sent when it changed, so a copy of 100k files produces at
+    most one event per interval. Jobs not running in this process (queued,
+    waiting to resume, or finished) are read from the database.
+    """
+    meter = RateMeter()
+    sent_lines = None
+    last_progress = None
+    last_event = time.monotonic()
+    yield f"retry: {int(JOB_EVENT_INTERVAL_SECONDS * 4000)}\n\n"
+
+    while not await request.is_disconnected():
+        now = time.monotonic()
+        live = job_queue.live(job_id, sent_lines or 0)
+        if live is not None:
+            counters, lines = live
+            status = "running"
+            job = None
+        else:
+            job = await run_in_threadpool(job_queue.status, job_id)
+            if job is None:
+                return
+            counters = job
+            status = job["status"]
+            # Output stored for a job that is not running here is from an earlier run until it finishes
+            lines = job["output"].split("\n") if job["output"] and status in FINISHED else []
+            lines = lines[sent_lines or 0:]
+
+        events = []
+        if sent_lines is None:
+            if live is not None or status in FINISHED:
+                events.append(format_event("log", {"lines": lines[-JOB_EVENT_BACKLOG_LINES:], "backlog": True}))
+                sent_lines = len(lines)
+        elif lines:
+            events.append(format_event("log", {"lines": lines}))
+            sent_lines += len(lines)
+
+        meter.update(counters["files_done"], counters["bytes_done"], now)
+        progress = {field: counters[field] for field in COUNTERS}
+        progress["status"] = status
+        if progress != last_progress:
+            last_progress = dict(progress)
+            progress.update(
+                files_per_second=round(meter.files_per_second, 2),
+                bytes_per_second=round(meter.bytes_per_second),
+                eta_seconds=meter.eta(progress),
+            )
+            events.append(format_event("progress", progress))
+
+        if job is not None and status in FINISHED:
+            events.append(format_event("done", {
+                "status": status,
+                "message": job["message"],
+                "timings": job["timings"],
+            }))
+            yield "".join(events)
+            return
+
+        if events:
+            yield "".join(events)
+            last_event = now
+        elif now - last_event >= JOB_EVENT_KEEPALIVE_SECONDS:
+            yield ": keep-alive\n\n"
+            last_event = now
+        await asyncio.sleep(JOB_EVENT_INTERVAL_SECONDS)
@@ -0,0 +1,226 @@
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from config import JOB_WORKERS, JOB_PROGRESS_FLUSH_SECONDS
+from db_manager import insert_job, update_job, get_job, get_jobs_by_status, get_recent_jobs
+from logs import request_id
+from metrics import JOB_DURATION, JOB_STAGE_DURATION
+
+logger = logging.getLogger(__name__)
+
+
+class JobStopped(BaseException):
+    """
+    Raised in a job's thread when the queue shuts down, at its next progress
+    report. A BaseException so handlers' `except Exception` cleanup does not
+    swallow it; the job stays running and resumes on next start.
+    """
+
+
+class JobContext:
+    """
+    Passed to a job handler to report progress and output.
+
+    Progress, output lines and stage timings are kept in memory and written to
+    the Jobs table at most once per JOB_PROGRESS_FLUSH_SECONDS, so a copy of
+    100k small files does not turn into 100k database writes.
+    """
+
+    def __init__(self, job, stopping=None):
+        # A resumed job starts counting again; handlers re-walk their work and skip what is done
+        self.job_id = job["id"]
+        self.kind = job["kind"]
+        self.files_total = job["files_total"]
+        self.files_done = 0
+        self.bytes_total = job["bytes_total"]
+        self.bytes_done = 0
+        self.output_lines = []
+        self.timings = {}
+        self._stopping = stopping or threading.Event()
+        self._last_flush = 0.0
+
+    def _check_stopping(self):
+        if self._stopping.is_set():
+            raise JobStopped(f"Job {self.job_id} stopped by shutdown")
+
+    def set_totals(self, files=None, bytes=None):
+        if files is not None:
+            self.files_total = files
+        if bytes is not None:
+            self.bytes_total = bytes
+        self.flush(force=True)
+
+    def advance(self, files=0, bytes=0):
+        self.files_done += files
+        self.bytes_done += bytes
+        self.flush()
+        self._check_stopping()
+
+    def log(self, line):
+        # One entry per "\n"-separated line, so the stored output splits back into the same lines
+        self.output_lines.extend(line.rstrip("\n").split("\n"))
+        self.flush()
+        self._check_stopping()
+
+    @contextmanager
+    def stage(self, name):
+        """Time the enclosed block as one stage of the job."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record_timing(name, time.perf_counter() - started)
+
+    def record_timing(self, name, seconds):
+        self.timings[name] = round(seconds, 3)
+        JOB_STAGE_DURATION.observe(seconds, kind=self.kind, stage=name)
+        self.log(f"Stage {name}: {seconds:.2f}s")
+
+    def flush(self, force=False):
+        now = time.monotonic()
+        if not force and now - self._last_flush < JOB_PROGRESS_FLUSH_SECONDS:
+            return
+        self._last_flush = now
+        update_job(
+            self.job_id,
+            files_total=self.files_total,
+            files_done=self.files_done,
+            bytes_total=self.bytes_total,
+            bytes_done=self.bytes_done,
+            output="\n".join(self.output_lines),
+            timings=json.dumps(self.timings),
+        )
+
+    def snapshot(self):
+        return {
+            "files_total": self.files_total,
+            "files_done": self.files_done,
+            "bytes_total": self.bytes_total,
+            "bytes_done": self.bytes_done,
+            "timings": dict(self.timings),
+        }
+
+
+class JobQueue:
+    """
+    Runs registered job kinds on a bounded thread pool, backed by the Jobs table.
+
+    enqueue() records the job and returns its ID straight away. Jobs still
+    queued or running when the app stopped are picked up again by start(), so
+    handlers should be safe to re-run (for example by skipping files that were
+    already copied).
+
+    shutdown() stops running jobs at their next progress report or output
+    line (see JobStopped), so stopping the app does not wait for a long copy or
+    processing run; work between two reports, such as one large file, is
+    still finished first.
+    """
+
+    def __init__(self, max_workers=JOB_WORKERS):
+        self.max_workers = max_workers
+        self._handlers = {}
+        self._active = {}
+        self._executor = None
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+
+    def handler(self, kind):
+        """Decorator registering fn(ctx, **params) as the handler for a job kind."""
+        def register(fn):
+            self._handlers[kind] = fn
+            return fn
+        return register
+
+    def _ensure_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="job")
+            return self._executor
+
+    def start(self):
+        """Start the worker pool and resume jobs left over from a previous run."""
+        self._stopping.clear()
+        executor = self._ensure_executor()
+        for job in get_jobs_by_status("queued", "running"):
+            logger.info("Resuming job %s (%s)", job["id"], job["kind"])
+            executor.submit(self._run, job["id"])
+
+    def shutdown(self):
+        """
+        Stop taking work and stop running jobs at their next report; unfinished
+        jobs stay queued or running and resume on next start.
+        """
+        self._stopping.set()
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+    def enqueue(self, kind, **params):
+        if kind not in self._handlers:
+            raise ValueError(f"Unknown job kind: {kind}")
+        job_id = insert_job(kind, json.dumps(params))
+        self._ensure_executor().submit(self._run, job_id)
+        return job_id
+
+    def _run(self, job_id):
+        job = get_job(job_id)
+        if job is None or job["status"] not in ("queued", "running"):
+            return
+        ctx = JobContext(job, self._stopping)
+        # Log records from the job carry its ID in place of a request's
+        request_id.set(f"job-{job_id}")
+        self._active[job_id] = ctx
+        started = time.perf_counter()
+        update_job(job_id, status="running", started_at=_now(), message=None)
+        try:
+            self._handlers[job["kind"]](ctx, **json.loads(job["params"]))
+            status, message = "succeeded", None
+        except JobStopped:
+            logger.info("Job %s (%s) stopped by shutdown; it resumes on next start", job_id, job["kind"])
+            return
+        except Exception as e:
+            logger.exception("Job %s (%s) failed: %s", job_id, job["kind"], e)
+            status, message = "failed", str(e)
+        finally:
+            # Written before the job leaves _active, so readers never see older progress than before
+            ctx.flush(force=True)
+            self._active.pop(job_id, None)
+        update_job(job_id, status=status, message=message, finished_at=_now())
+        JOB_DURATION.observe(time.perf_counter() - started, kind=job["kind"], status=status)
+
+    def _as_dict(self, job):
+        status = dict(job)
+        status["params"] = json.loads(status["params"])
+        status["timings"] = json.loads(status["timings"]) if status["timings"] else {}
+        ctx = self._active.get(job["id"])
+        if ctx is not None:
+            status.update(ctx.snapshot())
+        return status
+
+    def status(self, job_id):
+        """Current state of a job as a dict, with live progress if it is running."""
+        job = get_job(job_id)
+        return self._as_dict(job) if job is not None else None
+
+    def live(self, job_id, output_from=0):
+        """
+        In-memory progress of a job running in this process and its output
+        lines from output_from on, or None if it is not running here.
+        Unlike status() this never touches the database.
+        """
+        ctx = self._active.get(job_id)
+        if ctx is None:
+            return None
+        return ctx.snapshot(), ctx.output_lines[output_from:]
+
+    def recent(self, limit=50):
+        return [self._as_dict(job) for job in get_recent_jobs(limit)]
+
+
+def _now():
+    return time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime())
@@ -0,0 +1,119 @@
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+import threading
+import time
+import uuid
+
+from config import LOG_LEVEL, LOG_FORMAT, LOG_DEBUG_RATE
+
+# Correlation ID of the request or job the current code runs for; "-" outside both.
+# run_in_threadpool copies the context, so it follows a request into worker threads
+request_id = contextvars.ContextVar("request_id", default="-")
+
+TEXT_FORMAT = "%(asctime)s %(levelname)-7s [%(request_id)s] %(name)s: %(message)s"
+# LogRecord attributes that are not extra= fields
+_RECORD_FIELDS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "request_id"}
+
+_listener = None
+_setup_lock = threading.Lock()
+
+
+def new_request_id():
+    return uuid.uuid4().hex[:12]
+
+
+class CorrelationFilter(logging.Filter):
+    """Stamps records with the current request_id, in the thread that logged them."""
+
+    def filter(self, record):
+        record.request_id = request_id.get()
+        return True
+
+
+class DebugRateLimit(logging.Filter):
+    """
+    Lets through at most `rate` DEBUG records per second from each logging
+    call site, so a debug line inside a per-file loop cannot flood the log.
+    The next record let through from a call site says how many were dropped.
+    """
+
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+        self._sites = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno > logging.DEBUG or self.rate <= 0:
+            return True
+        site = (record.pathname, record.lineno)
+        now = time.monotonic()
+        with self._lock:
+            window_start, count, dropped = self._sites.get(site, (now, 0, 0))
+            if now - window_start >= 1:
+                window_start, count = now, 0
+            if count >= self.rate:
+                self._sites[site] = (window_start, count, dropped + 1)
+                return False
+            self._sites[site] = (window_start, count + 1, 0)
+        if dropped:
+            record.msg = f"{record.msg} ({dropped} similar suppressed)"
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, including fields passed with extra=."""
+
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "request_id": getattr(record, "request_id", "-"),
+            "message": record.getMessage(),
+        }
+        entry.update((key, value) for key, value in vars(record).items() if key not in _RECORD_FIELDS)
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class _StdoutHandler(logging.StreamHandler):
+    """Writes to whatever sys.stdout is when the record is written, so redirections apply."""
+
+    def emit(self, record):
+        self.stream = sys.stdout
+        super().emit(record)
+
+
+def setup_logging(level=LOG_LEVEL, log_format=LOG_FORMAT, debug_rate=LOG_DEBUG_RATE):
+    """
+    Route the root logger through a queue to a listener thread, so callers
+    never wait on the console. Records below `level` cost only a level check;
+    message arguments are formatted only for records that pass. Safe to call
+    more than once: later calls just change the level.
+    """
+    global _listener
+    root = logging.getLogger()
+    root.setLevel(level.upper() if isinstance(level, str) else level)
+    with _setup_lock:
+        if _listener is not None:
+            return
+        output = _StdoutHandler()
+        output.setFormatter(JsonFormatter() if log_format == "json" else logging.Formatter(TEXT_FORMAT))
+
+        records = queue.SimpleQueue()
+        handler = logging.handlers.QueueHandler(records)
+        handler.addFilter(CorrelationFilter())
+        handler.addFilter(DebugRateLimit(debug_rate))
+        root.addHandler(handler)
+
+        _listener = logging.handlers.QueueListener(records, output, respect_handler_level=True)
+        _listener.start()
+        # Drain what is still queued on exit
+        atexit.register(_listener.stop)
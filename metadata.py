@@ -0,0 +1,177 @@
+import logging
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from PIL import ExifTags, Image, UnidentifiedImageError
+
+from config import METADATA_WORKERS, METADATA_BATCH_SIZE
+from db_manager import save_file_metadata, get_files_without_metadata, count_files_without_metadata
+from ingest import locate_file
+
+logger = logging.getLogger(__name__)
+
+# EXIF tags read; capture time is DateTimeOriginal, or DateTime for cameras that only write that
+TAG_DATETIME = 306
+TAG_MAKE = 271
+TAG_MODEL = 272
+TAG_ORIENTATION = 274
+TAG_DATETIME_ORIGINAL = 36867
+# Where Pillow leaves the XMP packet: JPEG APP1, PNG iTXt, WebP chunk; TIFF keeps it in tag 700
+XMP_INFO_KEYS = ("xmp", "XML:com.adobe.xmp")
+TAG_XMP = 700
+# GPano:ProjectionType, as an attribute or an element
+PROJECTION_PATTERN = re.compile(rb"GPano:ProjectionType(?:\s*=\s*[\"']|>)\s*([A-Za-z_-]+)")
+EXIF_DATETIME_PATTERN = re.compile(r"(\d{4}):(\d{2}):(\d{2})[ T](\d{2}):(\d{2}):(\d{2})")
+
+
+def _text(value):
+    if isinstance(value, bytes):
+        value = value.decode("utf-8", "replace")
+    value = str(value).strip("\x00 ") if value is not None else ""
+    return value or None
+
+
+def _captured_at(value):
+    """EXIF "YYYY:MM:DD HH:MM:SS" as "YYYY-MM-DD HH:MM:SS", which sorts and slices in SQL; None if malformed."""
+    match = EXIF_DATETIME_PATTERN.match(_text(value) or "")
+    if not match:
+        return None
+    year, month, day, hour, minute, second = match.groups()
+    return f"{year}-{month}-{day} {hour}:{minute}:{second}"
+
+
+def _xmp_packet(img):
+    for key in XMP_INFO_KEYS:
+        if img.info.get(key):
+            return img.info[key]
+    tag = getattr(img, "tag_v2", None)
+    return tag.get(TAG_XMP) if tag is not None else None
+
+
+def _exif(img):
+    """
+    The image's EXIF. PNG's getexif() decodes the whole image to look for an
+    eXIf chunk after the pixel data, so a PNG only has the EXIF found in
+    front of it.
+    """
+    if img.format == "PNG" and "exif" not in img.info:
+        return Image.Exif()
+    return img.getexif()
+
+
+def extract_metadata(path: Path):
+    """
+    Capture time, size, camera, projection and orientation of an image, read
+    from its headers: Image.open parses those without decoding any pixels.
+    Returns a dict of db_manager.FILE_METADATA_COLUMNS; for a file Pillow
+    cannot read (a video, say) only error is set.
+    """
+    try:
+        with Image.open(path) as img:
+            exif = _exif(img)
+            details = exif.get_ifd(ExifTags.IFD.Exif)
+            xmp = _xmp_packet(img)
+            if isinstance(xmp, str):
+                xmp = xmp.encode("utf-8", "replace")
+            projection = PROJECTION_PATTERN.search(xmp) if xmp else None
+            width, height = img.size
+            orientation = exif.get(TAG_ORIENTATION)
+            return {
+                "captured_at": _captured_at(details.get(TAG_DATETIME_ORIGINAL) or exif.get(TAG_DATETIME)),
+                "width": width,
+                "height": height,
+                "megapixels": round(width * height / 1_000_000, 2),
+                "camera_make": _text(exif.get(TAG_MAKE)),
+                "camera_model": _text(exif.get(TAG_MODEL)),
+                "projection": projection.group(1).decode("ascii").lower() if projection else None,
+                "orientation": orientation if isinstance(orientation, int) else None,
+                "format": img.format,
+                "error": None,
+            }
+    except UnidentifiedImageError:
+        return {"error": "not an image"}
+    except (OSError, ValueError, SyntaxError, Image.DecompressionBombError) as e:
+        return {"error": str(e) or type(e).__name__}
+
+
+class MetadataExtractor:
+    """
+    Fills the FileMetadata table from image headers on a small thread pool,
+    so each photo is opened once at ingest instead of on every query.
+
+    New uploads are handed over with submit() and extracted in the
+    background; files from before the table existed are caught up by
+    backfill(), in batches. A file that cannot be read still gets a row, with
+    error set, so it is not tried again.
+    """
+
+    def __init__(self, workers=METADATA_WORKERS, batch_size=METADATA_BATCH_SIZE):
+        self.workers = workers
+        self.batch_size = batch_size
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def _pool(self):
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="metadata")
+        return self._executor
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def extract(self, files, parallel=True):
+        """
+        Extract and save the metadata of files, a list of (file_id, path);
+        spread over the pool unless parallel is False. Returns the rows.
+        """
+        paths = [Path(path) for _, path in files]
+        found = self._pool().map(extract_metadata, paths) if parallel else map(extract_metadata, paths)
+        rows = [{"file_id": file_id, **values} for (file_id, _), values in zip(files, found)]
+        if rows:
+            save_file_metadata(rows)
+        return rows
+
+    def submit(self, files):
+        """Extract the metadata of newly ingested files, a list of (file_id, path), in the background."""
+        files = [(file_id, path) for file_id, path in files if file_id is not None]
+        if not files:
+            return None
+        return self._pool().submit(self._extract_quietly, files)
+
+    def _extract_quietly(self, files):
+        try:
+            # Already on a pool thread; waiting on the pool from here could deadlock it
+            return self.extract(files, parallel=False)
+        except Exception:
+            logger.exception("Error extracting metadata of %d files", len(files))
+            return []
+
+    def backfill(self, progress=None):
+        """
+        Extract the metadata of every file that has none yet, batch_size files
+        at a time. If given, progress is driven like a job context. Returns how
+        many files got a row.
+        """
+        if progress is not None:
+            progress.set_totals(files=count_files_without_metadata())
+        done = 0
+        after_id = 0
+        while True:
+            batch = get_files_without_metadata(self.batch_size, after_id)
+            if not batch:
+                break
+            after_id = batch[-1]["id"]
+            # Files no longer on disk are left for a later run
+            found = [(row["id"], locate_file(row["path"])) for row in batch]
+            found = [(file_id, path) for file_id, path in found if path is not None]
+            done += len(self.extract(found))
+            if progress is not None:
+                progress.advance(files=len(batch))
+        logger.info("Backfilled metadata of %d files", done)
+        return done
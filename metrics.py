@@ -0,0 +1,198 @@
+import os
+import threading
+from bisect import bisect_left
+
+# Request and query latencies, in seconds
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+# Subprocesses, jobs and their stages, in seconds
+DURATION_BUCKETS = (0.1, 0.5, 1, 5, 10, 30, 60, 300, 900, 1800, 3600, 7200)
+# Per-file upload throughput, in bytes per second
+THROUGHPUT_BUCKETS = tuple(mb * 1024 * 1024 for mb in (1, 5, 10, 25, 50, 100, 250, 500, 1000))
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    pairs.extend(f'{name}="{value}"' for name, value in extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """Base for a named metric with a fixed set of label names; values are kept per label combination."""
+
+    kind = None
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} takes labels {self.labelnames}, got {sorted(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self):
+        """Yield (suffix, label values, extra labels, value) for every series."""
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in sorted(items):
+            yield "", key, (), value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+        for suffix, key, extra, value in self.samples():
+            lines.append(f"{self.name}{suffix}{_format_labels(self.labelnames, key, extra)} {_format_number(value)}")
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    """A value that goes up and down. With collect, values are read from collect() at every scrape."""
+
+    kind = "gauge"
+
+    def __init__(self, name, help_text, labelnames=(), collect=None):
+        super().__init__(name, help_text, labelnames)
+        self.collect = collect
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def samples(self):
+        if self.collect is None:
+            yield from super().samples()
+            return
+        for key, value in sorted(self.collect().items()):
+            yield "", key, (), value
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                series = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][bisect_left(self.buckets, value)] += 1
+            series[1] += value
+
+    def samples(self):
+        with self._lock:
+            items = [(key, (list(counts), total)) for key, (counts, total) in self._values.items()]
+        for key, (counts, total) in sorted(items):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                yield "_bucket", key, (("le", _format_number(float(bound))),), cumulative
+            yield "_sum", key, (), total
+            yield "_count", key, (), cumulative
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} is already registered")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return "\n".join(metric.render() for metric in metrics) + "\n"
+
+
+registry = Registry()
+
+HTTP_REQUEST_DURATION = registry.register(Histogram(
+    "http_request_duration_seconds", "Time until the response started, by route template.",
+    ("method", "route", "status"),
+))
+DB_QUERY_DURATION = registry.register(Histogram(
+    "db_query_duration_seconds", "Queries run through execute_query, by statement type.", ("operation",),
+))
+DB_QUERY_ERRORS = registry.register(Counter(
+    "db_query_errors_total", "Queries run through execute_query that raised.", ("operation",),
+))
+FILES_MOVED = registry.register(Counter(
+    "files_moved_total", "Files moved, copied or written into a stage folder.", ("stage", "operation"),
+))
+BYTES_MOVED = registry.register(Counter(
+    "bytes_moved_total", "Bytes of the files counted by files_moved_total.", ("stage", "operation"),
+))
+SUBPROCESS_DURATION = registry.register(Histogram(
+    "subprocess_duration_seconds", "Tool subprocesses run for jobs, by script and outcome.",
+    ("command", "outcome"), buckets=DURATION_BUCKETS,
+))
+JOB_DURATION = registry.register(Histogram(
+    "job_duration_seconds", "Background jobs from start to finish, by kind and final status.",
+    ("kind", "status"), buckets=DURATION_BUCKETS,
+))
+JOB_STAGE_DURATION = registry.register(Histogram(
+    "job_stage_duration_seconds", "Stages recorded by jobs, such as staging files or pixelating.",
+    ("kind", "stage"), buckets=DURATION_BUCKETS,
+))
+UPLOAD_BYTES = registry.register(Counter("upload_bytes_total", "Bytes received by /upload/."))
+UPLOAD_SECONDS = registry.register(Counter("upload_seconds_total", "Time spent writing uploads to disk."))
+UPLOAD_THROUGHPUT = registry.register(Histogram(
+    "upload_throughput_bytes_per_second", "Per-file upload speed.", buckets=THROUGHPUT_BUCKETS,
+))
+
+
+def query_operation(query):
+    """Statement type of a query for labels: SELECT, INSERT, UPDATE, DELETE or OTHER."""
+    word = query.lstrip().split(None, 1)[0].upper() if query.strip() else ""
+    return word if word in ("SELECT", "INSERT", "UPDATE", "DELETE") else "OTHER"
+
+
+def stage_of(path, base_dir="data"):
+    """Stage folder a path under base_dir belongs to, e.g. "02_Archive", or "other"."""
+    relative = os.path.relpath(os.path.abspath(path), os.path.abspath(base_dir))
+    stage = relative.replace(os.sep, "/").split("/", 1)[0]
+    return "other" if stage in ("", ".", "..") or stage.startswith(".") else stage
+
+
+def record_transfer(operation, destination, files, bytes):
+    stage = stage_of(destination)
+    FILES_MOVED.inc(files, stage=stage, operation=operation)
+    BYTES_MOVED.inc(bytes, stage=stage, operation=operation)
+
+
+def record_upload(size, seconds):
+    UPLOAD_BYTES.inc(size)
+    UPLOAD_SECONDS.inc(seconds)
+    if seconds > 0:
+        UPLOAD_THROUGHPUT.observe(size / seconds)
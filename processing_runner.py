@@ -0,0 +1,219 @@
+import importlib
+import multiprocessing
+import os
+import re
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+from pathlib import Path
+
+from config import PROCESSING_BACKEND, PROCESSING_WORKERS, PIXELATE_FAST
+from metrics import SUBPROCESS_DURATION
+
+# Tool output lines announcing how many images a run will handle, and that one more is done
+TOTAL_LINE = re.compile(r"DEBUG: (\d+) (?:new or changed|pyramids to build)")
+PROGRESS_LINE = re.compile(r"(Processed|Built pyramid|Converted): ")
+
+
+def handle_line(ctx, line):
+    """Log one line of tool output on the job, updating its progress from the lines that report it."""
+    ctx.log(line)
+    total = TOTAL_LINE.match(line)
+    if total:
+        ctx.set_totals(files=int(total.group(1)))
+    elif PROGRESS_LINE.match(line):
+        ctx.advance(files=1)
+
+
+def stream_command(ctx, args, name):
+    """
+    Run a command, logging its output on the job line by line while it runs
+    rather than once it exits. Raises RuntimeError if the command fails.
+    """
+    # Python tools, including the one ProcessPan2vrImages.ps1 starts, would otherwise buffer a piped stdout
+    env = dict(os.environ, PYTHONUNBUFFERED="1")
+    last_line = ""
+    started = time.perf_counter()
+    with subprocess.Popen(
+        [str(arg) for arg in args],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        text=True,
+        bufsize=1,
+        env=env,
+    ) as process:
+        try:
+            for line in process.stdout:
+                line = line.rstrip()
+                if line:
+                    last_line = line
+                handle_line(ctx, line)
+        except BaseException:
+            # E.g. the job stopped for shutdown; otherwise leaving the block would wait for the command
+            process.kill()
+            raise
+    SUBPROCESS_DURATION.observe(
+        time.perf_counter() - started, command=name, outcome="ok" if process.returncode == 0 else "failed"
+    )
+    if process.returncode != 0:
+        raise RuntimeError(f"{name} failed with exit code {process.returncode}: {last_line}")
+
+
+class _ThreadOutput:
+    """
+    Stands in for sys.stdout while tools run in this process: lines printed by
+    a thread that has a job attached go to that job through handle_line(), and
+    everything is still passed on to the real stdout for the console.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.jobs = {}
+        self.partial = {}
+
+    def write(self, text):
+        thread = threading.get_ident()
+        ctx = self.jobs.get(thread)
+        if ctx is not None:
+            lines = (self.partial.pop(thread, "") + text).split("\n")
+            for line in lines[:-1]:
+                handle_line(ctx, line.rstrip())
+            if lines[-1]:
+                self.partial[thread] = lines[-1]
+        return self.stream.write(text)
+
+    def flush(self):
+        self.stream.flush()
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+
+_output = None
+_output_lock = threading.Lock()
+
+
+@contextmanager
+def job_output(ctx):
+    """Send what the current thread prints to the job while the block runs."""
+    global _output
+    with _output_lock:
+        if _output is None:
+            _output = _ThreadOutput(sys.stdout)
+            sys.stdout = _output
+    thread = threading.get_ident()
+    _output.jobs[thread] = ctx
+    try:
+        yield
+    finally:
+        _output.jobs.pop(thread, None)
+        rest = _output.partial.pop(thread, "")
+        if rest:
+            handle_line(ctx, rest)
+
+
+class ProcessingRunner:
+    """
+    Runs the pixelation step of the processing jobs.
+
+    The "python" backend calls PixelateImages.process_images() from the job's
+    thread, with the images spread over a pool of worker processes that is
+    started on first use and kept for later jobs, so a job costs no interpreter
+    start-up. The "powershell" backend runs ProcessPan2vrImages.ps1 as before.
+    fast (PIXELATE_FAST) selects the tool's lower-memory path with either one.
+    Either way the tool's output reaches the job as it is printed, and the time
+    spent in each stage is recorded on the job.
+    """
+
+    def __init__(self, tools_dir: Path, backend=PROCESSING_BACKEND, workers=PROCESSING_WORKERS, fast=PIXELATE_FAST):
+        if backend not in ("python", "powershell"):
+            raise ValueError(f"Unknown processing backend: {backend}")
+        self.tools_dir = Path(tools_dir)
+        self.backend = backend
+        self.workers = max(1, workers)
+        self.fast = fast
+        self._executor = None
+        self._lock = threading.Lock()
+
+    @property
+    def script_path(self):
+        """The tool the configured backend runs."""
+        if self.backend == "powershell":
+            return self.tools_dir / "ProcessPan2vrImages.ps1"
+        return self.tools_dir / "PixelateImages.py"
+
+    def load_tool(self, name):
+        """Import one of the Python tools in tools_dir as a module."""
+        tools = str(self.tools_dir.resolve())
+        if tools not in sys.path:
+            sys.path.append(tools)
+        return importlib.import_module(name)
+
+    def _pool(self):
+        with self._lock:
+            if self._executor is None:
+                # Spawned rather than forked: this process has threads and open database connections,
+                # and the workers only need the tool module, which they import from the inherited sys.path
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+                )
+            return self._executor
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+    def pixelate(self, ctx, source: Path, destination: Path):
+        """Pixelate the images under source into destination, mirroring its folders."""
+        if not source.is_dir():
+            raise FileNotFoundError(f"Input directory does not exist: {source}")
+        if self.backend == "powershell":
+            with ctx.stage("pixelate"):
+                command = ["powershell", "-ExecutionPolicy", "Bypass", "-File", self.script_path, source, destination]
+                if self.fast:
+                    command.append("-Fast")
+                stream_command(ctx, command, self.script_path.name)
+            return
+
+        engine = self.load_tool("PixelateImages")
+        executor = self._pool()
+        timings = {}
+
+        def on_result(result):
+            # Workers print to the console; the job gets one line per image from here
+            image_path, seconds, error = result
+            if error:
+                ctx.log(f"ERROR: Failed to process {image_path}: {error}")
+            else:
+                ctx.log(f"Processed: {image_path} ({seconds:.2f}s)")
+            ctx.advance(files=1)
+
+        try:
+            with job_output(ctx):
+                results = engine.process_images(
+                    source, destination, workers=self.workers, fast=self.fast, executor=executor,
+                    on_result=on_result, timings=timings,
+                )
+        except BrokenProcessPool:
+            # A worker died (for example killed for memory); start a fresh pool for the next job
+            with self._lock:
+                if self._executor is executor:
+                    self._executor = None
+            executor.shutdown(wait=False, cancel_futures=True)
+            raise
+        finally:
+            for stage, seconds in timings.items():
+                ctx.record_timing(stage, seconds)
+        failures = [path for path, _, error in results if error]
+        if failures:
+            raise RuntimeError(f"{len(failures)} of {len(results)} images failed to process")
+
+    def run_tool(self, ctx, script: Path, *args):
+        """Run a Python tool script with this interpreter in its own process, streaming its output to the job."""
+        stream_command(ctx, [sys.executable, script, *args], script.name)
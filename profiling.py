@@ -0,0 +1,258 @@
+import cProfile
+import json
+import logging
+import os
+import pstats
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timezone
+from pathlib import Path
+from urllib.parse import parse_qs
+
+from starlette.concurrency import run_in_threadpool
+
+from config import (
+    PROFILE_SAMPLE_RATE, PROFILE_TOKEN, PROFILE_MODE, PROFILE_INTERVAL_MS, PROFILE_MAX_SECONDS,
+    PROFILE_DIR, PROFILE_KEEP,
+)
+
+logger = logging.getLogger(__name__)
+
+# Threads run_in_threadpool hands work to; job and watcher threads are not part of a request
+WORKER_THREAD_NAME = "AnyIO worker thread"
+# A thread whose innermost Python frame is in one of these is waiting, not working
+IDLE_FILES = {"threading.py", "queue.py", "selectors.py"}
+# Functions kept per profile, by self time
+TOP_FUNCTIONS = 40
+
+
+def function_label(filename, line, name):
+    """Readable name for a function: paths inside the app are shown relative to it."""
+    try:
+        relative = os.path.relpath(filename)
+        if not relative.startswith(".."):
+            filename = relative
+        else:
+            filename = os.path.basename(filename)
+    except ValueError:  # Different drive on Windows
+        filename = os.path.basename(filename)
+    return f"{name} ({filename}:{line})"
+
+
+class StackSampler:
+    """
+    Samples the stacks of the event loop thread and of busy threadpool workers,
+    from a daemon thread, every interval seconds until stop() or max_seconds.
+
+    Concurrent requests share those threads, so their work shows up too; the
+    profile is exact for a request served alone.
+    """
+
+    def __init__(self, loop_thread, interval, max_seconds):
+        self.loop_thread = loop_thread
+        self.interval = interval
+        self.max_seconds = max_seconds
+        self.ticks = 0
+        self.samples = 0
+        self.self_counts = Counter()
+        self.total_counts = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        deadline = time.monotonic() + self.max_seconds
+        labels = {}
+        while not self._stop.wait(self.interval) and time.monotonic() < deadline:
+            self.ticks += 1
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident != self.loop_thread and names.get(ident) != WORKER_THREAD_NAME:
+                    continue
+                if os.path.basename(frame.f_code.co_filename) in IDLE_FILES:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    label = labels.get(code)
+                    if label is None:
+                        label = labels[code] = function_label(code.co_filename, code.co_firstlineno, code.co_name)
+                    stack.append(label)
+                    frame = frame.f_back
+                self.samples += 1
+                self.self_counts[stack[0]] += 1
+                self.total_counts.update(set(stack))
+
+    def functions(self):
+        return [
+            {"function": label, "self": count, "cumulative": self.total_counts[label]}
+            for label, count in self.self_counts.most_common(TOP_FUNCTIONS)
+        ]
+
+
+def cprofile_functions(profiler):
+    stats = pstats.Stats(profiler)
+    rows = []
+    for (filename, line, name), (_, calls, self_seconds, cumulative, _) in stats.stats.items():
+        rows.append({
+            "function": function_label(filename, line, name),
+            "calls": calls,
+            "self": round(self_seconds, 6),
+            "cumulative": round(cumulative, 6),
+        })
+    rows.sort(key=lambda row: row["self"], reverse=True)
+    return rows[:TOP_FUNCTIONS]
+
+
+class ProfileStore:
+    """Profiles as JSON files in a directory that keeps only the newest `keep`."""
+
+    def __init__(self, directory=PROFILE_DIR, keep=PROFILE_KEEP):
+        self.directory = Path(directory)
+        self.keep = keep
+
+    def save(self, profile, raw_profiler=None):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self.directory / f"{profile['id']}.json"
+        temp_path = path.with_name(f".{path.name}.tmp")
+        temp_path.write_text(json.dumps(profile))
+        os.replace(temp_path, path)
+        if raw_profiler is not None:
+            # Loadable with pstats or snakeviz for the full call graph
+            raw_profiler.dump_stats(self.directory / f"{profile['id']}.prof")
+        self._trim()
+
+    def _trim(self):
+        profiles = sorted(self.directory.glob("*.json"))
+        for old in profiles[:max(0, len(profiles) - self.keep)]:
+            old.unlink(missing_ok=True)
+            old.with_suffix(".prof").unlink(missing_ok=True)
+
+    def recent(self, min_wall_ms=0, limit=50):
+        """Newest profiles first, leaving out those faster than min_wall_ms."""
+        if not self.directory.exists():
+            return []
+        profiles = []
+        for path in sorted(self.directory.glob("*.json"), reverse=True):
+            try:
+                profile = json.loads(path.read_text())
+            except (OSError, ValueError):
+                continue  # Trimmed or half-written meanwhile
+            if profile["wall_ms"] >= min_wall_ms:
+                profiles.append(profile)
+                if len(profiles) >= limit:
+                    break
+        return profiles
+
+    def get(self, profile_id):
+        path = self.directory / f"{Path(profile_id).name}.json"
+        try:
+            return json.loads(path.read_text())
+        except (OSError, ValueError):
+            return None
+
+
+class ProfilingMiddleware:
+    """
+    ASGI middleware profiling the requests that ask for it (see config.py)
+    and a random sample of the rest. A request that is not profiled costs
+    one scan of its query string and headers.
+
+    A profile records wall time, the process CPU time used meanwhile (which
+    includes anything else running concurrently) and the top functions, and
+    is saved to the ProfileStore once the response has been sent.
+    """
+
+    def __init__(self, app, store=None, mode=PROFILE_MODE, sample_rate=PROFILE_SAMPLE_RATE, token=PROFILE_TOKEN):
+        if mode not in ("sample", "cprofile"):
+            raise ValueError(f"Unknown profile mode: {mode}")
+        self.app = app
+        self.store = store or ProfileStore()
+        self.mode = mode
+        self.sample_rate = sample_rate
+        self.flag = (token or "1").encode()
+        # cProfile can only trace one request at a time
+        self._cprofile_lock = threading.Lock()
+
+    def _requested(self, scope):
+        query = scope.get("query_string", b"")
+        if b"profile=" in query and self.flag in (value.encode() for value in parse_qs(query.decode()).get("profile", ())):
+            return True
+        for name, value in scope["headers"]:
+            if name == b"x-profile" and value == self.flag:
+                return True
+        return False
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not (
+            self._requested(scope) or (self.sample_rate and random.random() < self.sample_rate)
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        profiler = None
+        sampler = None
+        if self.mode == "cprofile":
+            if not self._cprofile_lock.acquire(blocking=False):
+                await self.app(scope, receive, send)
+                return
+            profiler = cProfile.Profile()
+        else:
+            sampler = StackSampler(threading.get_ident(), PROFILE_INTERVAL_MS / 1000, PROFILE_MAX_SECONDS)
+
+        status = 500
+
+        async def send_and_record(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        cpu_started = time.process_time()
+        if profiler is not None:
+            profiler.enable()
+        else:
+            sampler.start()
+        try:
+            await self.app(scope, receive, send_and_record)
+        finally:
+            if profiler is not None:
+                profiler.disable()
+                self._cprofile_lock.release()
+            else:
+                sampler.stop()
+            wall = time.perf_counter() - started
+            cpu = time.process_time() - cpu_started
+
+            now = datetime.now(timezone.utc)
+            route = getattr(scope.get("route"), "path", None)
+            profile = {
+                # Sorts by time, which the store trims by
+                "id": f"{now:%Y%m%dT%H%M%S%f}_{uuid.uuid4().hex[:6]}",
+                "created_at": f"{now:%Y-%m-%d %H:%M:%S}",
+                "method": scope["method"],
+                "path": scope["path"],
+                "route": route,
+                "status": status,
+                "mode": self.mode,
+                "wall_ms": round(wall * 1000, 3),
+                "cpu_ms": round(cpu * 1000, 3),
+                "unit": "seconds" if profiler is not None else "samples",
+                "samples": sampler.samples if sampler is not None else None,
+                "functions": cprofile_functions(profiler) if profiler is not None else sampler.functions(),
+            }
+            try:
+                await run_in_threadpool(self.store.save, profile, profiler)
+            except OSError as e:
+                logger.error("Error saving profile %s: %s", profile["id"], e)
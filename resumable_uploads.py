@@ -0,0 +1,287 @@
+import base64
+import binascii
+import hashlib
+import logging
+import os
+import threading
+import time
+import uuid
+from pathlib import Path
+
+from config import RESUMABLE_UPLOAD_MAX_BYTES, RESUMABLE_UPLOAD_CHECKPOINT_BYTES, RESUMABLE_UPLOAD_EXPIRE_HOURS
+from db_manager import (
+    insert_upload,
+    get_upload,
+    update_upload,
+    delete_upload,
+    get_stale_uploads,
+    insert_upload_records,
+    get_structure_db_id,
+)
+from hash_index import file_sha256
+from ingest import Deduplicator, UPLOAD_FIELDS, upload_folder
+from metrics import record_transfer
+
+logger = logging.getLogger(__name__)
+
+TUS_VERSION = "1.0.0"
+# Upload-Metadata keys a client must send; together they name the file's place in 01_DataDump
+REQUIRED_METADATA = (
+    "project_number", "collection_date", "crew_initials", "project_location", "structure_id", "filename",
+)
+# Seconds between the checks for expired uploads made as new ones are created
+EXPIRE_CHECK_SECONDS = 3600
+
+
+class UploadError(Exception):
+    """A request the upload protocol refuses; status_code is the HTTP status to answer with."""
+
+    def __init__(self, status_code, message):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def parse_metadata(header):
+    """Decode a tus Upload-Metadata header: comma-separated "key base64(value)" pairs."""
+    metadata = {}
+    for pair in filter(None, (part.strip() for part in (header or "").split(","))):
+        key, _, encoded = pair.partition(" ")
+        try:
+            metadata[key] = base64.b64decode(encoded, validate=True).decode("utf-8") if encoded else ""
+        except (binascii.Error, UnicodeDecodeError):
+            raise UploadError(400, f"Upload-Metadata value for '{key}' is not valid base64 UTF-8.")
+    return metadata
+
+
+def _folder_part(value, key):
+    value = value.strip()
+    if not value or value in (".", "..") or "/" in value or "\\" in value:
+        raise UploadError(400, f"Invalid {key}: '{value}'.")
+    return value
+
+
+class UploadWriter:
+    """
+    Appends the body of one PATCH to an upload's partial file, saving the
+    offset reached every checkpoint_bytes and when closed, so a dropped
+    connection loses at most the bytes since the last checkpoint.
+    """
+
+    def __init__(self, store, upload, offset):
+        self.store = store
+        self.upload = upload
+        self.upload_id = upload["id"]
+        self.length = upload["length"]
+        self.destination = store.destination(upload)
+        self.received = offset
+        self._saved = offset
+        # The hash of the bytes so far, if every earlier PATCH was received by this process
+        saved_offset, self._digest = store._digests.pop(self.upload_id, (0, hashlib.sha256()))
+        if saved_offset != offset:
+            self._digest = None
+        self._file = open(upload["temp_path"], "r+b")
+        self._file.seek(offset)
+        # Bytes past the saved offset are from a request that broke off before its checkpoint
+        self._file.truncate()
+
+    @property
+    def complete(self):
+        return self.received == self.length
+
+    def write(self, data):
+        if self.received + len(data) > self.length:
+            raise UploadError(413, "Upload exceeds its declared Upload-Length.")
+        self._file.write(data)
+        if self._digest is not None:
+            self._digest.update(data)
+        self.received += len(data)
+        if self.received - self._saved >= self.store.checkpoint_bytes:
+            self._checkpoint()
+
+    def _checkpoint(self):
+        self._file.flush()
+        update_upload(self.upload_id, received=self.received)
+        self._saved = self.received
+
+    def finish(self):
+        """Register the completed upload while still holding it, so no other request can finish it too."""
+        self._checkpoint()
+        self._file.close()
+        return self.store.finish(self.upload_id, self._digest.hexdigest() if self._digest is not None else None)
+
+    def close(self):
+        try:
+            if not self._file.closed and self.received != self._saved:
+                self._checkpoint()
+        finally:
+            if self._digest is not None and not self.complete:
+                self.store._digests[self.upload_id] = (self.received, self._digest)
+            self._file.close()
+            self.store._release(self.upload_id)
+
+
+class ResumableUploads:
+    """
+    tus-style resumable uploads into the same 01_DataDump layout as /upload/:
+
+        {project}_{date}_{crew}/{location}_{structure}_{date}/{filename}
+
+    An upload is created with its length and metadata, filled by PATCH
+    requests that each continue at the current offset, and finished once all
+    bytes arrived. Bytes go straight into a hidden partial file next to the
+    final one, which is renamed into place at the end, so nothing is copied.
+    Only then is the Files row inserted, unless the structure already has the
+    content (see ingest.Deduplicator). Different uploads can be written in
+    parallel; one upload takes one PATCH at a time.
+    """
+
+    def __init__(self, base_dir=Path("data/01_DataDump"), max_bytes=RESUMABLE_UPLOAD_MAX_BYTES,
+                 checkpoint_bytes=RESUMABLE_UPLOAD_CHECKPOINT_BYTES, deduplicator=None,
+                 expire_hours=RESUMABLE_UPLOAD_EXPIRE_HOURS):
+        self.base_dir = Path(base_dir)
+        self.max_bytes = max_bytes
+        self.checkpoint_bytes = checkpoint_bytes
+        self.expire_hours = expire_hours
+        self._next_expire_check = time.monotonic() + EXPIRE_CHECK_SECONDS
+        self.deduplicator = deduplicator or Deduplicator()
+        self._busy = set()
+        self._digests = {}
+        self._lock = threading.Lock()
+
+    def destination(self, upload):
+        return upload_folder(self.base_dir, upload) / upload["filename"]
+
+    def create(self, length, metadata):
+        """Start an upload of length bytes described by metadata; returns its row."""
+        if length < 0 or length > self.max_bytes:
+            raise UploadError(413, f"Upload-Length must be between 0 and {self.max_bytes} bytes.")
+        missing = [key for key in REQUIRED_METADATA if not metadata.get(key, "").strip()]
+        if missing:
+            raise UploadError(400, f"Upload-Metadata is missing {', '.join(missing)}.")
+        fields = {key: _folder_part(metadata[key], key) for key in REQUIRED_METADATA}
+        self._expire_if_due()
+
+        upload_id = uuid.uuid4().hex
+        destination = self.destination(fields)
+        destination.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = destination.with_name(f".{destination.name}.{upload_id}.part")
+        temp_path.touch()
+        insert_upload(upload_id, *(fields[key] for key in REQUIRED_METADATA), length, str(temp_path))
+        logger.debug("Created upload %s for %s (%d bytes)", upload_id, destination, length)
+        return get_upload(upload_id)
+
+    def get(self, upload_id):
+        upload = get_upload(upload_id)
+        if upload is None:
+            raise UploadError(404, "Upload not found.")
+        return upload
+
+    def open(self, upload_id, offset):
+        """
+        UploadWriter continuing an upload at offset, which must be where the
+        upload stands. The caller must close() it.
+        """
+        upload = self.get(upload_id)
+        if upload["status"] != "uploading":
+            raise UploadError(409, "Upload is already complete.")
+        if upload["received"] == upload["length"]:
+            raise UploadError(409, "Upload has all its bytes; HEAD finishes registering it.")
+        if offset != upload["received"]:
+            raise UploadError(409, f"Upload-Offset {offset} does not match the current offset {upload['received']}.")
+        with self._lock:
+            if upload_id in self._busy:
+                raise UploadError(423, "Upload is receiving another request.")
+            self._busy.add(upload_id)
+        try:
+            return UploadWriter(self, upload, offset)
+        except BaseException:
+            self._release(upload_id)
+            raise
+
+    def _release(self, upload_id):
+        with self._lock:
+            self._busy.discard(upload_id)
+
+    def finish(self, upload_id, sha256=None):
+        """
+        Move a fully received upload into place and register it; returns its
+        Files row ID, which is the existing row's if the structure already had
+        the content. sha256 is computed from the file if not given. Safe to
+        call again after a failure part-way, e.g. a busy database.
+        """
+        upload = self.get(upload_id)
+        if upload["status"] == "complete":
+            return upload["file_id"]
+        if upload["received"] != upload["length"]:
+            raise UploadError(409, "Upload is not complete yet.")
+        destination = self.destination(upload)
+        temp_path = Path(upload["temp_path"])
+        # Without a partial file, an earlier attempt already moved it into place
+        if temp_path.exists():
+            os.replace(temp_path, destination)
+        elif not destination.exists():
+            raise UploadError(410, "Upload's data is gone.")
+        if sha256 is None:
+            sha256 = file_sha256(destination)
+        fields = [upload[key] for key in UPLOAD_FIELDS]
+        status, file_id = self.deduplicator.place(destination, sha256, upload["length"], get_structure_db_id(*fields))
+        if status != "duplicate":
+            _, _, (file_id,) = insert_upload_records(*fields, [(destination.name, str(destination), sha256)])
+            record_transfer("write", destination, 1, upload["length"])
+        update_upload(upload_id, status="complete", file_id=file_id)
+        logger.info("Finished upload %s: %s (%s)", upload_id, destination, status)
+        return file_id
+
+    def complete(self, upload_id):
+        """
+        The upload's row, after finishing it if all its bytes arrived but
+        registering them failed, so a client checking on it can still succeed.
+        Returns (upload, whether this call finished it).
+        """
+        upload = self.get(upload_id)
+        if upload["status"] != "uploading" or upload["received"] != upload["length"]:
+            return upload, False
+        with self._lock:
+            if upload_id in self._busy:
+                raise UploadError(423, "Upload is receiving another request.")
+            self._busy.add(upload_id)
+        try:
+            self.finish(upload_id)
+        finally:
+            self._release(upload_id)
+        return self.get(upload_id), True
+
+    def terminate(self, upload_id):
+        """Abandon an unfinished upload and remove its partial file."""
+        upload = self.get(upload_id)
+        if upload["status"] == "complete":
+            raise UploadError(409, "Upload is already complete.")
+        with self._lock:
+            if upload_id in self._busy:
+                raise UploadError(423, "Upload is receiving another request.")
+        Path(upload["temp_path"]).unlink(missing_ok=True)
+        self._digests.pop(upload_id, None)
+        delete_upload(upload_id)
+
+    def _expire_if_due(self):
+        """Run expire() at most every EXPIRE_CHECK_SECONDS, so a long-running server keeps cleaning up."""
+        with self._lock:
+            if time.monotonic() < self._next_expire_check:
+                return
+            self._next_expire_check = time.monotonic() + EXPIRE_CHECK_SECONDS
+        self.expire(self.expire_hours)
+
+    def expire(self, max_age_hours):
+        """Forget uploads untouched for max_age_hours, removing the partial files of unfinished ones."""
+        removed = 0
+        for upload in get_stale_uploads(max_age_hours):
+            with self._lock:
+                if upload["id"] in self._busy:
+                    continue  # Receiving a request right now
+            if upload["status"] == "uploading":
+                Path(upload["temp_path"]).unlink(missing_ok=True)
+                self._digests.pop(upload["id"], None)
+                removed += 1
+            delete_upload(upload["id"])
+        if removed:
+            logger.info("Removed %d expired unfinished uploads", removed)
@@ -1,16 +1,20 @@
+import logging
 import sqlite3
 from pathlib import Path
 
+logger = logging.getLogger(__name__)
+
 # Define the database directory and file path
 DATABASE_DIR = Path("data")
 DATABASE_FILE = DATABASE_DIR / "data.db"
 
-def setup_database():
+def setup_database(database_file=DATABASE_FILE):
     # Ensure the data directory exists
-    DATABASE_DIR.mkdir(parents=True, exist_ok=True)
+    database_file = Path(database_file)
+    database_file.parent.mkdir(parents=True, exist_ok=True)
 
     # Connect to the SQLite database (creates the file if it doesn't exist)
-    conn = sqlite3.connect(DATABASE_FILE)
+    conn = sqlite3.connect(database_file)
     cursor = conn.cursor()
 
     # Create Projects table with status
@@ -56,10 +60,257 @@ def setup_database():
     #     ALTER TABLE Projects ADD COLUMN archived_by TEXT;
     # """)
 
-    # Commit changes and close connection
+    # Commit changes, bring the schema up to date and close connection
     conn.commit()
+    apply_migrations(conn)
     conn.close()
-    print(f"Database setup complete. File created at: {DATABASE_FILE}")
+    logger.info("Database setup complete. File created at: %s", database_file)
+
+
+# --- Schema migrations ---
+# Each migration runs once, in its own transaction, and bumps PRAGMA user_version.
+
+def _migration_1_natural_keys(cursor):
+    """Merge duplicate rows, then add unique natural-key indexes."""
+    # Point structures at the oldest copy of each duplicated project and drop the rest
+    cursor.execute("""
+        UPDATE Structures SET project_id = (
+            SELECT MIN(p2.id) FROM Projects p1
+            JOIN Projects p2 ON p2.project_number = p1.project_number
+                AND p2.date = p1.date AND p2.crew_initials = p1.crew_initials
+            WHERE p1.id = Structures.project_id
+        )
+        WHERE project_id IN (SELECT id FROM Projects);
+    """)
+    cursor.execute("""
+        DELETE FROM Projects WHERE id NOT IN (
+            SELECT MIN(id) FROM Projects GROUP BY project_number, date, crew_initials
+        );
+    """)
+
+    # Same for structures, re-pointing their files
+    cursor.execute("""
+        UPDATE Files SET structure_id = (
+            SELECT MIN(s2.id) FROM Structures s1
+            JOIN Structures s2 ON s2.project_id = s1.project_id
+                AND s2.project_location = s1.project_location
+                AND s2.structure_id = s1.structure_id
+                AND s2.collection_date = s1.collection_date
+            WHERE s1.id = Files.structure_id
+        )
+        WHERE structure_id IN (SELECT id FROM Structures);
+    """)
+    cursor.execute("""
+        DELETE FROM Structures WHERE id NOT IN (
+            SELECT MIN(id) FROM Structures
+            GROUP BY project_id, project_location, structure_id, collection_date
+        );
+    """)
+
+    # A file path is recorded once per structure
+    cursor.execute("""
+        DELETE FROM Files WHERE id NOT IN (
+            SELECT MIN(id) FROM Files GROUP BY structure_id, path
+        );
+    """)
+
+    # The leading column of each composite index also serves lookups by
+    # Structures(project_id) and Files(structure_id), so no separate index is needed
+    cursor.execute("""
+        CREATE UNIQUE INDEX IF NOT EXISTS ux_projects_natural_key
+        ON Projects (project_number, date, crew_initials);
+    """)
+    cursor.execute("""
+        CREATE UNIQUE INDEX IF NOT EXISTS ux_structures_natural_key
+        ON Structures (project_id, project_location, structure_id, collection_date);
+    """)
+    cursor.execute("""
+        CREATE UNIQUE INDEX IF NOT EXISTS ux_files_structure_path
+        ON Files (structure_id, path);
+    """)
+
+
+def _collection_date_from_path(path):
+    """Return the trailing date of the structure folder in a stage-relative file path."""
+    # e.g. 01_DataDump/{project}_{date}_{crew}/{location}_{structure}_{date}/photo.jpg
+    parts = path.split("/")
+    if len(parts) < 4:
+        return None
+    return parts[2].rsplit("_", 1)[-1]
+
+
+def _migration_2_files_collection_date(cursor):
+    """Store the collection date on Files and index it with structure_id."""
+    cursor.execute("ALTER TABLE Files ADD COLUMN collection_date TEXT;")
+    cursor.execute("""
+        UPDATE Files SET collection_date = (
+            SELECT collection_date FROM Structures WHERE Structures.id = Files.structure_id
+        );
+    """)
+
+    # Files whose structure row is gone fall back to the date in their folder name
+    cursor.connection.create_function("collection_date_from_path", 1, _collection_date_from_path)
+    cursor.execute("""
+        UPDATE Files SET collection_date = collection_date_from_path(path)
+        WHERE collection_date IS NULL;
+    """)
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_files_structure_date
+        ON Files (structure_id, collection_date);
+    """)
+
+
+def _migration_3_jobs(cursor):
+    """Add the Jobs table for background operations."""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS Jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            params TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'queued',  -- queued, running, succeeded, failed
+            files_total INTEGER NOT NULL DEFAULT 0,
+            files_done INTEGER NOT NULL DEFAULT 0,
+            bytes_total INTEGER NOT NULL DEFAULT 0,
+            bytes_done INTEGER NOT NULL DEFAULT 0,
+            message TEXT,
+            output TEXT,
+            created_at TEXT NOT NULL DEFAULT (datetime('now')),
+            started_at TEXT,
+            finished_at TEXT
+        );
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON Jobs (status);")
+
+
+def _migration_4_blob_store(cursor):
+    """Add the Blobs and BlobRefs tables for the content-addressed store."""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS Blobs (
+            sha256 TEXT PRIMARY KEY,
+            size INTEGER NOT NULL,
+            refcount INTEGER NOT NULL DEFAULT 0,
+            created_at TEXT NOT NULL DEFAULT (datetime('now'))
+        );
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS BlobRefs (
+            path TEXT PRIMARY KEY,  -- relative to data/, e.g. 02_Archive/<project>/<file>
+            sha256 TEXT NOT NULL REFERENCES Blobs (sha256),
+            size INTEGER NOT NULL,
+            mtime_ns INTEGER NOT NULL
+        );
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_blobrefs_sha256 ON BlobRefs (sha256);")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_blobs_refcount ON Blobs (refcount);")
+
+
+def _migration_5_file_hashes(cursor):
+    """Add the FileHashes table caching content hashes by path, size and mtime."""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS FileHashes (
+            path TEXT PRIMARY KEY,
+            size INTEGER NOT NULL,
+            mtime_ns INTEGER NOT NULL,
+            sha256 TEXT NOT NULL
+        );
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_filehashes_sha256 ON FileHashes (sha256);")
+
+
+def _migration_6_job_timings(cursor):
+    """Add Jobs.timings, the seconds spent in each stage of a job as JSON."""
+    cursor.execute("ALTER TABLE Jobs ADD COLUMN timings TEXT;")
+
+
+def _migration_7_uploads(cursor):
+    """Add the Uploads table tracking resumable uploads until their file is registered."""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS Uploads (
+            id TEXT PRIMARY KEY,
+            project_number TEXT NOT NULL,
+            collection_date TEXT NOT NULL,
+            crew_initials TEXT NOT NULL,
+            project_location TEXT NOT NULL,
+            structure_id TEXT NOT NULL,
+            filename TEXT NOT NULL,
+            length INTEGER NOT NULL,
+            received INTEGER NOT NULL DEFAULT 0,
+            temp_path TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'uploading',  -- uploading, complete
+            file_id INTEGER REFERENCES Files (id) ON DELETE SET NULL,
+            created_at TEXT NOT NULL DEFAULT (datetime('now')),
+            updated_at TEXT NOT NULL DEFAULT (datetime('now'))
+        );
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_uploads_status_updated ON Uploads (status, updated_at);")
+
+
+def _migration_8_files_content_hash(cursor):
+    """Add Files.content_hash, the SHA-256 of each uploaded file, indexed with structure_id."""
+    cursor.execute("ALTER TABLE Files ADD COLUMN content_hash TEXT;")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_files_content_hash ON Files (content_hash, structure_id);")
+
+
+def _migration_9_file_metadata(cursor):
+    """Add the FileMetadata table with the EXIF/XMP fields read from each image at ingest."""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS FileMetadata (
+            file_id INTEGER PRIMARY KEY REFERENCES Files (id) ON DELETE CASCADE,
+            captured_at TEXT,  -- YYYY-MM-DD HH:MM:SS, camera local time
+            width INTEGER,
+            height INTEGER,
+            megapixels REAL,
+            camera_make TEXT,
+            camera_model TEXT,
+            projection TEXT,  -- GPano:ProjectionType, e.g. equirectangular
+            orientation INTEGER,
+            format TEXT,
+            error TEXT,  -- Why nothing could be read, e.g. for videos; the row stops the file being retried
+            extracted_at TEXT NOT NULL DEFAULT (datetime('now'))
+        );
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_filemetadata_captured_at ON FileMetadata (captured_at);")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_filemetadata_megapixels ON FileMetadata (megapixels);")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_filemetadata_camera ON FileMetadata (camera_model);")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_filemetadata_projection ON FileMetadata (projection);")
+
+
+MIGRATIONS = [
+    (1, _migration_1_natural_keys),
+    (2, _migration_2_files_collection_date),
+    (3, _migration_3_jobs),
+    (4, _migration_4_blob_store),
+    (5, _migration_5_file_hashes),
+    (6, _migration_6_job_timings),
+    (7, _migration_7_uploads),
+    (8, _migration_8_files_content_hash),
+    (9, _migration_9_file_metadata),
+]
+
+
+def apply_migrations(conn):
+    """Apply every migration newer than the database's user_version."""
+    isolation_level = conn.isolation_level
+    conn.isolation_level = None  # Manage transactions explicitly
+    try:
+        current_version = conn.execute("PRAGMA user_version").fetchone()[0]
+        for version, migration in MIGRATIONS:
+            if version <= current_version:
+                continue
+            cursor = conn.cursor()
+            cursor.execute("BEGIN IMMEDIATE")
+            try:
+                migration(cursor)
+                cursor.execute(f"PRAGMA user_version = {version}")
+                cursor.execute("COMMIT")
+            except Exception:
+                cursor.execute("ROLLBACK")
+                raise
+            logger.info("Applied database migration %s: %s", version, migration.__doc__)
+    finally:
+        conn.isolation_level = isolation_level
 
 if __name__ == "__main__":
+    from logs import setup_logging
+    setup_logging()
     setup_database()
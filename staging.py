@@ -0,0 +1,262 @@
+import errno
+import fnmatch
+import logging
+import os
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+
+from blob_store import BlobStore
+from config import STAGING_LINK_MODE, STAGING_COPY_WORKERS, STAGING_CHUNK_SIZE
+from folder_manager import BASE_DIR
+from metrics import record_transfer
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# ioctl request for a copy-on-write clone of a whole file (btrfs, XFS, bcachefs, ...)
+FICLONE = 0x40049409
+
+# Errors meaning "this filesystem cannot do that", as opposed to a real I/O failure
+UNSUPPORTED_ERRNOS = {
+    errno.EXDEV, errno.EINVAL, errno.ENOSYS, errno.EPERM, errno.EBADF,
+    getattr(errno, "EOPNOTSUPP", errno.EINVAL), getattr(errno, "ENOTSUP", errno.EINVAL),
+    getattr(errno, "ENOTTY", errno.EINVAL),
+}
+
+# How each method is reported; the first three do not move file data through Python
+METHODS = ("skipped", "hardlinked", "cloned", "kernel_copied", "copied")
+
+
+def normalize_patterns(patterns):
+    """
+    Turn exclude patterns into lowercase globs. A bare suffix such as ".mp4"
+    becomes "*.mp4"; anything else is a glob matched against the file name and
+    against its path relative to the staged folder.
+    """
+    normalized = []
+    for pattern in patterns:
+        pattern = pattern.strip().lower().replace("\\", "/")
+        if not pattern:
+            continue
+        if pattern.startswith(".") and not any(char in pattern for char in "*?["):
+            pattern = "*" + pattern
+        normalized.append(pattern)
+    return normalized
+
+
+def is_excluded(relative_path, patterns):
+    relative = relative_path.lower()
+    name = relative.rsplit("/", 1)[-1]
+    return any(fnmatch.fnmatchcase(name, p) or fnmatch.fnmatchcase(relative, p) for p in patterns)
+
+
+class StagingReport:
+    """Counts of files and bytes per staging method, plus what the filters left out."""
+
+    def __init__(self):
+        self.files = dict.fromkeys(METHODS + ("excluded",), 0)
+        self.bytes = dict.fromkeys(METHODS + ("excluded",), 0)
+
+    def add(self, method, size):
+        self.files[method] += 1
+        self.bytes[method] += size
+
+    @property
+    def bytes_avoided(self):
+        """Bytes that never had to be read and written again by this process."""
+        return self.bytes["excluded"] + self.bytes["skipped"] + self.bytes["hardlinked"] + self.bytes["cloned"]
+
+    @property
+    def bytes_copied(self):
+        return self.bytes["kernel_copied"] + self.bytes["copied"]
+
+    def as_dict(self):
+        return {
+            "files": dict(self.files),
+            "bytes": dict(self.bytes),
+            "bytes_avoided": self.bytes_avoided,
+            "bytes_copied": self.bytes_copied,
+        }
+
+    def summary(self):
+        parts = [f"{method} {self.files[method]} ({self.bytes[method]} bytes)"
+                 for method in METHODS + ("excluded",) if self.files[method]]
+        return (f"Staged: {', '.join(parts) or 'nothing'}; "
+                f"{self.bytes_avoided} bytes avoided, {self.bytes_copied} bytes copied")
+
+
+class Stager:
+    """
+    Copies files using the cheapest method the filesystem supports.
+
+    Per file it tries, in order: a link through the blob store (only with
+    link_mode "blob"), a hardlink (only with link_mode "hardlink"), a reflink
+    clone, os.copy_file_range, and finally a plain chunked copy.
+    A method that fails as unsupported is not tried again for the same pair
+    of devices, so a filesystem without reflinks costs one failed ioctl.
+    """
+
+    def __init__(self, link_mode=STAGING_LINK_MODE, chunk_size=STAGING_CHUNK_SIZE):
+        if link_mode not in ("copy", "clone", "hardlink", "blob"):
+            raise ValueError(f"Unknown staging link mode: {link_mode}")
+        self.link_mode = link_mode
+        self.blob_store = BlobStore(BASE_DIR) if link_mode == "blob" else None
+        self.chunk_size = chunk_size
+        self._unsupported = set()
+        self._lock = threading.Lock()
+
+    def _supported(self, method, devices):
+        return (method, devices) not in self._unsupported
+
+    def _mark_unsupported(self, method, devices, error):
+        with self._lock:
+            if (method, devices) not in self._unsupported:
+                logger.debug("%s not available between devices %s: %s", method, devices, error)
+                self._unsupported.add((method, devices))
+
+    def stage_file(self, src, dst, src_stat):
+        """Stage one file and return the method used."""
+        dst.parent.mkdir(parents=True, exist_ok=True)
+        devices = (src_stat.st_dev, dst.parent.stat().st_dev)
+
+        if self.blob_store is not None and self._supported("blob", devices):
+            try:
+                self.blob_store.link_file(src, dst)
+                return "hardlinked"
+            except OSError as e:
+                if e.errno not in UNSUPPORTED_ERRNOS and e.errno != errno.EMLINK:
+                    raise
+                self._mark_unsupported("blob", devices, e)
+
+        if self.link_mode == "hardlink" and self._supported("hardlink", devices):
+            try:
+                os.link(src, dst)
+                return "hardlinked"
+            except OSError as e:
+                if e.errno not in UNSUPPORTED_ERRNOS and e.errno != errno.EMLINK:
+                    raise
+                self._mark_unsupported("hardlink", devices, e)
+
+        with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+            method = None
+            if self.link_mode != "copy":
+                method = self._clone(fsrc, fdst, devices) or self._copy_file_range(fsrc, fdst, src_stat, devices)
+            if method is None:
+                shutil.copyfileobj(fsrc, fdst, self.chunk_size)
+                method = "copied"
+        shutil.copystat(src, dst)
+        return method
+
+    def _clone(self, fsrc, fdst, devices):
+        if fcntl is None or devices[0] != devices[1] or not self._supported("reflink", devices):
+            return None
+        try:
+            fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+            return "cloned"
+        except OSError as e:
+            if e.errno not in UNSUPPORTED_ERRNOS:
+                raise
+            self._mark_unsupported("reflink", devices, e)
+            return None
+
+    def _copy_file_range(self, fsrc, fdst, src_stat, devices):
+        if not hasattr(os, "copy_file_range") or not self._supported("copy_file_range", devices):
+            return None
+        remaining = src_stat.st_size
+        try:
+            while remaining > 0:
+                sent = os.copy_file_range(fsrc.fileno(), fdst.fileno(), min(remaining, 1 << 30))
+                if sent == 0:
+                    break
+                remaining -= sent
+        except OSError as e:
+            if e.errno not in UNSUPPORTED_ERRNOS:
+                raise
+            self._mark_unsupported("copy_file_range", devices, e)
+            # Nothing is lost by restarting from the beginning with a plain copy
+            fsrc.seek(0)
+            fdst.seek(0)
+            fdst.truncate()
+            return None
+        return "kernel_copied"
+
+
+def _already_staged(dst, src_stat):
+    try:
+        dst_stat = dst.stat()
+    except FileNotFoundError:
+        return False
+    if (dst_stat.st_dev, dst_stat.st_ino) == (src_stat.st_dev, src_stat.st_ino):
+        return True
+    return dst_stat.st_size == src_stat.st_size and int(dst_stat.st_mtime) == int(src_stat.st_mtime)
+
+
+def stage_tree(source: Path, destination: Path, exclude=(), progress=None,
+               link_mode=STAGING_LINK_MODE, workers=STAGING_COPY_WORKERS):
+    """
+    Stage the source directory into destination, leaving out files that match
+    any exclude pattern (see normalize_patterns).
+
+    Excluded files are filtered while planning, so they are never read.
+    Files already present at the destination with the same size and mtime are
+    left alone, so an interrupted run resumes where it stopped. The rest are
+    staged by a Stager on a pool of worker threads.
+
+    If given, progress.set_totals(files, bytes) is called once and
+    progress.advance(files, bytes) after every file. Returns a StagingReport.
+    """
+    patterns = normalize_patterns(exclude)
+    report = StagingReport()
+    plan = []
+    for root, dirs, files in os.walk(source):
+        dirs.sort()
+        for name in sorted(files):
+            src = Path(root) / name
+            relative = src.relative_to(source)
+            src_stat = src.stat()
+            if is_excluded(relative.as_posix(), patterns):
+                report.add("excluded", src_stat.st_size)
+                continue
+            plan.append((src, destination / relative, src_stat))
+
+    if progress is not None:
+        progress.set_totals(files=len(plan), bytes=sum(st.st_size for _, _, st in plan))
+
+    stager = Stager(link_mode)
+
+    def stage(item):
+        src, dst, src_stat = item
+        if _already_staged(dst, src_stat):
+            return "skipped", src_stat.st_size
+        if link_mode in ("hardlink", "blob") and dst.exists():
+            dst.unlink()  # os.link will not replace an outdated copy
+        return stager.stage_file(src, dst, src_stat), src_stat.st_size
+
+    destination.mkdir(parents=True, exist_ok=True)
+    # Progress is reported from this thread only; JobContext is not thread-safe
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="stage") as executor:
+        futures = [executor.submit(stage, item) for item in plan]
+        try:
+            for future in as_completed(futures):
+                method, size = future.result()
+                report.add(method, size)
+                if progress is not None:
+                    progress.advance(files=1, bytes=size)
+        except BaseException:
+            # A failed file or a stopped job: drop the files not started rather than copy them all first
+            executor.shutdown(wait=True, cancel_futures=True)
+            raise
+
+    staged = [method for method in METHODS if method != "skipped"]
+    record_transfer(
+        "stage", destination,
+        sum(report.files[method] for method in staged), sum(report.bytes[method] for method in staged),
+    )
+    logger.info("%s from '%s' to '%s'", report.summary(), source, destination)
+    return report
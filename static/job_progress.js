@@ -0,0 +1,133 @@
+// Live progress of background jobs from /jobs/<id>/events (Server-Sent Events).
+// Forms with class "job-form" are posted with fetch and show a progress bar under the form
+// instead of leaving the page; elements with class "job-progress" and a data-job-id show one on load.
+
+// Output lines kept on the page per job; the full output stays on the job
+const MAX_LOG_LINES = 500;
+
+function formatBytes(bytes) {
+    const units = ['B', 'KB', 'MB', 'GB', 'TB'];
+    let value = bytes;
+    let unit = 0;
+    while (value >= 1024 && unit < units.length - 1) {
+        value /= 1024;
+        unit += 1;
+    }
+    return `${value.toFixed(unit ? 1 : 0)} ${units[unit]}`;
+}
+
+function formatDuration(seconds) {
+    seconds = Math.round(seconds);
+    if (seconds < 60) return `${seconds}s`;
+    const minutes = Math.floor(seconds / 60);
+    if (minutes < 60) return `${minutes}m ${seconds % 60}s`;
+    return `${Math.floor(minutes / 60)}h ${minutes % 60}m`;
+}
+
+function renderProgress(container, progress) {
+    const bar = container.querySelector('progress');
+    const text = container.querySelector('.job-progress-text');
+    if (progress.bytes_total) {
+        bar.max = progress.bytes_total;
+        bar.value = progress.bytes_done;
+    } else if (progress.files_total) {
+        bar.max = progress.files_total;
+        bar.value = progress.files_done;
+    } else {
+        bar.removeAttribute('value');  // Indeterminate until the job knows its totals
+    }
+
+    const parts = [progress.status];
+    if (progress.files_total) parts.push(`${progress.files_done} / ${progress.files_total} files`);
+    if (progress.bytes_total) parts.push(`${formatBytes(progress.bytes_done)} / ${formatBytes(progress.bytes_total)}`);
+    if (progress.status === 'running') {
+        if (progress.bytes_per_second) parts.push(`${formatBytes(progress.bytes_per_second)}/s`);
+        else if (progress.files_per_second) parts.push(`${progress.files_per_second} files/s`);
+        if (progress.eta_seconds !== null) parts.push(`ETA ${formatDuration(progress.eta_seconds)}`);
+    }
+    text.textContent = parts.join(' · ');
+}
+
+function appendLog(container, lines, replace) {
+    const log = container.querySelector('.job-log');
+    const kept = replace || !log.textContent ? [] : log.textContent.split('\n');
+    log.textContent = kept.concat(lines).slice(-MAX_LOG_LINES).join('\n');
+    log.scrollTop = log.scrollHeight;
+}
+
+function watchJob(container, jobId, onDone) {
+    container.classList.add('job-progress');
+    container.innerHTML = `
+        <progress></progress>
+        <span class="job-progress-text">queued</span>
+        <a href="/jobs/${encodeURIComponent(jobId)}">job ${escapeHtml(jobId)}</a>
+        <details><summary>Output</summary><pre class="job-log"></pre></details>
+    `;
+    const source = new EventSource(`/jobs/${encodeURIComponent(jobId)}/events`);
+    source.addEventListener('progress', event => renderProgress(container, JSON.parse(event.data)));
+    source.addEventListener('log', event => {
+        const data = JSON.parse(event.data);
+        appendLog(container, data.lines, data.backlog);
+    });
+    source.addEventListener('done', event => {
+        // Closed here, or the browser would reconnect and replay the finished job
+        source.close();
+        const data = JSON.parse(event.data);
+        const text = container.querySelector('.job-progress-text');
+        container.classList.add(`job-${data.status}`);
+        if (data.message) text.textContent = `${data.status}: ${data.message}`;
+        if (onDone) onDone(data);
+    });
+}
+
+function showJobError(container, message) {
+    container.classList.add('job-progress', 'job-failed');
+    container.textContent = message;
+}
+
+async function submitJobForm(form) {
+    const button = form.querySelector('button[type="submit"]');
+    let container = form.nextElementSibling;
+    if (!container || !container.classList.contains('job-progress')) {
+        container = document.createElement('div');
+        form.after(container);
+    }
+    if (button) button.disabled = true;
+    const enable = () => { if (button) button.disabled = false; };
+    try {
+        const response = await fetch(form.action, {
+            method: 'POST',
+            body: new FormData(form),
+            headers: { Accept: 'application/json' },
+        });
+        if ((response.headers.get('content-type') || '').includes('json')) {
+            const body = await response.json();
+            if (response.ok && body.job_id) {
+                watchJob(container, String(body.job_id), enable);
+                return;
+            }
+            showJobError(container, body.detail || body.message || `Request failed: ${response.status}`);
+        } else {
+            // Routes refuse with the confirmation page; show its message
+            const page = new DOMParser().parseFromString(await response.text(), 'text/html');
+            const message = page.querySelector('.container p');
+            showJobError(container, message ? message.textContent : `Request failed: ${response.status}`);
+        }
+    } catch (error) {
+        showJobError(container, error.message);
+    }
+    enable();
+}
+
+document.addEventListener('submit', event => {
+    const form = event.target.closest('form.job-form');
+    if (!form || !window.EventSource) return;
+    event.preventDefault();
+    submitJobForm(form);
+});
+
+document.addEventListener('DOMContentLoaded', () => {
+    document.querySelectorAll('.job-progress[data-job-id]').forEach(container => {
+        watchJob(container, container.dataset.jobId);
+    });
+});
@@ -0,0 +1,95 @@
+// Minimal Deep Zoom viewer for the tile pyramids served from /tiles/.
+// It opens on the largest level that fits the window and only fetches the tiles in view,
+// so the first picture costs a few small tiles whatever the panorama's full resolution.
+
+async function loadDzi(url) {
+    const response = await fetch(url);
+    if (!response.ok) {
+        throw new Error(`Failed to load ${url}: ${response.status}`);
+    }
+    const image = new DOMParser().parseFromString(await response.text(), 'application/xml').documentElement;
+    const size = image.getElementsByTagName('Size')[0];
+    const width = Number(size.getAttribute('Width'));
+    const height = Number(size.getAttribute('Height'));
+    return {
+        width,
+        height,
+        tileSize: Number(image.getAttribute('TileSize')),
+        format: image.getAttribute('Format'),
+        maxLevel: Math.ceil(Math.log2(Math.max(width, height, 1))),
+        tilesUrl: url.replace(/\.dzi$/, '_files'),
+    };
+}
+
+function levelSize(dzi, level) {
+    const scale = 2 ** (dzi.maxLevel - level);
+    return [Math.ceil(dzi.width / scale), Math.ceil(dzi.height / scale)];
+}
+
+function createViewer(container, dzi) {
+    const canvas = document.createElement('div');
+    canvas.className = 'pano-canvas';
+    container.appendChild(canvas);
+
+    let level = dzi.maxLevel;
+    while (level > 0 && levelSize(dzi, level)[0] > container.clientWidth) {
+        level--;
+    }
+    let loaded = new Set();
+
+    function loadVisibleTiles() {
+        const [width, height] = levelSize(dzi, level);
+        const size = dzi.tileSize;
+        const firstCol = Math.floor(container.scrollLeft / size);
+        const lastCol = Math.min(Math.ceil(width / size), Math.ceil((container.scrollLeft + container.clientWidth) / size));
+        const firstRow = Math.floor(container.scrollTop / size);
+        const lastRow = Math.min(Math.ceil(height / size), Math.ceil((container.scrollTop + container.clientHeight) / size));
+        for (let col = firstCol; col < lastCol; col++) {
+            for (let row = firstRow; row < lastRow; row++) {
+                const key = `${col}_${row}`;
+                if (loaded.has(key)) continue;
+                loaded.add(key);
+                const tile = document.createElement('img');
+                tile.src = `${dzi.tilesUrl}/${level}/${key}.${dzi.format}`;
+                tile.style.left = `${col * size}px`;
+                tile.style.top = `${row * size}px`;
+                canvas.appendChild(tile);
+            }
+        }
+    }
+
+    function showLevel(newLevel) {
+        // Keep the point at the centre of the view in place across zoom levels
+        const factor = 2 ** (newLevel - level);
+        const centerX = (container.scrollLeft + container.clientWidth / 2) * factor;
+        const centerY = (container.scrollTop + container.clientHeight / 2) * factor;
+        level = newLevel;
+        loaded = new Set();
+        canvas.innerHTML = '';
+        const [width, height] = levelSize(dzi, level);
+        canvas.style.width = `${width}px`;
+        canvas.style.height = `${height}px`;
+        container.scrollLeft = centerX - container.clientWidth / 2;
+        container.scrollTop = centerY - container.clientHeight / 2;
+        loadVisibleTiles();
+    }
+
+    container.addEventListener('scroll', loadVisibleTiles);
+    document.querySelectorAll('.pano-controls button[data-zoom]').forEach(button => {
+        button.addEventListener('click', () => {
+            const next = level + Number(button.dataset.zoom);
+            if (next >= 0 && next <= dzi.maxLevel) showLevel(next);
+        });
+    });
+    showLevel(level);
+}
+
+document.addEventListener('DOMContentLoaded', async () => {
+    const container = document.getElementById('panoViewer');
+    if (!container) return;
+    try {
+        createViewer(container, await loadDzi(container.dataset.dzi));
+    } catch (error) {
+        container.textContent = error.message;
+    }
+});
@@ -0,0 +1,193 @@
+// Resumable uploads through /uploads/ (tus protocol), for the upload form.
+// Each file is sent in CHUNK_SIZE PATCH requests; after a dropped connection the upload asks the
+// server how far it got and continues from there. Upload URLs are remembered in localStorage,
+// so picking the same files again after a reload resumes them instead of starting over.
+// Files small enough to hash in the browser are first checked against /upload/precheck/, and those
+// the server already has are skipped.
+
+const CHUNK_SIZE = 8 * 1024 * 1024;
+// Files uploaded at the same time
+const PARALLEL_FILES = 3;
+// Seconds to wait before each retry of a failed request; the last one is reused
+const RETRY_DELAYS = [1, 2, 5, 10, 30];
+// Larger files are not hashed here (the browser would have to read them into memory); the server still
+// recognises them once uploaded
+const PRECHECK_MAX_BYTES = 256 * 1024 * 1024;
+const METADATA_FIELDS = ['project_number', 'collection_date', 'crew_initials', 'project_location', 'structure_id'];
+
+function encodeMetadata(metadata) {
+    return Object.entries(metadata)
+        .map(([key, value]) => `${key} ${btoa(String.fromCharCode(...new TextEncoder().encode(value)))}`)
+        .join(',');
+}
+
+function sleep(seconds) {
+    return new Promise(resolve => setTimeout(resolve, seconds * 1000));
+}
+
+async function tusRequest(method, url, headers = {}, body = null) {
+    const response = await fetch(url, { method, body, headers: { 'Tus-Resumable': '1.0.0', ...headers } });
+    if (!response.ok) {
+        const error = new Error(await response.text() || `${method} ${url} failed: ${response.status}`);
+        error.status = response.status;
+        throw error;
+    }
+    return response;
+}
+
+// Retries network failures and server errors; a 4xx answer other than 409/423 is final
+async function withRetries(attempt) {
+    for (let failures = 0; ; failures += 1) {
+        try {
+            return await attempt();
+        } catch (error) {
+            const retryable = !error.status || error.status >= 500 || error.status === 409 || error.status === 423;
+            if (!retryable) throw error;
+            await sleep(RETRY_DELAYS[Math.min(failures, RETRY_DELAYS.length - 1)]);
+        }
+    }
+}
+
+async function uploadFile(file, metadata, onProgress) {
+    const fingerprint = `tus:${JSON.stringify(metadata)}:${file.name}:${file.size}:${file.lastModified}`;
+    let url = localStorage.getItem(fingerprint);
+    let offset = null;
+    if (url) {
+        try {
+            offset = Number((await tusRequest('HEAD', url)).headers.get('Upload-Offset'));
+        } catch (error) {
+            url = null;  // Expired or finished and forgotten; start again
+        }
+    }
+    if (!url) {
+        const response = await withRetries(() => tusRequest('POST', '/uploads/', {
+            'Upload-Length': String(file.size),
+            'Upload-Metadata': encodeMetadata({ ...metadata, filename: file.name }),
+        }));
+        url = response.headers.get('Location');
+        offset = 0;
+        localStorage.setItem(fingerprint, url);
+    }
+    onProgress(offset);
+
+    let fileId = null;
+    while (offset < file.size) {
+        const chunk = file.slice(offset, offset + CHUNK_SIZE);
+        offset = await withRetries(async () => {
+            try {
+                const response = await tusRequest('PATCH', url, {
+                    'Content-Type': 'application/offset+octet-stream',
+                    'Upload-Offset': String(offset),
+                }, chunk);
+                fileId = response.headers.get('Upload-File-Id');
+                return Number(response.headers.get('Upload-Offset'));
+            } catch (error) {
+                // Part of the chunk may have been saved; continue from wherever the server is
+                if (!error.status || error.status === 409) {
+                    const current = Number((await tusRequest('HEAD', url)).headers.get('Upload-Offset'));
+                    if (current !== offset) return current;
+                }
+                throw error;
+            }
+        });
+        onProgress(offset);
+    }
+    // Every byte arriving is not enough: the upload is done once the server has registered the file.
+    // If the answer saying so was lost, or registering failed, HEAD reports or retries it
+    while (!fileId) {
+        fileId = await withRetries(async () => (await tusRequest('HEAD', url)).headers.get('Upload-File-Id'));
+        if (!fileId) await sleep(RETRY_DELAYS[0]);
+    }
+    localStorage.removeItem(fingerprint);
+}
+
+async function sha256Hex(file) {
+    const digest = await crypto.subtle.digest('SHA-256', await file.arrayBuffer());
+    return Array.from(new Uint8Array(digest), byte => byte.toString(16).padStart(2, '0')).join('');
+}
+
+// Asks the server which files it already has; returns a Set of those to skip. Any failure skips nothing.
+async function precheckFiles(files, metadata) {
+    if (!window.crypto || !crypto.subtle) return new Set();  // Only available over HTTPS or on localhost
+    try {
+        const candidates = files.filter(file => file.size <= PRECHECK_MAX_BYTES);
+        const entries = [];
+        for (const file of candidates) {
+            entries.push({ sha256: await sha256Hex(file), filename: file.name, size: file.size });
+        }
+        if (!entries.length) return new Set();
+        const response = await fetch('/upload/precheck/', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ ...metadata, files: entries, link: true }),
+        });
+        if (!response.ok) return new Set();
+        const results = (await response.json()).files;
+        return new Set(candidates.filter((file, index) => results[index].status !== 'missing'));
+    } catch (error) {
+        return new Set();
+    }
+}
+
+function fileRow(list, file) {
+    const row = document.createElement('li');
+    row.className = 'job-progress';
+    row.innerHTML = `
+        <span>${escapeHtml(file.name)}</span>
+        <progress max="${file.size || 1}" value="0"></progress>
+        <span class="job-progress-text">waiting</span>
+    `;
+    list.append(row);
+    return {
+        progress(offset) {
+            row.querySelector('progress').value = offset;
+            row.querySelector('.job-progress-text').textContent = `${formatBytes(offset)} / ${formatBytes(file.size)}`;
+        },
+        finish(error, text = 'done') {
+            row.classList.add(error ? 'job-failed' : 'job-succeeded');
+            if (!file.size || !error) row.querySelector('progress').value = file.size || 1;
+            row.querySelector('.job-progress-text').textContent = error ? `failed: ${error.message}` : text;
+        },
+    };
+}
+
+async function submitResumableUpload(form) {
+    const button = form.querySelector('[type="submit"]');
+    const metadata = Object.fromEntries(METADATA_FIELDS.map(name => [name, form.elements[name].value.trim()]));
+    const files = Array.from(form.elements.files.files);
+    const list = form.parentElement.querySelector('.upload-progress');
+    list.innerHTML = '';
+    button.disabled = true;
+
+    const rows = new Map(files.map(file => [file, fileRow(list, file)]));
+    const known = await precheckFiles(files, metadata);
+    known.forEach(file => rows.get(file).finish(null, 'already on the server'));
+    const queue = files.filter(file => !known.has(file)).map(file => ({ file, row: rows.get(file) }));
+    let failed = 0;
+    async function worker() {
+        for (let item = queue.shift(); item; item = queue.shift()) {
+            try {
+                await uploadFile(item.file, metadata, offset => item.row.progress(offset));
+                item.row.finish();
+            } catch (error) {
+                failed += 1;
+                item.row.finish(error);
+            }
+        }
+    }
+    await Promise.all(Array.from({ length: Math.min(PARALLEL_FILES, queue.length) }, worker));
+
+    button.disabled = false;
+    const summary = document.createElement('li');
+    summary.innerHTML = failed
+        ? `${failed} of ${files.length} files failed. Submit again to retry them.`
+        : `Uploaded ${files.length} files. <a href="/data_dump/">Open Data Dump</a>`;
+    list.append(summary);
+}
+
+document.addEventListener('submit', event => {
+    const form = event.target.closest('form.resumable-upload-form');
+    if (!form || !window.fetch || !window.localStorage) return;
+    event.preventDefault();
+    submitResumableUpload(form);
+});
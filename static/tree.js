@@ -0,0 +1,129 @@
+// Lazy browsing of the stage folders through the paginated /api/tree/ endpoints.
+// Only the level a user opens is fetched, so page cost does not grow with the archive.
+
+function escapeHtml(text) {
+    return String(text)
+        .replaceAll('&', '&amp;')
+        .replaceAll('<', '&lt;')
+        .replaceAll('>', '&gt;')
+        .replaceAll('"', '&quot;')
+        .replaceAll("'", '&#39;');
+}
+
+function encodePath(path) {
+    return path.split('/').map(encodeURIComponent).join('/');
+}
+
+async function fetchTreePage(path, cursor, query) {
+    const params = new URLSearchParams();
+    if (cursor) params.set('cursor', cursor);
+    if (query) params.set('q', query);
+    const response = await fetch(`/api/tree/${encodePath(path)}?${params}`);
+    if (!response.ok) {
+        throw new Error(`Failed to load ${path}: ${response.status}`);
+    }
+    return response.json();
+}
+
+// Files the /thumb/ endpoint can preview
+const THUMB_SUFFIXES = ['.png', '.jpg', '.jpeg', '.webp', '.tif', '.tiff', '.bmp'];
+
+function isImage(name) {
+    const lower = name.toLowerCase();
+    return THUMB_SUFFIXES.some(suffix => lower.endsWith(suffix));
+}
+
+function renderTreeItem(item) {
+    const li = document.createElement('li');
+    if (item.type === 'dir') {
+        li.innerHTML = `
+            <details class="tree-node" data-path="${escapeHtml(item.path)}">
+                <summary>${escapeHtml(item.name)} <small>(${item.dirs} folders, ${item.files} files)</small></summary>
+                <ul class="tree-children"></ul>
+            </details>`;
+    } else if (isImage(item.name)) {
+        li.className = 'thumb';
+        // Processed panoramas open in the tiled viewer instead of downloading the full image
+        const href = item.path.startsWith('04_Processed/') ? `/pano/${encodePath(item.path)}` : `/data/${encodePath(item.path)}`;
+        li.innerHTML = `
+            <a href="${href}" target="_blank">
+                <img src="/thumb/${encodePath(item.path)}?w=160" alt="${escapeHtml(item.name)}" loading="lazy">
+                <span>${escapeHtml(item.name)}</span>
+            </a>`;
+    } else {
+        li.innerHTML = `<a href="/data/${encodePath(item.path)}" target="_blank">${escapeHtml(item.name)}</a>`;
+    }
+    return li;
+}
+
+// Append the next page of a directory's children to `list`
+async function loadTreeChildren(list, path) {
+    const more = list.querySelector(':scope > .tree-more');
+    if (more) more.remove();
+    try {
+        const page = await fetchTreePage(path, list.dataset.cursor);
+        page.items.forEach(item => list.appendChild(renderTreeItem(item)));
+        if (!list.children.length) {
+            list.innerHTML = '<li>No files in this directory.</li>';
+        }
+        if (page.next_cursor) {
+            list.dataset.cursor = page.next_cursor;
+            const li = document.createElement('li');
+            li.className = 'tree-more';
+            li.innerHTML = `<button type="button">Load more (${page.dirs_total} folders, ${page.files_total} files in total)</button>`;
+            li.querySelector('button').addEventListener('click', () => loadTreeChildren(list, path));
+            list.appendChild(li);
+        }
+    } catch (error) {
+        list.insertAdjacentHTML('beforeend', `<li>${escapeHtml(error.message)}</li>`);
+    }
+}
+
+// Expand any <details class="tree-node" data-path="..."> the first time it is opened
+document.addEventListener('toggle', event => {
+    const node = event.target;
+    if (!node.matches || !node.matches('details.tree-node') || !node.open || node.dataset.loaded) {
+        return;
+    }
+    node.dataset.loaded = '1';
+    loadTreeChildren(node.querySelector(':scope > .tree-children'), node.dataset.path);
+}, true);
+
+// Paged project lists on the step pages. A list looks like
+// <ul class="paged-list" data-path="02_Archive" data-cursor="..." data-template="project-template">
+// and new rows are cloned from the <template>, replacing __NAME__ and __PATH__.
+async function loadProjects(list, reset) {
+    const more = document.querySelector(`button.load-more[data-list="${list.id}"]`);
+    if (reset) {
+        list.innerHTML = '';
+        list.dataset.cursor = '';
+    }
+    const page = await fetchTreePage(list.dataset.path, list.dataset.cursor, list.dataset.query);
+    const template = document.getElementById(list.dataset.template).innerHTML;
+    page.items.filter(item => item.type === 'dir').forEach(item => {
+        list.insertAdjacentHTML('beforeend', template
+            .replaceAll('__NAME__', escapeHtml(item.name))
+            .replaceAll('__PATH__', escapeHtml(item.path)));
+    });
+    list.dataset.cursor = page.next_cursor || '';
+    if (more) more.hidden = !page.next_cursor;
+}
+
+document.addEventListener('DOMContentLoaded', () => {
+    document.querySelectorAll('button.load-more').forEach(button => {
+        button.addEventListener('click', () => loadProjects(document.getElementById(button.dataset.list), false));
+    });
+
+    // Search filters on the server so it covers projects that are not loaded yet
+    document.querySelectorAll('input.tree-search').forEach(input => {
+        let timer = null;
+        input.addEventListener('input', () => {
+            clearTimeout(timer);
+            timer = setTimeout(() => {
+                const list = document.getElementById(input.dataset.list);
+                list.dataset.query = input.value.trim();
+                loadProjects(list, true);
+            }, 250);
+        });
+    });
+});
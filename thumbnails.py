@@ -0,0 +1,165 @@
+import logging
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+
+from PIL import Image, ImageOps, features
+
+from config import THUMB_CACHE_DIR, THUMB_CACHE_MAX_MB, THUMB_WIDTHS, THUMB_QUALITY, THUMB_WORKERS
+from hash_index import content_hash
+
+logger = logging.getLogger(__name__)
+
+THUMB_SUFFIXES = {".png", ".jpg", ".jpeg", ".webp", ".tif", ".tiff", ".bmp"}
+WEBP_AVAILABLE = features.check("webp")
+MEDIA_TYPES = {"jpeg": "image/jpeg", "webp": "image/webp"}
+
+
+def thumb_width(requested):
+    """Round a requested width up to the nearest allowed one, so the cache holds few variants."""
+    for width in THUMB_WIDTHS:
+        if requested <= width:
+            return width
+    return THUMB_WIDTHS[-1]
+
+
+def render_thumbnail(source: Path, destination: Path, width, fmt):
+    """Write a thumbnail of source at most width pixels across (and high) to destination."""
+    with Image.open(source) as img:
+        if img.format == "JPEG":
+            # Let the decoder skip straight to 1/2..1/8 scale instead of decoding every pixel
+            img.draft("RGB", (width, width))
+        img = ImageOps.exif_transpose(img)
+        img.thumbnail((width, width), Image.LANCZOS, reducing_gap=2.0)
+        if fmt == "jpeg" and img.mode not in ("RGB", "L"):
+            img = img.convert("RGB")
+        elif fmt == "webp" and img.mode not in ("RGB", "RGBA"):
+            img = img.convert("RGBA" if "A" in img.getbands() else "RGB")
+        fd, temp_name = tempfile.mkstemp(dir=destination.parent, prefix=".thumb.", suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                img.save(f, format=fmt.upper(), quality=THUMB_QUALITY)
+            os.replace(temp_name, destination)
+        except BaseException:
+            os.unlink(temp_name)
+            raise
+
+
+class ThumbnailCache:
+    """
+    Resized copies of stage images, cached on disk under data/.thumbs.
+
+    Entries are keyed by the source's content hash, width and format, so the
+    same photo in Archive and Processing shares one thumbnail and an edited
+    photo gets a new one. The total size is capped; the least recently used
+    entries are evicted first. Recency is kept in memory and mirrored in each
+    file's mtime, so the order survives a restart.
+
+    Thumbnails are generated on a small thread pool, and concurrent requests
+    for the same thumbnail wait for a single render.
+    """
+
+    def __init__(self, cache_dir=THUMB_CACHE_DIR, max_bytes=THUMB_CACHE_MAX_MB * 1024 * 1024,
+                 workers=THUMB_WORKERS):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self.workers = workers
+        self._entries = OrderedDict()  # path -> size, least recently used first
+        self._total_bytes = 0
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def load(self):
+        """Index the thumbnails already on disk, oldest first."""
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        found = []
+        for path in self.cache_dir.glob("*/*"):
+            if path.name.startswith("."):
+                continue
+            st = path.stat()
+            found.append((st.st_mtime, path, st.st_size))
+        found.sort()
+        with self._lock:
+            self._entries = OrderedDict((path, size) for _, path, size in found)
+            self._total_bytes = sum(size for _, _, size in found)
+        self._evict()
+        logger.info("Thumbnail cache: %d thumbnails, %d bytes", len(self._entries), self._total_bytes)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def cache_path(self, sha256, width, fmt):
+        extension = "jpg" if fmt == "jpeg" else fmt
+        return self.cache_dir / sha256[:2] / f"{sha256}_{width}.{extension}"
+
+    def submit(self, source: Path, width, fmt):
+        """Return a Future resolving to the cached thumbnail's path, rendering it on the pool if needed."""
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="thumb")
+        return self._executor.submit(self.get, source, thumb_width(width), fmt)
+
+    def get(self, source: Path, width, fmt):
+        """Return the path of source's thumbnail, rendering it if it is not cached."""
+        target = self.cache_path(content_hash(source), width, fmt)
+        with self._lock:
+            if target in self._entries:
+                self._entries.move_to_end(target)
+                hit = True
+            else:
+                hit = False
+                future = self._pending.get(target)
+                owner = future is None
+                if owner:
+                    future = self._pending[target] = Future()
+        if hit:
+            try:
+                os.utime(target)
+                return target
+            except FileNotFoundError:
+                self._forget(target)
+                return self.get(source, width, fmt)
+        if not owner:
+            return future.result()
+
+        try:
+            target.parent.mkdir(parents=True, exist_ok=True)
+            render_thumbnail(source, target, width, fmt)
+            self._add(target, target.stat().st_size)
+            future.set_result(target)
+            return target
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._pending.pop(target, None)
+
+    def _add(self, path, size):
+        with self._lock:
+            self._total_bytes += size - self._entries.pop(path, 0)
+            self._entries[path] = size
+        self._evict()
+
+    def _forget(self, path):
+        with self._lock:
+            self._total_bytes -= self._entries.pop(path, 0)
+
+    def _evict(self):
+        while True:
+            with self._lock:
+                if self._total_bytes <= self.max_bytes or len(self._entries) <= 1:
+                    return
+                path, size = self._entries.popitem(last=False)
+                self._total_bytes -= size
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass